@@ -0,0 +1,109 @@
+# atomic_io.py
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.RLock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """
+    Advisory lock on path + ".lock". Writers take it exclusive, readers shared,
+    so a reader never opens a directory that is halfway through being swapped.
+    flock covers other processes; the thread lock covers this one.
+    """
+    lock_path = f"{os.path.abspath(path)}.lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    thread_lock = None if shared else _thread_lock(path)
+    if thread_lock is not None:
+        thread_lock.acquire()
+    try:
+        with open(lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        if thread_lock is not None:
+            thread_lock.release()
+
+
+def atomic_write_json(path: str, data: Any, **dump_kwargs):
+    """Write JSON to a temp file in the same directory, then os.replace it into place"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Like atomic_write_json for raw bytes; concurrent writers of the same content are harmless"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def replace_directory(target_dir: str, write_fn: Callable[[str], None]):
+    """
+    Build a directory with write_fn(tmp_dir) next to target_dir, then swap it
+    in under the exclusive lock. Readers holding the shared lock see either
+    the old directory or the new one, never a partial write.
+    """
+    target_dir = os.path.abspath(target_dir)
+    parent = os.path.dirname(target_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(target_dir)}.tmp-", dir=parent)
+    try:
+        write_fn(tmp_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    old_dir = f"{tmp_dir}.old"
+    with file_lock(target_dir):
+        if os.path.exists(target_dir):
+            os.rename(target_dir, old_dir)
+        os.rename(tmp_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"✓ Swapped in new {os.path.basename(target_dir)}")
@@ -0,0 +1,382 @@
+# attachments.py
+"""
+Attachment text extraction.
+
+The fetch loop only stores each supported attachment once, content-addressed by
+sha256 under <data_dir>/attachments/blobs/, and hands it to a process pool.
+Workers write the extracted text to <data_dir>/attachments/text/<sha256>.txt,
+so every tenant keeps its own attachments next to its emails, and identical
+attachments (the same invoice forwarded five times) are extracted once and the
+text survives restarts. Email dicts carry an "attachments" list of
+{filename, content_type, sha256, size}; the vectorstore indexes the cached text
+under the parent email's email_hash.
+"""
+import os
+import re
+import time
+import logging
+import hashlib
+import threading
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+from xml.etree import ElementTree
+
+from atomic_io import atomic_write_bytes
+from html_cleaning import html_to_text
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_SUBDIR = "attachments"
+ATTACHMENT_WORKERS = int(os.getenv("EMAIL_RAG_ATTACHMENT_WORKERS", "2"))
+MAX_ATTACHMENT_BYTES = int(os.getenv("EMAIL_RAG_MAX_ATTACHMENT_MB", "25")) * 1024 * 1024
+MAX_ATTACHMENT_CHARS = 50000  # long reports are truncated rather than flooding the index
+# A fetch saves blobs before its day file lists them; retention leaves fresh ones alone
+RETAIN_GRACE_S = 3600
+
+EXTENSIONS = {
+    ".pdf": "pdf",
+    ".docx": "docx",
+    ".ics": "ics",
+    ".txt": "text",
+    ".csv": "text",
+    ".md": "text",
+    ".html": "html",
+    ".htm": "html",
+}
+CONTENT_TYPES = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "text/calendar": "ics",
+    "application/ics": "ics",
+    "text/csv": "text",
+}
+ICS_FIELDS = {
+    "SUMMARY": "Title",
+    "DTSTART": "Starts",
+    "DTEND": "Ends",
+    "LOCATION": "Location",
+    "ORGANIZER": "Organizer",
+    "ATTENDEE": "Attendees",
+    "URL": "Link",
+    "DESCRIPTION": "Description",
+}
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+def attachment_dir(data_dir: str) -> str:
+    return os.path.join(data_dir, ATTACHMENT_SUBDIR)
+
+
+def attachment_kind(content_type: str, filename: str) -> Optional[str]:
+    """Extractor for an attachment, or None for types we don't index (images, archives...)"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    return EXTENSIONS.get(ext) or CONTENT_TYPES.get((content_type or "").lower())
+
+
+def save_attachments(msg, base_dir: str) -> List[Dict[str, Any]]:
+    """
+    Store the supported attachments of an email.message.Message and return their
+    metadata. Blobs already on disk (same content seen before) are not rewritten.
+    """
+    saved = []
+    if not msg.is_multipart():
+        return saved
+    blob_dir = os.path.join(base_dir, "blobs")
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        filename = part.get_filename() or ""
+        content_type = part.get_content_type()
+        is_attachment = "attachment" in str(part.get("Content-Disposition") or "") or filename
+        # Calendar invites often arrive as an inline text/calendar part without a filename
+        if not is_attachment and content_type != "text/calendar":
+            continue
+        kind = attachment_kind(content_type, filename)
+        if kind is None:
+            continue
+        payload = part.get_payload(decode=True)
+        if not payload or len(payload) > MAX_ATTACHMENT_BYTES:
+            continue
+
+        sha = hashlib.sha256(payload).hexdigest()
+        blob_path = os.path.join(blob_dir, sha)
+        if os.path.exists(blob_path):
+            os.utime(blob_path)  # referenced again: keep it out of retention's grace window
+        else:
+            atomic_write_bytes(blob_path, payload)
+        saved.append({
+            "filename": filename or ("invite.ics" if kind == "ics" else f"attachment.{kind}"),
+            "content_type": content_type,
+            "sha256": sha,
+            "size": len(payload),
+        })
+    return saved
+
+
+def _pdf_text(path: str) -> str:
+    from pypdf import PdfReader
+
+    parts = []
+    for page in PdfReader(path).pages:
+        parts.append(page.extract_text() or "")
+        # Link targets live in annotations, not in the page text
+        for annot in page.get("/Annots") or []:
+            action = annot.get_object().get("/A") or {}
+            uri = action.get("/URI")
+            if uri:
+                parts.append(str(uri))
+    return "\n\n".join(p for p in parts if p.strip())
+
+
+def _docx_text(path: str) -> str:
+    with zipfile.ZipFile(path) as z:
+        root = ElementTree.fromstring(z.read("word/document.xml"))
+        links = {}
+        if "word/_rels/document.xml.rels" in z.namelist():
+            rels = ElementTree.fromstring(z.read("word/_rels/document.xml.rels"))
+            links = {r.get("Id"): r.get("Target") for r in rels if r.get("TargetMode") == "External"}
+
+    paragraphs = []
+    for p in root.iter(f"{WORD_NS}p"):
+        parts = []
+        for child in p:
+            text = _docx_run_text(child)
+            target = links.get(child.get(f"{REL_NS}id")) if child.tag == f"{WORD_NS}hyperlink" else None
+            # Keep link targets next to their anchor text: "invoice portal (https://...)"
+            parts.append(f"{text} ({target})" if target else text)
+        line = "".join(parts).strip()
+        if line:
+            paragraphs.append(line)
+    return "\n\n".join(paragraphs)
+
+
+def _docx_run_text(element) -> str:
+    text = []
+    for node in element.iter():
+        if node.tag == f"{WORD_NS}t" and node.text:
+            text.append(node.text)
+        elif node.tag in (f"{WORD_NS}tab", f"{WORD_NS}br"):
+            text.append(" ")
+    return "".join(text)
+
+
+def _ics_text(path: str) -> str:
+    with open(path, "rb") as f:
+        raw = f.read().decode("utf-8", errors="ignore")
+    # RFC 5545 folds long lines; a continuation line starts with a space or tab
+    lines = re.sub(r"\r?\n[ \t]", "", raw).splitlines()
+
+    events, current = [], None
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            current = {}
+        elif line == "END:VEVENT" and current is not None:
+            events.append(current)
+            current = None
+        elif current is not None and ":" in line:
+            name, value = line.split(":", 1)
+            name = name.split(";", 1)[0].upper()
+            if name in ICS_FIELDS:
+                value = value.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",").replace("\\;", ";")
+                current.setdefault(name, []).append(value.replace("mailto:", ""))
+
+    blocks = []
+    for event in events:
+        rendered = [f"{label}: {', '.join(event[name])}" for name, label in ICS_FIELDS.items() if name in event]
+        blocks.append("Calendar event\n" + "\n".join(rendered))
+    return "\n\n".join(blocks)
+
+
+def _plain_text(path: str) -> str:
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", errors="ignore")
+
+
+def _html_text(path: str) -> str:
+    return html_to_text(_plain_text(path))
+
+
+EXTRACTORS = {
+    "pdf": _pdf_text,
+    "docx": _docx_text,
+    "ics": _ics_text,
+    "text": _plain_text,
+    "html": _html_text,
+}
+
+
+def extract_to_cache(blob_path: str, text_path: str, kind: str) -> int:
+    """Worker entry point: extract one blob and write its text file; returns the text length"""
+    text = EXTRACTORS[kind](blob_path).strip()[:MAX_ATTACHMENT_CHARS]
+    atomic_write_bytes(text_path, text.encode("utf-8"))
+    return len(text)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def start_pool() -> ProcessPoolExecutor:
+    """
+    The worker pool every tenant's extractor submits to. Workers are spawned,
+    not forked: the first submit happens inside a server that already runs
+    request threads, and a forked child would inherit whatever locks they held.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=ATTACHMENT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool(pool: Optional[ProcessPoolExecutor] = None):
+    """Shut the shared pool down (only if it is still `pool`, when given); the next submit starts a new one"""
+    global _pool
+    with _pool_lock:
+        if pool is not None and pool is not _pool:
+            return
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AttachmentExtractor:
+    """
+    Background extraction of one data_dir's saved attachments on the shared pool.
+
+    submit() never blocks: blobs whose text is cached or already in flight are
+    skipped, which also deduplicates identical attachments across emails.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.blob_dir = os.path.join(base_dir, "blobs")
+        self.text_dir = os.path.join(base_dir, "text")
+        self._futures = {}
+        self._failed = set()
+        self._lock = threading.Lock()
+
+    def _text_path(self, sha: str) -> str:
+        return os.path.join(self.text_dir, f"{sha}.txt")
+
+    def text(self, sha: str) -> Optional[str]:
+        """Cached text of an attachment, or None while it is not (yet) extracted"""
+        try:
+            with open(self._text_path(sha), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def submit(self, attachment: Dict[str, Any]) -> bool:
+        """Queue extraction of one attachment; False if there is nothing to do"""
+        sha = attachment["sha256"]
+        kind = attachment_kind(attachment.get("content_type", ""), attachment.get("filename", ""))
+        blob_path = os.path.join(self.blob_dir, sha)
+        if kind is None or not os.path.exists(blob_path):
+            return False
+        if os.path.exists(self._text_path(sha)):
+            METRICS.cache_hit("attachment_text")
+            return False
+
+        with self._lock:
+            if sha in self._futures or sha in self._failed:
+                return False
+            os.makedirs(self.text_dir, exist_ok=True)
+            METRICS.cache_hit("attachment_text", hit=False)
+            pool = start_pool()
+            future = pool.submit(extract_to_cache, blob_path, self._text_path(sha), kind)
+            self._futures[sha] = future
+        future.add_done_callback(
+            lambda f, sha=sha, name=attachment.get("filename", sha): self._done(sha, name, f, pool)
+        )
+        return True
+
+    def _done(self, sha: str, filename: str, future, pool: ProcessPoolExecutor):
+        if future.cancelled():
+            with self._lock:
+                self._futures.pop(sha, None)
+            return  # pool shut down; extracted again by the next submit_missing()
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # Shut down, or a worker died and took the whole pool with it: not this attachment's fault
+            with self._lock:
+                self._futures.pop(sha, None)
+            shutdown_pool(pool)
+            logger.warning(f"Attachment extraction of {filename} interrupted: {error}")
+            return
+        with self._lock:
+            self._futures.pop(sha, None)
+            if error is not None:
+                self._failed.add(sha)  # not retried until restart
+        if error is not None:
+            METRICS.inc("email_rag_attachment_extractions_total", status="error")
+            logger.warning(f"Attachment extraction failed for {filename}: {error}")
+        else:
+            METRICS.inc("email_rag_attachment_extractions_total", status="ok")
+            logger.info(f"📎 Extracted {future.result()} chars from {filename}")
+
+    def submit_missing(self, emails: List[Dict[str, Any]]) -> int:
+        """Queue every attachment of these emails that has no cached text yet"""
+        return sum(self.submit(a) for email in emails for a in email.get("attachments", []))
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the queued extractions finish; True if none are left"""
+        with self._lock:
+            futures = list(self._futures.values())
+        wait_futures(futures, timeout=timeout)
+        return self.pending == 0
+
+    def retain(self, shas: set) -> int:
+        """Delete blobs and extracted text of attachments no retained email references"""
+        cutoff = time.time() - RETAIN_GRACE_S
+        removed = 0
+        for directory, suffix in ((self.blob_dir, ""), (self.text_dir, ".txt")):
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                sha = name[:-len(suffix)] if suffix and name.endswith(suffix) else name
+                path = os.path.join(directory, name)
+                with self._lock:
+                    if sha in shas or sha in self._futures:
+                        continue
+                    self._failed.discard(sha)
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info(f"🧹 Attachments {self.base_dir}: removed {removed} unreferenced files")
+        return removed
+
+    def shutdown(self):
+        """Cancel this extractor's queued extractions; the shared pool keeps running"""
+        with self._lock:
+            futures = list(self._futures.values())
+        for future in futures:
+            future.cancel()
+
+
+_extractors: Dict[str, AttachmentExtractor] = {}
+_extractor_lock = threading.Lock()
+
+
+def get_extractor(data_dir: str = "data") -> AttachmentExtractor:
+    """The extractor for data_dir's attachments, shared by that tenant's fetch loop and chain"""
+    base_dir = os.path.abspath(attachment_dir(data_dir))
+    with _extractor_lock:
+        if base_dir not in _extractors:
+            _extractors[base_dir] = AttachmentExtractor(base_dir)
+        return _extractors[base_dir]
@@ -0,0 +1,89 @@
+# benchmarks/bench_html_cleaning.py
+"""
+Messages/sec of each HTML-to-text backend over a corpus of real newsletter HTML.
+
+Usage:
+    python benchmarks/bench_html_cleaning.py path/to/corpus --repeat 3
+
+The corpus directory may contain .html/.htm files or raw .eml messages
+(the text/html part is used). Results are printed as one JSON object per backend.
+"""
+import argparse
+import email
+import importlib.util
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from html_cleaning import html_to_text  # noqa: E402
+
+
+def _available_backends():
+    backends = ["html.parser"]
+    if importlib.util.find_spec("lxml"):
+        backends.append("lxml")
+    if importlib.util.find_spec("selectolax"):
+        backends.append("selectolax")
+    return backends
+
+
+def load_corpus(path):
+    documents = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            if name.endswith((".html", ".htm")):
+                with open(full, "r", encoding="utf-8", errors="ignore") as f:
+                    documents.append(f.read())
+            elif name.endswith(".eml"):
+                with open(full, "rb") as f:
+                    msg = email.message_from_bytes(f.read())
+                for part in msg.walk():
+                    if part.get_content_type() == "text/html":
+                        payload = part.get_payload(decode=True)
+                        if payload:
+                            charset = part.get_content_charset() or "utf-8"
+                            documents.append(payload.decode(charset, errors="ignore"))
+                        break
+    return documents
+
+
+def bench(documents, backend, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc in documents:
+            html_to_text(doc, backend=backend)
+        best = min(best, time.perf_counter() - start)
+    total_bytes = sum(len(doc.encode("utf-8")) for doc in documents)
+    return {
+        "benchmark": "html_cleaning",
+        "backend": backend,
+        "messages": len(documents),
+        "seconds": round(best, 4),
+        "messages_per_sec": round(len(documents) / best, 1) if best else None,
+        "mb_per_sec": round(total_bytes / best / 1e6, 2) if best else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", help="Directory of .html/.htm/.eml newsletter samples")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per backend; the best one is reported")
+    parser.add_argument("--backend", action="append", help="Backend(s) to run (default: all installed)")
+    args = parser.parse_args()
+
+    documents = load_corpus(args.corpus)
+    if not documents:
+        print(f"No HTML documents found under {args.corpus}", file=sys.stderr)
+        sys.exit(1)
+
+    for backend in args.backend or _available_backends():
+        print(json.dumps(bench(documents, backend, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_import_time.py
+"""
+Import-time profile for the server modules and the pipeline's heavy dependencies.
+
+Runs each import in a fresh interpreter with `python -X importtime`, then reports
+wall time and the slowest modules by cumulative import time, as JSON lines.
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --modules server2,email_chain --top 15
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+DEFAULT_MODULES = "server,server2,email_chain,fetch_emails,vectorstore,chat"
+# "import time: self [us] | cumulative | imported package"
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_import(module, top):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            rows.append({"module": name, "depth": len(indent) // 2,
+                         "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+
+    total = next((r["cumulative_ms"] for r in reversed(rows) if r["module"] == module), None)
+    # Top-level packages only, so langchain doesn't appear once per submodule
+    top_level = sorted((r for r in rows if r["depth"] == 0), key=lambda r: r["cumulative_ms"], reverse=True)
+    return {
+        "benchmark": "import_time",
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "interpreter_wall_ms": round(wall_ms, 1),
+        "import_ms": total,
+        "slowest": [
+            {"module": r["module"], "cumulative_ms": round(r["cumulative_ms"], 1)}
+            for r in top_level[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", default=DEFAULT_MODULES, help="Comma-separated modules to import")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list")
+    args = parser.parse_args()
+
+    for module in args.modules.split(","):
+        print(json.dumps(profile_import(module.strip(), args.top)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end pipeline benchmark against a local fake IMAP server and stub model backends.
+
+Times every stage (fetch, parse, clean, dedupe, chunk, embed, index, retrieve,
+prompt assembly, generation, full chain) for each mailbox size and prints
+one JSON object per size, so results can be diffed across releases.
+
+    python benchmarks/bench_pipeline.py --sizes 100,1000,10000 --output bench.json
+    python benchmarks/bench_pipeline.py --sizes 1000 --llm-latency-ms 200 --prefill-ms-per-token 0.5
+
+With --rerank, every question is also answered through the cross-encoder
+reranker (a stub with --rerank-ms-per-pair latency), and the result reports
+prompt tokens, generation time and full-chain latency with and without it,
+so the prefill saved is measured net of the reranking time spent.
+"""
+import argparse
+import datetime
+import imaplib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from fake_imap import start_fake_imap  # noqa: E402
+from stubs import FakeLLM, FakeEmbeddings, FakeCrossEncoder  # noqa: E402
+
+QUESTIONS = [
+    "What did Alice say about the budget?",
+    "Is there an invoice or payment deadline?",
+    "Give me the link to the roadmap document",
+    "Any updates on the release schedule?",
+    "What did the CI bot report about the build?",
+]
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.stages[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def _download(port):
+    imap = imaplib.IMAP4("127.0.0.1", port)
+    imap.login("bench", "bench")
+    imap.select("INBOX")
+    date_str = datetime.date.today().strftime("%d-%b-%Y")
+    _, data = imap.search(None, f'(SINCE "{date_str}")')
+    raws = []
+    for num in data[0].split():
+        _, msg_data = imap.fetch(num, "(RFC822)")
+        raws.append((num, msg_data[0][1]))
+    imap.close()
+    imap.logout()
+    return raws
+
+
+def bench_size(size, args):
+    server = start_fake_imap(size, seed=args.seed)
+
+    import fetch_emails
+    from html_cleaning import clean_text
+    from langchain_community.vectorstores import FAISS
+    from email_chain import EmailRAGConfig, EmailRAGSequentialChain, EmailProcessor, ANSWER_GENERATION_TEMPLATE
+
+    # fetch_emails reads its connection settings at import time, so point it at the fake server directly
+    fetch_emails.IMAP_SERVER = "127.0.0.1"
+    fetch_emails.IMAP_PORT = server.port
+    fetch_emails.IMAP_SSL = False
+    fetch_emails.EMAIL_USER = fetch_emails.EMAIL_PASS = "bench"
+
+    workdir = tempfile.mkdtemp(prefix="email_rag_bench_")
+    os.chdir(workdir)
+
+    llm = FakeLLM(
+        latency_ms=args.llm_latency_ms,
+        prefill_ms_per_token=args.prefill_ms_per_token,
+        decode_ms_per_token=args.decode_ms_per_token,
+    )
+    embeddings = FakeEmbeddings(latency_ms_per_text=args.embed_latency_ms)
+    config = EmailRAGConfig(
+        persist_dir=os.path.join(workdir, "faiss_index"),
+        data_dir=os.path.join(workdir, "data"),
+    )
+    chain = EmailRAGSequentialChain(llm=llm, embeddings=embeddings, config=config)
+    manager = chain.vectorstore_manager
+    reranker = None
+    if args.rerank:
+        from reranker import CrossEncoderReranker
+        reranker = CrossEncoderReranker(
+            top_n=config.rerank_top_n,
+            batch_size=config.rerank_batch_size,
+            budget_ms=args.rerank_budget_ms,
+            model=FakeCrossEncoder(ms_per_pair=args.rerank_ms_per_pair, call_ms=args.rerank_call_ms),
+        )
+
+    timer = StageTimer()
+    raws = timer.run("fetch", _download, server.port)
+    emails = timer.run("parse", lambda: [fetch_emails.parse_message(uid, raw, clean=False) for uid, raw in raws])
+
+    def clean_all():
+        for e in emails:
+            e["clean_body"] = clean_text(e.get("body", ""))
+    timer.run("clean", clean_all)
+
+    for e in emails:
+        e["date"] = EmailProcessor.normalize_date(e.get("date", ""))
+    today = datetime.date.today().isoformat()
+    timer.run("dedupe_thread_digest", chain._set_emails, emails, today)
+
+    docs = timer.run("chunk", manager._prepare_documents, chain.indexed_emails)
+    texts = [d.page_content for d in docs]
+    vectors = timer.run("embed", embeddings.embed_documents, texts)
+    vectorstore = timer.run(
+        "index",
+        FAISS.from_embeddings,
+        list(zip(texts, vectors)),
+        embeddings,
+        metadatas=[d.metadata for d in docs],
+    )
+    manager.vectorstore = vectorstore
+
+    retrieve_ms, prompt_ms, generate_ms, prompt_tokens = [], [], [], []
+    rerank_ms, rerank_generate_ms, rerank_prompt_tokens = [], [], []
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        hits = chain._collapse_to_threads(chain._deduplicate_documents(
+            vectorstore.similarity_search(question, k=config.k_value), merge_chunks=True
+        ))
+        retrieve_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        prompt = ANSWER_GENERATION_TEMPLATE.format(
+            original_question=question,
+            resolved_question=question,
+            emails_retrieved=len(hits),
+            scope_used="RELEVANT",
+            email_context=chain._build_email_context(hits),
+        )
+        prompt_ms.append((time.perf_counter() - start) * 1000)
+        prompt_tokens.append(len(prompt) // 4)
+
+        start = time.perf_counter()
+        llm.invoke(prompt)
+        generate_ms.append((time.perf_counter() - start) * 1000)
+
+        if reranker is not None:
+            start = time.perf_counter()
+            kept, _ = reranker.rerank(question, hits)
+            rerank_ms.append((time.perf_counter() - start) * 1000)
+            prompt = ANSWER_GENERATION_TEMPLATE.format(
+                original_question=question,
+                resolved_question=question,
+                emails_retrieved=len(kept),
+                scope_used="RELEVANT",
+                email_context=chain._build_email_context(kept),
+            )
+            rerank_prompt_tokens.append(len(prompt) // 4)
+            start = time.perf_counter()
+            llm.invoke(prompt)
+            rerank_generate_ms.append((time.perf_counter() - start) * 1000)
+
+    timer.stages["retrieve_ms"] = round(statistics.mean(retrieve_ms), 2)
+    timer.stages["prompt_assembly_ms"] = round(statistics.mean(prompt_ms), 2)
+    timer.stages["generation_ms"] = round(statistics.mean(generate_ms), 2)
+
+    # Full chain per question: context resolution + analysis + retrieval + answer
+    chain_ms = []
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        chain({"question": question})
+        chain_ms.append((time.perf_counter() - start) * 1000)
+    timer.stages["chain_p50_ms"] = round(statistics.median(chain_ms), 2)
+    timer.stages["chain_max_ms"] = round(max(chain_ms), 2)
+
+    rerank = None
+    if reranker is not None:
+        chain.reranker = reranker
+        rerank_chain_ms = []
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            chain({"question": question})
+            rerank_chain_ms.append((time.perf_counter() - start) * 1000)
+        before_ms, after_ms = statistics.mean(generate_ms), statistics.mean(rerank_generate_ms)
+        rerank = {
+            "budget_ms": args.rerank_budget_ms,
+            "ms_per_pair": args.rerank_ms_per_pair,
+            "rerank_ms": round(statistics.mean(rerank_ms), 2),
+            "prompt_tokens_before": round(statistics.mean(prompt_tokens), 1),
+            "prompt_tokens_after": round(statistics.mean(rerank_prompt_tokens), 1),
+            "generation_ms_before": round(before_ms, 2),
+            "generation_ms_after": round(after_ms, 2),
+            # What the smaller prompt saved once the reranking itself is paid for
+            "net_saved_ms": round(before_ms - after_ms - statistics.mean(rerank_ms), 2),
+            "chain_p50_ms_before": timer.stages["chain_p50_ms"],
+            "chain_p50_ms_after": round(statistics.median(rerank_chain_ms), 2),
+        }
+
+    server.shutdown()
+    server.server_close()
+
+    return {
+        "benchmark": "pipeline",
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "messages": size,
+        "indexed_emails": len(chain.indexed_emails),
+        "chunks": len(docs),
+        "avg_prompt_tokens": round(statistics.mean(prompt_tokens), 1),
+        "llm": {
+            "latency_ms": args.llm_latency_ms,
+            "prefill_ms_per_token": args.prefill_ms_per_token,
+            "decode_ms_per_token": args.decode_ms_per_token,
+        },
+        "stages": timer.stages,
+        "rerank": rerank,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated mailbox sizes (up to 100000)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.0)
+    parser.add_argument("--decode-ms-per-token", type=float, default=0.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Per text embedded")
+    parser.add_argument("--rerank", action="store_true", help="Also measure answers through the reranker")
+    parser.add_argument("--rerank-ms-per-pair", type=float, default=2.0, help="Stub cross-encoder cost per document")
+    parser.add_argument("--rerank-call-ms", type=float, default=5.0, help="Stub cross-encoder cost per batch")
+    parser.add_argument("--rerank-budget-ms", type=float, default=250.0)
+    parser.add_argument("--output", help="Also write all results to this JSON file")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)  # bench_size() changes into a temp dir
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        result = bench_size(size, args)
+        print(json.dumps(result), flush=True)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
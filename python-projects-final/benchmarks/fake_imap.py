@@ -0,0 +1,237 @@
+# benchmarks/fake_imap.py
+"""
+Local IMAP stand-in for benchmarks and load tests.
+
+Speaks just enough IMAP4rev1 over plain TCP for imaplib and fetch_emails:
+CAPABILITY, LOGIN, SELECT/EXAMINE, SEARCH, FETCH (RFC822), UID SEARCH/FETCH,
+NOOP, CLOSE and LOGOUT. Mailboxes are seeded with synthetic messages that
+mix personal mail, reply threads, HTML newsletters and near-duplicate
+notifications.
+
+    python benchmarks/fake_imap.py --messages 1000 --port 1143
+    EMAIL_IMAP_SERVER=127.0.0.1 EMAIL_IMAP_PORT=1143 EMAIL_IMAP_SSL=0 python main.py --fetch
+"""
+import argparse
+import datetime
+import random
+import re
+import socketserver
+import threading
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+from typing import List, Tuple
+
+WORDS = (
+    "project meeting invoice report update review deadline budget release team client "
+    "schedule design launch feedback contract payment order shipment account security "
+    "training offer interview proposal roadmap metrics customer support ticket build"
+).split()
+PEOPLE = [("Alice Smith", "alice@example.com"), ("Bob Jones", "bob@example.org"),
+          ("Carol White", "carol@example.net"), ("Dan Brown", "dan@example.com"),
+          ("Erin Green", "erin@example.org")]
+BULK_SENDERS = [("Weekly Digest", "news@digest.example"), ("CI Bot", "ci@builds.example"),
+                ("Deals", "offers@shop.example")]
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    return "\n\n".join(" ".join(_sentence(rng, rng.randint(6, 14)) for _ in range(3)) for _ in range(count))
+
+
+def generate_mailbox(count: int, seed: int = 7, day: datetime.date = None) -> List[Tuple[datetime.datetime, bytes]]:
+    """Synthetic RFC822 messages dated on `day` (default today), deterministic for a given seed"""
+    rng = random.Random(seed)
+    day = day or datetime.date.today()
+    start = datetime.datetime.combine(day, datetime.time(0, 0), tzinfo=datetime.timezone.utc)
+    threads = []
+    messages = []
+
+    for i in range(count):
+        when = start + datetime.timedelta(seconds=int(i * 86000 / max(count, 1)))
+        msg = EmailMessage()
+        msg["Date"] = format_datetime(when)
+        msg["Message-ID"] = make_msgid(idstring=str(i), domain="fake.local")
+        kind = rng.random()
+
+        if kind < 0.35:
+            name, addr = rng.choice(BULK_SENDERS)
+            msg["From"] = f"{name} <{addr}>"
+            msg["Subject"] = f"{name}: {rng.choice(WORDS)} update #{i % 50}"
+            html = (
+                f"<html><head><style>p{{color:#333}}</style></head><body>"
+                f"<table><tr><td><h1>{name}</h1>"
+                + "".join(f"<p>{_sentence(rng, 12)} Item {i}.</p>" for _ in range(4))
+                + f"<p><a href='https://{addr.split('@')[1]}/t/{i}'>View online</a></p>"
+                f"<p>You receive this because you subscribed. Unsubscribe | Privacy policy</p>"
+                f"</td></tr></table></body></html>"
+            )
+            msg.set_content("This message requires an HTML capable client.")
+            msg.add_alternative(html, subtype="html")
+        elif kind < 0.6 and threads:
+            parent = rng.choice(threads)
+            name, addr = rng.choice(PEOPLE)
+            msg["From"] = f"{name} <{addr}>"
+            msg["Subject"] = f"Re: {parent['subject']}"
+            msg["In-Reply-To"] = parent["message_id"]
+            msg["References"] = " ".join(parent["references"] + [parent["message_id"]])
+            quoted = "\n".join(f"> {line}" for line in parent["body"].splitlines())
+            body = f"{_paragraphs(rng, 1)}\n\n-- \n{name}\n\nOn {parent['date']}, {parent['from']} wrote:\n{quoted}"
+            msg.set_content(body)
+            threads.append({"subject": parent["subject"], "message_id": msg["Message-ID"],
+                            "references": parent["references"] + [parent["message_id"]],
+                            "body": body, "date": msg["Date"], "from": msg["From"]})
+        else:
+            name, addr = rng.choice(PEOPLE)
+            subject = f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} {i}"
+            body = _paragraphs(rng, rng.randint(1, 4))
+            if rng.random() < 0.3:
+                body += f"\n\nDetails: https://example.com/doc/{i} due {rng.randint(1, 28)}/{rng.randint(1, 12)}"
+            msg["From"] = f"{name} <{addr}>"
+            msg["Subject"] = subject
+            msg.set_content(f"{body}\n\n-- \n{name}")
+            threads.append({"subject": subject, "message_id": msg["Message-ID"], "references": [],
+                            "body": body, "date": msg["Date"], "from": msg["From"]})
+
+        messages.append((when, msg.as_bytes()))
+    return messages
+
+
+class Mailbox:
+    def __init__(self, messages: List[Tuple[datetime.datetime, bytes]]):
+        # (uid, internal date, raw); UIDs start at 1 and never get reused
+        self.messages = [(i + 1, when, raw) for i, (when, raw) in enumerate(messages)]
+        self.lock = threading.Lock()
+
+    def search(self, criteria: str) -> List[int]:
+        """Sequence numbers matching criteria; only ALL and SINCE are understood"""
+        m = re.search(r'SINCE\s+"?(\d{1,2}-\w{3}-\d{4})"?', criteria, re.IGNORECASE)
+        if not m:
+            return list(range(1, len(self.messages) + 1))
+        since = datetime.datetime.strptime(m.group(1), "%d-%b-%Y").date()
+        return [seq for seq, (_, when, _) in enumerate(self.messages, 1) if when.date() >= since]
+
+    def expunge_uids(self, uids):
+        uids = set(uids)
+        with self.lock:
+            self.messages = [m for m in self.messages if m[0] not in uids]
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    # Buffer each response and flush once per command; unbuffered small writes
+    # interact with Nagle/delayed ACK and add ~40 ms per FETCH
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def _send(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def _fetch(self, seq: int, uid_mode: bool):
+        uid, _, raw = self.server.mailbox.messages[seq - 1]
+        prefix = f"UID {uid} " if uid_mode else ""
+        self.wfile.write(f"* {seq} FETCH ({prefix}RFC822 {{{len(raw)}}}\r\n".encode())
+        self.wfile.write(raw)
+        self.wfile.write(b")\r\n")
+
+    @staticmethod
+    def _parse_set(spec: str, maximum: int) -> List[int]:
+        values = []
+        for part in spec.split(","):
+            if ":" in part:
+                lo, hi = part.split(":")
+                lo = int(lo)
+                hi = maximum if hi == "*" else int(hi)
+                values.extend(range(lo, hi + 1))
+            else:
+                values.append(maximum if part == "*" else int(part))
+        return values
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self._send("* OK [CAPABILITY IMAP4rev1] fake IMAP ready")
+        self.wfile.flush()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode(errors="ignore").strip().split(" ", 2)
+            if len(parts) < 2:
+                continue
+            tag, command = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ""
+            uid_mode = False
+            if command == "UID":
+                uid_mode = True
+                command, _, args = args.partition(" ")
+                command = command.upper()
+
+            if command == "CAPABILITY":
+                self._send("* CAPABILITY IMAP4rev1")
+            elif command in ("SELECT", "EXAMINE"):
+                self._send(f"* {len(mailbox.messages)} EXISTS")
+                self._send("* 0 RECENT")
+                self._send("* FLAGS (\\Seen)")
+                self._send("* OK [UIDVALIDITY 1] UIDs valid")
+            elif command == "SEARCH":
+                seqs = mailbox.search(args)
+                ids = [mailbox.messages[s - 1][0] for s in seqs] if uid_mode else seqs
+                self._send("* SEARCH " + " ".join(str(i) for i in ids))
+            elif command == "FETCH":
+                spec = args.split(" ", 1)[0]
+                if uid_mode:
+                    wanted = set(self._parse_set(spec, mailbox.messages[-1][0] if mailbox.messages else 0))
+                    seqs = [s for s, m in enumerate(mailbox.messages, 1) if m[0] in wanted]
+                else:
+                    seqs = [s for s in self._parse_set(spec, len(mailbox.messages)) if 1 <= s <= len(mailbox.messages)]
+                for seq in seqs:
+                    self._fetch(seq, uid_mode)
+            elif command == "LOGOUT":
+                self._send("* BYE logging out")
+                self._send(f"{tag} OK LOGOUT completed")
+                self.wfile.flush()
+                return
+            elif command not in ("LOGIN", "NOOP", "CLOSE", "EXPUNGE"):
+                self._send(f"{tag} BAD unsupported command {command}")
+                self.wfile.flush()
+                continue
+            self._send(f"{tag} OK {command} completed")
+            self.wfile.flush()
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: Mailbox, host: str = "127.0.0.1", port: int = 0):
+        self.mailbox = mailbox
+        super().__init__((host, port), _IMAPHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeIMAPServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def start_fake_imap(message_count: int, seed: int = 7, port: int = 0) -> FakeIMAPServer:
+    return FakeIMAPServer(Mailbox(generate_mailbox(message_count, seed)), port=port).start()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--port", type=int, default=1143)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer(Mailbox(generate_mailbox(args.messages, args.seed)), port=args.port)
+    print(f"Fake IMAP serving {args.messages} messages on 127.0.0.1:{server.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# benchmarks/load_test.py
+"""
+HTTP load test for server.py / server2.py at increasing concurrency.
+
+Starts the app in a subprocess with stub model backends (benchmarks/stubs.py)
+and a local fake IMAP server, warms it up (fetch, build, first chat), then
+drives each endpoint with N concurrent clients per level. Prints one JSON
+object per (endpoint, concurrency) with p50/p95/p99 latency, throughput,
+error rate and the server's peak RSS during that level.
+
+    python benchmarks/load_test.py --server server2 --concurrency 1,4,16,64
+    python benchmarks/load_test.py --server server --endpoints chat,fetch,build --llm-latency-ms 200
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --server-pid 1234   # an already-running server
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+QUESTIONS = [
+    "What did Alice say about the budget?",
+    "Is there an invoice or payment deadline?",
+    "Give me the link to the roadmap document",
+    "Any updates on the release schedule?",
+    "What did the CI bot report about the build?",
+]
+# (method, path, uses a JSON question body)
+ENDPOINTS = {
+    "chat": ("POST", "/chat", True),
+    "fetch": ("GET", "/fetch", False),
+    "build": ("GET", "/build", False),
+}
+SERVER_ENDPOINTS = {
+    "server": ("chat", "fetch", "build"),
+    "server2": ("chat",),
+}
+
+
+def serve(args):
+    """Child process: the app with stub LLM/embeddings, pointed at the fake IMAP server"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    from stubs import FakeLLM, FakeEmbeddings
+    import llm_backends
+
+    llm_backends.BACKENDS["stub"] = lambda config: FakeLLM(
+        latency_ms=args.llm_latency_ms,
+        prefill_ms_per_token=args.prefill_ms_per_token,
+        decode_ms_per_token=args.decode_ms_per_token,
+    )
+    # Both modules bind the name at import; swap it for the hashed bag-of-words stub
+    import vectorstore
+    import email_chain
+    vectorstore.SentenceTransformerEmbeddings = email_chain.SentenceTransformerEmbeddings = (
+        lambda model_name=None, **kwargs: FakeEmbeddings()
+    )
+
+    import uvicorn
+    module = __import__(args.serve)
+    uvicorn.run(module.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir, imap_port):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        EMAIL_IMAP_SERVER="127.0.0.1",
+        EMAIL_IMAP_PORT=str(imap_port),
+        EMAIL_IMAP_SSL="0",
+        EMAIL_USER="bench",
+        EMAIL_PASSWORD="bench",
+        EMAIL_RAG_LLM_BACKEND="stub",
+        PYTHONPATH=os.pathsep.join([os.path.abspath(ROOT), HERE]),
+    )
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--serve", args.server, "--port", str(port),
+        "--llm-latency-ms", str(args.llm_latency_ms),
+        "--prefill-ms-per-token", str(args.prefill_ms_per_token),
+        "--decode-ms-per-token", str(args.decode_ms_per_token),
+    ]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{args.server} exited with code {proc.returncode}")
+        try:
+            request("GET", url + "/health", timeout=1)
+            return proc, url
+        except Exception:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{args.server} did not start within 120s")
+
+
+def request(method, url, body=None, timeout=300):
+    """(status, parsed JSON body); HTTP errors are returned, connection errors raised"""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def _rss_bytes(pid):
+    """RSS of pid and its direct children (e.g. extraction pools), from /proc; None elsewhere"""
+    pids = [pid]
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                pids.extend(int(p) for p in f.read().split())
+    except OSError:
+        pass
+    total = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            if p == pid:
+                return None
+    return total
+
+
+class RSSSampler:
+    """Polls the server's RSS in the background and keeps the maximum"""
+
+    def __init__(self, pid, interval_s=0.05):
+        self.pid = pid
+        self.interval_s = interval_s
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = _rss_bytes(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval_s)
+
+    def __enter__(self):
+        if self.pid:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), math.ceil(q / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def run_level(url, endpoint, concurrency, requests_per_client, timeout, pid):
+    method, path, with_question = ENDPOINTS[endpoint]
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(worker):
+        for i in range(requests_per_client):
+            body = {"question": QUESTIONS[(worker + i) % len(QUESTIONS)]} if with_question else None
+            start = time.perf_counter()
+            try:
+                status, payload = request(method, url + path, body, timeout=timeout)
+                # /fetch and /build report job failures in a 200 body
+                error = f"HTTP {status}" if status >= 400 else (
+                    payload.get("error") if isinstance(payload, dict) else None)
+            except Exception as e:
+                error = type(e).__name__
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+                if error:
+                    errors.append(str(error))
+
+    threads = [threading.Thread(target=client, args=(w,)) for w in range(concurrency)]
+    with RSSSampler(pid) as rss:
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall_s = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "benchmark": "load_test",
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(latencies), 4) if latencies else None,
+        "sample_errors": sorted(set(errors))[:3],
+        "throughput_rps": round(len(latencies) / wall_s, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(latencies[-1], 1),
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1) if rss.peak else None,
+    }
+
+
+def warm_up(url, endpoints, timeout):
+    """Fill the mailbox and index once so the first level doesn't measure cold start"""
+    if "fetch" in endpoints or "build" in endpoints:
+        for step in ("fetch", "build"):
+            method, path, _ = ENDPOINTS[step]
+            status, payload = request(method, url + path, timeout=timeout)
+            if status >= 400 or (isinstance(payload, dict) and payload.get("error")):
+                raise RuntimeError(f"Warm-up {step} failed: {status} {payload}")
+    status, payload = request("POST", url + "/chat", {"question": QUESTIONS[0]}, timeout=timeout)
+    if status >= 400:
+        raise RuntimeError(f"Warm-up chat failed: {status} {payload}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", default="server2", choices=sorted(SERVER_ENDPOINTS))
+    parser.add_argument("--url", help="Load an already-running server instead of starting one with stubs")
+    parser.add_argument("--server-pid", type=int, help="With --url: process to sample RSS from")
+    parser.add_argument("--endpoints", help="Comma-separated subset of chat,fetch,build (default: all the server has)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32")
+    parser.add_argument("--requests-per-client", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=1000, help="Fake IMAP mailbox size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.0)
+    parser.add_argument("--decode-ms-per-token", type=float, default=0.0)
+    parser.add_argument("--output", help="Also write all results to this JSON file")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    endpoints = args.endpoints.split(",") if args.endpoints else list(SERVER_ENDPOINTS[args.server])
+    proc, workdir, imap = None, None, None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.server_pid
+    else:
+        sys.path.insert(0, HERE)
+        from fake_imap import start_fake_imap
+
+        imap = start_fake_imap(args.messages, seed=args.seed)
+        workdir = tempfile.mkdtemp(prefix="email_rag_load_")
+        proc, url = start_server(args, workdir, imap.port)
+        pid = proc.pid
+
+    results = []
+    try:
+        warm_up(url, endpoints, args.timeout)
+        for endpoint in endpoints:
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                result = run_level(url, endpoint, concurrency, args.requests_per_client, args.timeout, pid)
+                result.update(server=args.server if not args.url else args.url, python=platform.python_version())
+                print(json.dumps(result), flush=True)
+                results.append(result)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if imap is not None:
+            imap.shutdown()
+            imap.server_close()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
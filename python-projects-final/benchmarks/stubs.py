@@ -0,0 +1,97 @@
+# benchmarks/stubs.py
+"""Deterministic stand-ins for GPT4All, SentenceTransformer and CrossEncoder with configurable latency"""
+import re
+import time
+import hashlib
+import math
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+
+CHARS_PER_TOKEN = 4
+
+
+class FakeLLM(LLM):
+    """
+    Answers each of the chain's prompts with a fixed, well-formed reply.
+    Latency = latency_ms + prompt_tokens * prefill_ms_per_token + output_tokens * decode_ms_per_token.
+    """
+
+    latency_ms: float = 0.0
+    prefill_ms_per_token: float = 0.0
+    decode_ms_per_token: float = 0.0
+    scope: str = "RELEVANT"
+    calls: int = 0
+    prompt_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _reply(self, prompt: str) -> str:
+        if "Analysis:" in prompt:
+            needs_count = "YES" if re.search(r"how many|count", prompt, re.IGNORECASE) else "NO"
+            return f"SCOPE: {self.scope}\nSEARCH_TERMS: email\nNEEDS_COUNT: {needs_count}\nINFO_TYPE: content"
+        m = re.search(r"Current Question: (.*)", prompt)
+        if "Resolved Question" in prompt and m:
+            return m.group(1).strip()
+        n = prompt.count("EMAIL #") + prompt.count("THREAD #")
+        return f"Based on {n} emails, here is a stub answer."
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        reply = self._reply(prompt)
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        delay_ms = (
+            self.latency_ms
+            + prompt_tokens * self.prefill_ms_per_token
+            + (len(reply) // CHARS_PER_TOKEN) * self.decode_ms_per_token
+        )
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        return reply
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: similar texts land near each other, no model needed"""
+
+    def __init__(self, dim: int = 384, latency_ms_per_text: float = 0.0):
+        self.dim = dim
+        self.latency_ms_per_text = latency_ms_per_text
+
+    def _embed(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "big")
+            vec[h % self.dim] += 1.0 if h & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms_per_text:
+            time.sleep(self.latency_ms_per_text * len(texts) / 1000)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeCrossEncoder:
+    """Scores (query, text) pairs by shared words; latency = call_ms + pairs * ms_per_pair"""
+
+    def __init__(self, ms_per_pair: float = 0.0, call_ms: float = 0.0):
+        self.ms_per_pair = ms_per_pair
+        self.call_ms = call_ms
+
+    def predict(self, pairs, batch_size: int = 16) -> List[float]:
+        delay_ms = self.call_ms + len(pairs) * self.ms_per_pair
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        scores = []
+        for query, text in pairs:
+            query_words = set(re.findall(r"\w+", query.lower()))
+            text_words = set(re.findall(r"\w+", text.lower()))
+            scores.append(len(query_words & text_words) / (len(query_words) or 1))
+        return scores
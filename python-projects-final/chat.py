@@ -1,11 +1,12 @@
 # chat.py
 from langchain.chains import ConversationalRetrievalChain
-from langchain_community.llms import GPT4All
-from vectorstore import load_vectorstore
+from llm_backends import make_llm
+from vectorstore import load_vectorstore, PERSIST_DIR
 
-def make_chatbot():
-    vs = load_vectorstore()
-    llm = GPT4All(model="mistral-7b-instruct-v0.1.Q4_0.gguf", allow_download=True)
+def make_chatbot(persist_dir=PERSIST_DIR, llm=None, embeddings=None):
+    """Pass llm/embeddings to share one loaded model between several chatbots (tenants)"""
+    vs = load_vectorstore(persist_dir, embeddings)
+    llm = llm or make_llm()
 
     chat = ConversationalRetrievalChain.from_llm(
         llm=llm,
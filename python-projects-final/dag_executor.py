@@ -0,0 +1,87 @@
+# dag_executor.py
+import logging
+import contextvars
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """
+    One node of the DAG. fn receives a dict of its inputs and returns a dict of
+    its outputs. skip may return the outputs directly when the stage would be a
+    no-op for these inputs (e.g. context resolution with no chat history).
+    """
+    name: str
+    fn: Callable[[Dict[str, Any]], Dict[str, Any]]
+    inputs: List[str]
+    outputs: List[str]
+    skip: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+
+
+class DAGExecutor:
+    """
+    Runs stages as soon as their inputs are available, independent stages in
+    parallel on a shared thread pool. Each stage runs in a copy of the caller's
+    context, so tracing spans still land in the caller's trace.
+    """
+
+    def __init__(self, stages: List[Stage], input_variables: List[str], max_workers: int = 4):
+        self.stages = stages
+        self.input_variables = list(input_variables)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dag")
+        self._validate()
+
+    def _validate(self):
+        available = set(self.input_variables)
+        remaining = list(self.stages)
+        # Topological pass: fails on missing inputs and on cycles alike
+        while remaining:
+            ready = [s for s in remaining if set(s.inputs) <= available]
+            if not ready:
+                missing = {s.name: sorted(set(s.inputs) - available) for s in remaining}
+                raise ValueError(f"DAG stages can never run, unresolved inputs: {missing}")
+            for stage in ready:
+                available.update(stage.outputs)
+                remaining.remove(stage)
+
+    def _run_stage(self, stage: Stage, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        if stage.skip is not None:
+            outputs = stage.skip(inputs)
+            if outputs is not None:
+                logger.info(f"⏭️  Skipping no-op stage {stage.name}")
+                METRICS.inc("email_rag_stage_skipped_total", stage=stage.name)
+                return outputs
+        return stage.fn(inputs)
+
+    def run(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        values = dict(inputs)
+        pending = list(self.stages)
+        running = {}
+
+        try:
+            while pending or running:
+                for stage in [s for s in pending if all(k in values for k in s.inputs)]:
+                    pending.remove(stage)
+                    stage_inputs = {k: values[k] for k in stage.inputs}
+                    ctx = contextvars.copy_context()
+                    running[self._pool.submit(ctx.run, self._run_stage, stage, stage_inputs)] = stage
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    outputs = future.result()
+                    missing = set(stage.outputs) - set(outputs)
+                    if missing:
+                        raise ValueError(f"Stage {stage.name} did not produce {sorted(missing)}")
+                    values.update({k: outputs[k] for k in stage.outputs})
+        finally:
+            for future in running:
+                future.cancel()
+
+        return values
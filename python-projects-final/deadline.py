@@ -0,0 +1,128 @@
+# deadline.py
+"""
+Per-request latency budgets for the email chain.
+
+A request runs inside deadline(budget_ms). Before each LLM stage the chain
+asks whether the stage, plus the answer that still has to follow it, fits in
+the time left. If it doesn't, the chain takes the next cheaper path:
+
+    skip_resolution   answer the question as asked, without the rewrite
+    skip_analysis     keyword heuristics instead of the analysis LLM call
+    shrink_context    drop the lowest-ranked emails until the prompt fits
+    fallback_model    generate with the smaller EMAIL_RAG_FALLBACK_LLM_MODEL
+    retrieval_only    return the retrieved email list, no generation
+
+Every step taken is recorded on the Deadline and returned with the answer.
+Stage costs come from StageCosts, a running average of milliseconds per token
+that every completed LLM stage updates, so estimates follow the actual box.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+CHAT_BUDGET_MS = float(os.getenv("EMAIL_RAG_CHAT_BUDGET_MS", 0))  # 0 = no budget
+# Cost model before any stage has been observed: ~CPU 7B Q4 throughput
+DEFAULT_MS_PER_TOKEN = float(os.getenv("EMAIL_RAG_DEFAULT_MS_PER_TOKEN", 25))
+DEFAULT_COMPLETION_TOKENS = 60
+COST_SMOOTHING = 0.2  # weight of the newest observation
+SAFETY_FACTOR = 1.2  # estimates are padded; a late answer is worse than a degraded one
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("email_rag_deadline", default=None)
+
+
+class StageCosts:
+    """Exponentially weighted ms/token and completion length of each LLM stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Tuple[float, float]] = {}  # stage -> (ms per token, completion tokens)
+
+    def observe(self, stage: str, duration_ms: float, prompt_tokens: int, completion_tokens: int):
+        tokens = prompt_tokens + completion_tokens
+        if tokens <= 0:
+            return
+        with self._lock:
+            rate, completion = self._stats.get(stage, (duration_ms / tokens, completion_tokens))
+            self._stats[stage] = (
+                rate + COST_SMOOTHING * (duration_ms / tokens - rate),
+                completion + COST_SMOOTHING * (completion_tokens - completion)
+            )
+
+    def estimate_ms(self, stage: str, prompt_tokens: int) -> float:
+        with self._lock:
+            rate, completion = self._stats.get(stage, (DEFAULT_MS_PER_TOKEN, DEFAULT_COMPLETION_TOKENS))
+        return rate * (prompt_tokens + completion) * SAFETY_FACTOR
+
+    def affordable_prompt_tokens(self, stage: str, budget_ms: float) -> int:
+        """Largest prompt the stage can process within budget_ms"""
+        with self._lock:
+            rate, completion = self._stats.get(stage, (DEFAULT_MS_PER_TOKEN, DEFAULT_COMPLETION_TOKENS))
+        return max(0, int(budget_ms / (rate * SAFETY_FACTOR) - completion))
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {"ms_per_token": round(rate, 3), "completion_tokens": round(completion, 1)}
+                for stage, (rate, completion) in self._stats.items()
+            }
+
+
+STAGE_COSTS = StageCosts()
+
+
+class Deadline:
+    def __init__(self, budget_ms: Optional[float] = None):
+        self.budget_ms = budget_ms or None  # None or 0: unlimited
+        self.start = time.perf_counter()
+        self._path: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.budget_ms is None
+
+    def remaining_ms(self) -> float:
+        if self.unlimited:
+            return float("inf")
+        return self.budget_ms - (time.perf_counter() - self.start) * 1000
+
+    def allows(self, cost_ms: float) -> bool:
+        return self.remaining_ms() >= cost_ms
+
+    def degrade(self, step: str, detail: str = ""):
+        with self._lock:
+            self._path.append(f"{step}:{detail}" if detail else step)
+        METRICS.inc("email_rag_degraded_total", step=step)
+        logger.info(f"⏱️ Degrading: {step} {detail}({self.remaining_ms():.0f} ms left of {self.budget_ms:.0f})")
+
+    @property
+    def path(self) -> List[str]:
+        """Degradation steps taken, or ["full"] if the chain ran completely"""
+        with self._lock:
+            return list(self._path) or ["full"]
+
+
+def current_deadline() -> Deadline:
+    """The running request's deadline (an unlimited one outside deadline())"""
+    return _current_deadline.get() or Deadline()
+
+
+@contextmanager
+def deadline(budget_ms: Optional[float] = None):
+    d = Deadline(budget_ms)
+    token = _current_deadline.set(d)
+    try:
+        yield d
+    finally:
+        _current_deadline.reset(token)
+        if not d.unlimited:
+            METRICS.observe("email_rag_budget_used_ratio", (time.perf_counter() - d.start) * 1000 / d.budget_ms,
+                            buckets=(0.25, 0.5, 0.75, 0.9, 1.0, 1.25, 1.5, 2.0))
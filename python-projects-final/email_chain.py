@@ -1,22 +1,38 @@
 from langchain.chains.base import Chain
 from langchain.chains import LLMChain, SequentialChain, TransformChain
-from langchain_community.llms import GPT4All
 from langchain.embeddings import SentenceTransformerEmbeddings
 from langchain.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.prompts import PromptTemplate
 from langchain.memory import ConversationBufferMemory
+from langchain.schema import Document
+from langchain.docstore.in_memory import InMemoryDocstore
 from typing import Dict, Any, List, Optional
 from pydantic import Field
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import datetime
 import os
+import re
 import json
 import logging
 import hashlib
+import threading
 from pathlib import Path
 from fetch_emails import fetch_emails_since
-from bs4 import BeautifulSoup
+from email_chunker import EmailChunker
+from email_threads import ThreadIndex
+from near_duplicates import NearDuplicateDetector
+from email_query import EmailQueryEngine
+from email_digest import EmailDigestStore
+from tracing import METRICS, estimate_tokens
+from llm_backends import make_llm, DEFAULT_MODEL, DEFAULT_LLM_BACKEND, DEFAULT_LLM_BASE_URL, DEFAULT_LLM_API_KEY
+from atomic_io import atomic_write_json, file_lock, replace_directory
+from dag_executor import DAGExecutor, Stage
+from deadline import CHAT_BUDGET_MS, STAGE_COSTS, current_deadline, deadline
+from attachments import get_extractor
+from retention import (
+    RetentionPolicy, TombstoneStore, apply_retention, iter_retained_emails, COMPACTION_MIN_DEAD_FRACTION
+)
+from html_cleaning import html_to_text, clean_text
 from email.utils import parsedate_to_datetime
 
 # Configure logging
@@ -33,6 +49,74 @@ DEFAULT_MAX_TOKENS = 4048
 DEFAULT_K_VALUE = 20
 BODY_PREVIEW_LENGTH = 200
 MAX_CONTEXT_EMAILS = 50
+MAX_THREAD_MESSAGE_CHARS = 1000
+MIN_DEGRADED_CONTEXT_TOKENS = 500  # smallest email context still worth generating from
+
+# Prompt templates for the chain stages.
+# Static instructions come first and per-question values last, so backends with a
+# prefix KV cache (llm_backends.make_llamacpp) only prefill the changing suffix.
+CONTEXT_RESOLUTION_TEMPLATE = """You are resolving context references in a conversation about emails.
+
+Task: If the question contains words like "that", "this", "it", "same", "the link", rewrite it to be self-contained using information from the conversation history. Otherwise, return it as-is.
+
+Examples:
+- "give that link" -> "give the link from the license renewal email"
+- "what was in it?" -> "what was in the email about job opportunities"
+- "show me all emails" -> "show me all emails" (already clear)
+
+Conversation History:
+{chat_history}
+
+Current Question: {original_question}
+
+Resolved Question (be specific and clear):"""
+
+QUERY_ANALYSIS_TEMPLATE = """Analyze this email query and determine the search strategy.
+
+Determine:
+1. SCOPE: Does user want ALL emails or just RELEVANT ones? **If the user asks "how many" or wants to count emails without specifying a topic, the scope is ALL.**
+2. SEARCH_TERMS: What keywords should we search for?
+3. NEEDS_COUNT: Does the user want to count something?
+4. INFO_TYPE: What information do they want? (senders/subjects/links/content/count)
+
+Respond in this format:
+SCOPE: [ALL or RELEVANT]
+SEARCH_TERMS: [comma-separated keywords]
+NEEDS_COUNT: [YES or NO]
+INFO_TYPE: [what they want]
+
+Question: {resolved_question}
+
+Analysis:"""
+
+ANSWER_GENERATION_TEMPLATE = """You are an intelligent email assistant. Answer the user's question based on the emails provided.
+
+INSTRUCTIONS:
+1. Answer the user's ORIGINAL question directly and naturally
+2. Use the email data below to provide accurate, specific information
+3. If they ask for links, extract actual URLs from the emails
+4. If they ask for contact details, extract actual emails/phone numbers
+5. If counting, count all relevant emails shown below
+6. Be conversational and helpful
+7. Don't say "I don't have access" - the emails are right below
+
+EMAIL DATA:
+{email_context}
+
+Number of Emails Retrieved: {emails_retrieved}
+Search Scope: {scope_used}
+Original Question: {original_question}
+Clarified Question: {resolved_question}
+
+YOUR ANSWER:"""
+
+PHRASE_TEMPLATE = """Rewrite the factual answer below as a short, friendly reply to the user's question. Keep every number, name and subject exactly as given.
+
+Question: {original_question}
+Factual Answer:
+{structured_answer}
+
+Reply:"""
 
 @dataclass
 class EmailRAGConfig:
@@ -43,9 +127,33 @@ class EmailRAGConfig:
     chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
     max_tokens: int = DEFAULT_MAX_TOKENS
     k_value: int = DEFAULT_K_VALUE
-    model_name: str = "mistral-7b-instruct-v0.1.Q4_0.gguf"
+    model_name: str = os.getenv("EMAIL_RAG_LLM_MODEL", DEFAULT_MODEL)
+    # "gpt4all", "llamacpp" (reuses KV state of shared prompt prefixes) or
+    # "openai_compat" (local batching server at llm_base_url)
+    llm_backend: str = DEFAULT_LLM_BACKEND
+    llm_base_url: str = DEFAULT_LLM_BASE_URL
+    llm_api_key: str = DEFAULT_LLM_API_KEY
+    llm_timeout_s: float = 300.0
+    n_ctx: int = 8192
+    prefix_cache_mb: int = 2048  # llamacpp only; 0 disables the prefix KV cache
     embedding_model: str = "all-MiniLM-L6-v2"
     enable_memory: bool = True
+    verbose: bool = False  # log full prompts from every LLMChain
+    enable_rerank: bool = False
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_top_n: int = 5
+    rerank_batch_size: int = 16
+    rerank_budget_ms: float = 250.0
+    thread_mode: bool = True
+    collapse_near_duplicates: bool = True
+    near_duplicate_threshold: float = 0.8
+    quantization: str = "none"  # "none" (float32 FAISS), "int8" or "binary" codes with float32 rescoring
+    rescore_factor: int = 4  # quantized search rescores k * rescore_factor candidates
+    structured_answers: str = "direct"  # "direct" (no LLM), "phrase" (LLM rewords the result) or "off"
+    executor: str = "dag"  # "dag" (skip no-op stages, retrieve speculatively) or "sequential"
+    imap_account: Optional[Any] = None  # fetch_emails.IMAPAccount; None uses the EMAIL_* settings
+    budget_ms: float = CHAT_BUDGET_MS  # per-question latency budget (0 = none); see deadline.py
+    fallback_model_name: str = os.getenv("EMAIL_RAG_FALLBACK_LLM_MODEL", "")  # smaller model for tight budgets
 
 class EmailProcessor:
     """Handles email cleaning and normalization"""
@@ -55,12 +163,18 @@ class EmailProcessor:
         if not raw_html:
             return ""
         try:
-            soup = BeautifulSoup(raw_html, "html.parser")
-            return soup.get_text(separator="\n", strip=True)
+            return html_to_text(raw_html)
         except Exception as e:
             logger.error(f"Error cleaning HTML: {e}")
             return raw_html
     
+    @staticmethod
+    def clean_body(email: Dict[str, Any]) -> str:
+        """Cleaned body, computed at most once per message and cached on the email dict"""
+        if "clean_body" not in email:
+            email["clean_body"] = clean_text(email.get("body", ""))
+        return email["clean_body"]
+    
     @staticmethod
     def normalize_date(raw_date: str) -> str:
         if not raw_date:
@@ -81,23 +195,50 @@ class EmailProcessor:
         unique_str = f"{email.get('from', '')}{email.get('date', '')}{email.get('subject', '')}"
         return hashlib.md5(unique_str.encode()).hexdigest()
 
+def near_duplicate_detector(config: EmailRAGConfig, chunker: EmailChunker) -> NearDuplicateDetector:
+    """Detector the chain collapses a day's emails with before indexing them"""
+    return NearDuplicateDetector(
+        threshold=config.near_duplicate_threshold,
+        text_fn=lambda e: f"{e.get('subject', '')}\n{chunker.clean_body(EmailProcessor.clean_body(e))}"
+    )
+
 class VectorStoreManager:
     """Manages FAISS vectorstore operations"""
     
     def __init__(self, config: EmailRAGConfig, embeddings: Any):
         self.config = config
         self.embeddings = embeddings
-        self.vectorstore: Optional[FAISS] = None
+        self._vectorstore: Optional[Any] = None  # FAISS or QuantizedVectorIndex
+        self.version = 0  # bumped whenever a different vectorstore is swapped in
+        self.chunker = EmailChunker(
+            chunk_size=config.chunk_size,
+            chunk_overlap=config.chunk_overlap
+        )
+        self.attachments = get_extractor(config.data_dir)
+        self.indexed_attachments = set()  # sha256 of attachments already in the vectorstore
+        self._attachment_lock = threading.Lock()
         
+    @property
+    def vectorstore(self) -> Optional[Any]:
+        return self._vectorstore
+    
+    @vectorstore.setter
+    def vectorstore(self, value: Optional[Any]):
+        self._vectorstore = value
+        self.version += 1
+    
     def load_or_create(self, emails: List[Dict]) -> Optional[FAISS]:
         try:
             if self._vectorstore_exists():
                 logger.info("Loading existing vectorstore...")
-                self.vectorstore = FAISS.load_local(
-                    self.config.persist_dir,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
+                with file_lock(self.config.persist_dir, shared=True):
+                    self.vectorstore = self._load_persisted()
+                if isinstance(self.vectorstore, FAISS):
+                    self.indexed_attachments = {
+                        doc.metadata["attachment_sha256"]
+                        for doc in self.vectorstore.docstore._dict.values()
+                        if doc.metadata.get("attachment_sha256")
+                    }
                 logger.info("✓ Vectorstore loaded successfully")
                 return self.vectorstore
         except Exception as e:
@@ -107,6 +248,21 @@ class VectorStoreManager:
             return self.build_vectorstore(emails)
         return None
     
+    def _load_persisted(self):
+        if self.config.quantization != "none":
+            from quantized_index import QuantizedVectorIndex
+            return QuantizedVectorIndex.load(
+                self.config.persist_dir,
+                self.embeddings,
+                mode=self.config.quantization,
+                rescore_factor=self.config.rescore_factor
+            )
+        return FAISS.load_local(
+            self.config.persist_dir,
+            self.embeddings,
+            allow_dangerous_deserialization=True
+        )
+    
     def build_vectorstore(self, emails: List[Dict]) -> Optional[FAISS]:
         try:
             logger.info(f"Building vectorstore from {len(emails)} emails...")
@@ -115,9 +271,20 @@ class VectorStoreManager:
             if not docs:
                 logger.warning("No documents to build vectorstore")
                 return None
+            self.indexed_attachments = {d.metadata["attachment_sha256"] for d in docs if d.metadata.get("attachment_sha256")}
             
-            self.vectorstore = FAISS.from_documents(docs, self.embeddings)
-            self._save_vectorstore()
+            if self.config.quantization != "none":
+                from quantized_index import QuantizedVectorIndex
+                # Built straight into the swap directory, then reopened so the float32 vectors are memory-mapped
+                replace_directory(
+                    self.config.persist_dir,
+                    lambda path: QuantizedVectorIndex.build(path, docs, self.embeddings, self.config.quantization)
+                )
+                with file_lock(self.config.persist_dir, shared=True):
+                    self.vectorstore = self._load_persisted()
+            else:
+                self.vectorstore = FAISS.from_documents(docs, self.embeddings)
+                self._save_vectorstore()
             logger.info("✓ Vectorstore built successfully")
             return self.vectorstore
         except Exception as e:
@@ -125,41 +292,139 @@ class VectorStoreManager:
             return None
     
     def _prepare_documents(self, emails: List[Dict]):
-        texts = []
-        metadatas = []
+        items = []
         
         for email in emails:
             try:
-                clean_body = EmailProcessor.clean_html(email.get("body", ""))
-                text = (
-                    f"From: {email.get('from', '')}\n"
-                    f"Sender Email: {email.get('sender_email', '')}\n"
-                    f"Date: {email.get('date', '')}\n"
-                    f"Subject: {email.get('subject', '')}\n\n"
-                    f"{clean_body}"
-                )
-                texts.append(text)
-                
-                metadatas.append({
+                clean_body = EmailProcessor.clean_body(email)
+                items.append((clean_body, {
                     "email_hash": EmailProcessor.generate_email_hash(email),
                     "from": email.get("from", ""),
                     "sender_email": email.get("sender_email", ""),
                     "date": email.get("date", ""),
                     "subject": email.get("subject", ""),
-                    "body_preview": clean_body[:BODY_PREVIEW_LENGTH]
-                })
+                    "thread_id": email.get("thread_id", ""),
+                    "email_count": email.get("duplicate_count", 1),
+                    "body_preview": self.chunker.clean_body(clean_body)[:BODY_PREVIEW_LENGTH]
+                }))
             except Exception as e:
                 logger.error(f"Error preparing document: {e}")
                 continue
         
-        if not texts:
+        if not items:
             return []
         
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.config.chunk_size,
-            chunk_overlap=self.config.chunk_overlap
+        attachment_docs, _ = self._attachment_documents(emails)
+        return self.chunker.chunk_corpus(items) + attachment_docs
+    
+    def _attachment_documents(self, emails: List[Dict], skip: frozenset = frozenset()):
+        """
+        Chunks of every extracted attachment not in skip, once per content hash and
+        linked to the first email carrying it. Attachments still being extracted are left out.
+        """
+        documents = []
+        shas = set()
+        for email in emails:
+            for attachment in email.get("attachments", []):
+                sha = attachment["sha256"]
+                if sha in shas or sha in skip:
+                    continue
+                text = self.attachments.text(sha)
+                if not text:
+                    continue
+                shas.add(sha)
+                documents.extend(self.chunker.chunk_document(text, {
+                    "email_hash": EmailProcessor.generate_email_hash(email),
+                    "from": email.get("from", ""),
+                    "sender_email": email.get("sender_email", ""),
+                    "date": email.get("date", ""),
+                    "subject": email.get("subject", ""),
+                    "thread_id": email.get("thread_id", ""),
+                    "email_count": email.get("duplicate_count", 1),
+                    "attachment": attachment["filename"],
+                    "attachment_sha256": sha
+                }, prefix=f"[Attachment: {attachment['filename']}]\n"))
+        return documents, shas
+    
+    def add_attachments(self, emails: List[Dict]) -> int:
+        """
+        Index attachment text extracted since the vectorstore was built. The FAISS
+        store is copied, extended and swapped in, so searches running meanwhile
+        keep using the old one. Quantized stores pick attachments up on the next rebuild.
+        """
+        with self._attachment_lock:
+            docs, shas = self._attachment_documents(emails, skip=frozenset(self.indexed_attachments))
+            if not docs or not isinstance(self.vectorstore, FAISS):
+                return 0
+            updated = self._copy_faiss(self.vectorstore)
+            updated.add_documents(docs)
+            self.vectorstore = updated
+            self.indexed_attachments |= shas
+            self._save_vectorstore()
+            logger.info(f"📎 Indexed {len(shas)} attachments ({len(docs)} chunks)")
+            return len(shas)
+    
+    @staticmethod
+    def _copy_faiss(current: FAISS) -> FAISS:
+        """Independent copy to modify and swap in while searches keep using current"""
+        import faiss
+        
+        return FAISS(
+            embedding_function=current.embedding_function,
+            index=faiss.clone_index(current.index),
+            docstore=InMemoryDocstore(dict(current.docstore._dict)),
+            index_to_docstore_id=dict(current.index_to_docstore_id),
+            normalize_L2=current._normalize_L2,
+            distance_strategy=current.distance_strategy
         )
-        return splitter.create_documents(texts, metadatas=metadatas)
+    
+    def compact(self, alive_hashes: set, min_dead_fraction: float = COMPACTION_MIN_DEAD_FRACTION) -> int:
+        """
+        Drop the vectors of emails outside alive_hashes (expunged or past
+        retention) once they are at least min_dead_fraction of the index.
+        Stored vectors are kept as they are; nothing is re-embedded.
+        """
+        with self._attachment_lock:
+            current = self.vectorstore
+            if current is None or not alive_hashes:
+                return 0
+            if isinstance(current, FAISS):
+                metadata = [(doc_id, doc.metadata) for doc_id, doc in current.docstore._dict.items()]
+            else:
+                metadata = list(enumerate(current.documents_metadata()))
+            alive = [(key, meta) for key, meta in metadata if meta.get("email_hash") in alive_hashes]
+            n_dead = len(metadata) - len(alive)
+            if not n_dead or n_dead < min_dead_fraction * len(metadata):
+                return 0
+            
+            if isinstance(current, FAISS):
+                alive_ids = {key for key, _ in alive}
+                updated = self._copy_faiss(current)
+                updated.delete([key for key, _ in metadata if key not in alive_ids])
+                self.vectorstore = updated
+                self._save_vectorstore()
+            else:
+                rows = [key for key, _ in alive]
+                replace_directory(self.config.persist_dir, lambda path: current.write_subset(path, rows))
+                with file_lock(self.config.persist_dir, shared=True):
+                    self.vectorstore = self._load_persisted()
+            self.indexed_attachments = {meta["attachment_sha256"] for _, meta in alive if meta.get("attachment_sha256")}
+            METRICS.inc("email_rag_compacted_vectors_total", n_dead)
+            logger.info(f"🗜️ Compacted vectorstore: removed {n_dead}/{len(metadata)} vectors")
+            return n_dead
+    
+    def index_attachments_in_background(self, emails: List[Dict]) -> threading.Thread:
+        """Wait for pending extractions off the request path, then add their text to the index"""
+        def run():
+            try:
+                self.attachments.wait()
+                self.add_attachments(emails)
+            except Exception as e:
+                logger.error(f"Error indexing attachments: {e}")
+        
+        thread = threading.Thread(target=run, name="attachment-indexer", daemon=True)
+        thread.start()
+        return thread
     
     def _vectorstore_exists(self) -> bool:
         persist_path = Path(self.config.persist_dir)
@@ -167,8 +432,7 @@ class VectorStoreManager:
     
     def _save_vectorstore(self):
         try:
-            os.makedirs(self.config.persist_dir, exist_ok=True)
-            self.vectorstore.save_local(self.config.persist_dir)
+            replace_directory(self.config.persist_dir, self.vectorstore.save_local)
             logger.info("✓ Vectorstore saved")
         except Exception as e:
             logger.error(f"Error saving vectorstore: {e}")
@@ -186,15 +450,27 @@ class EmailRAGSequentialChain(Chain):
     embeddings: Any
     config: EmailRAGConfig = Field(default_factory=EmailRAGConfig)
     vectorstore_manager: Optional[VectorStoreManager] = None
+    reranker: Optional[Any] = None
     internal_memory: Optional[ConversationBufferMemory] = Field(default=None, exclude=True) 
+    fallback_llm: Optional[Any] = None
     
     # Email data
     all_emails: List[Dict] = Field(default_factory=list)
+    indexed_emails: List[Dict] = Field(default_factory=list)
     email_hashes: set = Field(default_factory=set)
     last_fetch_date: Optional[str] = None
+    thread_index: Optional[ThreadIndex] = None
+    thread_of_hash: Dict[str, str] = Field(default_factory=dict)
+    digest_store: Optional[EmailDigestStore] = None
+    attachments_indexed_for: Optional[str] = None  # fetch date whose attachments were queued for indexing
+    dead_hashes: set = Field(default_factory=set)  # expunged on the server, hidden until compaction removes them
+    near_duplicates: Optional[NearDuplicateDetector] = Field(default=None, exclude=True)  # kept for its signature cache
+    in_flight: int = Field(default=0, exclude=True)  # questions being answered right now
+    in_flight_lock: Any = Field(default_factory=threading.Lock, exclude=True)
     
     # Sequential chain components
     sequential_chain: Optional[SequentialChain] = None
+    dag_executor: Optional[DAGExecutor] = None
     
     class Config:
         arbitrary_types_allowed = True
@@ -209,6 +485,18 @@ class EmailRAGSequentialChain(Chain):
         if self.vectorstore_manager is None:
             self.vectorstore_manager = VectorStoreManager(self.config, self.embeddings)
         
+        if self.config.enable_rerank and self.reranker is None:
+            from reranker import CrossEncoderReranker
+            self.reranker = CrossEncoderReranker(
+                model_name=self.config.rerank_model,
+                top_n=self.config.rerank_top_n,
+                batch_size=self.config.rerank_batch_size,
+                budget_ms=self.config.rerank_budget_ms
+            )
+        
+        if self.config.fallback_model_name and self.fallback_llm is None:
+            self.fallback_llm = make_fallback_llm(self.config)
+        
         if self.config.enable_memory and self.internal_memory is None:
             self.internal_memory = ConversationBufferMemory(
                 memory_key="chat_history",
@@ -225,7 +513,7 @@ class EmailRAGSequentialChain(Chain):
     
     @property
     def output_keys(self):
-        return ["answer"]
+        return ["answer", "path"]
     
     def _build_sequential_chain(self):
         """Build the sequential chain with multiple stages"""
@@ -235,61 +523,46 @@ class EmailRAGSequentialChain(Chain):
         # ============ CHAIN 1: Context Resolution ============
         context_resolution_prompt = PromptTemplate(
             input_variables=["original_question", "chat_history"],
-            template="""You are resolving context references in a conversation about emails.
-
-Conversation History:
-{chat_history}
-
-Current Question: {original_question}
-
-Task: If the question contains words like "that", "this", "it", "same", "the link", rewrite it to be self-contained using information from the conversation history. Otherwise, return it as-is.
-
-Examples:
-- "give that link" -> "give the link from the license renewal email"
-- "what was in it?" -> "what was in the email about job opportunities"
-- "show me all emails" -> "show me all emails" (already clear)
-
-Resolved Question (be specific and clear):"""
+            template=CONTEXT_RESOLUTION_TEMPLATE
         )
         
         context_chain = LLMChain(
             llm=self.llm,
             prompt=context_resolution_prompt,
             output_key="resolved_question",
-            verbose=True
+            verbose=self.config.verbose
         )
         
         # ============ CHAIN 2: Query Analysis ============
         query_analysis_prompt = PromptTemplate(
             input_variables=["resolved_question"],
-            template="""Analyze this email query and determine the search strategy.
-
-Question: {resolved_question}
-
-Determine:
-1. SCOPE: Does user want ALL emails or just RELEVANT ones? **If the user asks "how many" or wants to count emails without specifying a topic, the scope is ALL.**
-2. SEARCH_TERMS: What keywords should we search for?
-3. NEEDS_COUNT: Does the user want to count something?
-4. INFO_TYPE: What information do they want? (senders/subjects/links/content/count)
-
-Respond in this format:
-SCOPE: [ALL or RELEVANT]
-SEARCH_TERMS: [comma-separated keywords]
-NEEDS_COUNT: [YES or NO]
-INFO_TYPE: [what they want]
-
-Analysis:"""
+            template=QUERY_ANALYSIS_TEMPLATE
         )
         
         analysis_chain = LLMChain(
             llm=self.llm,
             prompt=query_analysis_prompt,
             output_key="query_analysis",
-            verbose=True
+            verbose=self.config.verbose
         )
         
+        def resolve_question(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            # Resolution is the most optional LLM call; analysis and an answer must still fit after it
+            reserve_ms = self._reserve_ms("analysis", QUERY_ANALYSIS_TEMPLATE) + self._reserve_ms("answer", ANSWER_GENERATION_TEMPLATE)
+            if not self._llm_stage_fits("context_resolution", context_chain, inputs, then_ms=reserve_ms):
+                current_deadline().degrade("skip_resolution")
+                return {"resolved_question": inputs["original_question"]}
+            return {"resolved_question": self._run_llm_stage("context_resolution", context_chain, inputs)}
+        
+        def analyze_question(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            reserve_ms = self._reserve_ms("answer", ANSWER_GENERATION_TEMPLATE)
+            if not self._llm_stage_fits("analysis", analysis_chain, inputs, then_ms=reserve_ms):
+                current_deadline().degrade("skip_analysis")
+                return {"query_analysis": self._heuristic_analysis(inputs["resolved_question"])}
+            return {"query_analysis": self._run_llm_stage("analysis", analysis_chain, inputs)}
+        
         # ============ TRANSFORM: Email Retrieval ============
-        def retrieve_emails_transform(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        def retrieve_emails(inputs: Dict[str, Any]) -> Dict[str, Any]:
             """Custom transform to retrieve emails based on analysis"""
             logger.info("📧 Email Retrieval Transform")
             
@@ -302,9 +575,30 @@ Analysis:"""
             # Get emails
             emails = self._fetch_and_process_emails()
             if not emails:
-                return {"email_context": "No emails found.", "emails_retrieved": 0}
+                return {
+                    "retrieved_docs": None,
+                    "scope_used": analysis["scope"],
+                    "needs_count": analysis["needs_count"],
+                    "structured_answer": ""
+                }
+            
+            # Aggregate questions are answered from metadata, no retrieval needed
+            if self.config.structured_answers != "off" and (
+                analysis["scope"] == "ALL" or analysis["needs_count"] == "YES"
+            ):
+                structured_answer = EmailQueryEngine(self._live_emails(emails)).answer(resolved_question)
+                if structured_answer:
+                    logger.info("Answered from email metadata (structured query)")
+                    METRICS.inc("email_rag_structured_answers_total")
+                    return {
+                        "retrieved_docs": [],
+                        "scope_used": analysis["scope"],
+                        "needs_count": analysis["needs_count"],
+                        "structured_answer": structured_answer
+                    }
             
-            # Ensure vectorstore
+            # Ensure vectorstore (near-duplicates collapsed to one representative)
+            emails = self.indexed_emails or emails
             self._ensure_vectorstore(emails)
             
             # Retrieve based on scope
@@ -313,74 +607,313 @@ Analysis:"""
                 docs = self._get_all_unique_documents(emails)
             else:
                 logger.info("Retrieving RELEVANT emails")
-                k = min(len(emails), self.config.k_value if analysis["needs_count"] == "NO" else MAX_CONTEXT_EMAILS)
-                docs = self._get_semantic_documents(resolved_question, k)
-            
-            # Build email context
-            email_context = self._build_email_context(docs)
+                speculative_docs = inputs.get("speculative_docs")
+                if speculative_docs is not None and analysis["needs_count"] == "NO":
+                    logger.info("Using speculative retrieval results")
+                    METRICS.inc("email_rag_speculation_total", result="used")
+                    docs = speculative_docs
+                else:
+                    docs = self._retrieve_relevant(resolved_question, emails, analysis["needs_count"])
             
             return {
-                "email_context": email_context,
-                "emails_retrieved": len(docs),
-                "scope_used": analysis["scope"]
+                "retrieved_docs": docs,
+                "scope_used": analysis["scope"],
+                "needs_count": analysis["needs_count"],
+                "structured_answer": ""
             }
         
+        def retrieve_emails_transform(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            with METRICS.span("retrieval") as span:
+                result = retrieve_emails(inputs)
+                span.set(
+                    retrieved_docs=len(result["retrieved_docs"] or []),
+                    scope=result["scope_used"],
+                    structured=bool(result["structured_answer"])
+                )
+                return result
+        
         retrieval_transform = TransformChain(
             input_variables=["resolved_question", "query_analysis"],
-            output_variables=["email_context", "emails_retrieved", "scope_used"],
+            output_variables=["retrieved_docs", "scope_used", "needs_count", "structured_answer"],
             transform=retrieve_emails_transform
         )
         
+        # ============ TRANSFORM: Rerank + Context Assembly ============
+        def rerank_and_build_context_transform(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            """Optionally rerank retrieved docs, then build the prompt context"""
+            docs = inputs["retrieved_docs"]
+            if docs is None:
+                return {"email_context": "No emails found.", "emails_retrieved": 0}
+            
+            with METRICS.span("context_assembly") as span:
+                relevant_lookup = inputs["scope_used"] != "ALL" and inputs["needs_count"] == "NO"
+                # Counting and ALL-scope answers need every email, so only rerank RELEVANT lookups
+                if self.reranker is not None and relevant_lookup:
+                    reserve_ms = self._reserve_ms("answer", ANSWER_GENERATION_TEMPLATE)
+                    if current_deadline().allows(self.config.rerank_budget_ms + reserve_ms):
+                        docs = self._rerank_documents(inputs["resolved_question"], docs)
+                    else:
+                        current_deadline().degrade("skip_rerank")
+                
+                email_context = self._build_email_context(docs)
+                if relevant_lookup:
+                    docs, email_context = self._fit_context_to_deadline(docs, email_context, inputs)
+                span.set(retrieved_docs=len(docs), context_tokens=estimate_tokens(email_context))
+            return {
+                "email_context": email_context,
+                "emails_retrieved": len(docs)
+            }
+        
+        context_transform = TransformChain(
+            input_variables=["resolved_question", "retrieved_docs", "scope_used", "needs_count"],
+            output_variables=["email_context", "emails_retrieved"],
+            transform=rerank_and_build_context_transform
+        )
+        
         # ============ CHAIN 3: Answer Generation ============
         answer_generation_prompt = PromptTemplate(
             input_variables=["original_question", "resolved_question", "email_context", "emails_retrieved", "scope_used"],
-            template="""You are an intelligent email assistant. Answer the user's question based on the emails provided.
-
-Original Question: {original_question}
-Clarified Question: {resolved_question}
-Number of Emails Retrieved: {emails_retrieved}
-Search Scope: {scope_used}
-
-EMAIL DATA:
-{email_context}
-
-INSTRUCTIONS:
-1. Answer the user's ORIGINAL question directly and naturally
-2. Use the email data above to provide accurate, specific information
-3. If they ask for links, extract actual URLs from the emails
-4. If they ask for contact details, extract actual emails/phone numbers
-5. If counting, count all relevant emails shown above
-6. Be conversational and helpful
-7. Don't say "I don't have access" - the emails are right above
-
-YOUR ANSWER:"""
+            template=ANSWER_GENERATION_TEMPLATE
         )
         
         answer_chain = LLMChain(
             llm=self.llm,
             prompt=answer_generation_prompt,
             output_key="final_answer",
-            verbose=True
+            verbose=self.config.verbose
+        )
+        
+        phrase_prompt = PromptTemplate(
+            input_variables=["original_question", "structured_answer"],
+            template=PHRASE_TEMPLATE
+        )
+        
+        phrase_chain = LLMChain(
+            llm=self.llm,
+            prompt=phrase_prompt,
+            output_key="final_answer",
+            verbose=self.config.verbose
+        )
+        
+        fallback_answer_chain = None
+        if self.fallback_llm is not None:
+            fallback_answer_chain = LLMChain(
+                llm=self.fallback_llm,
+                prompt=answer_generation_prompt,
+                output_key="final_answer",
+                verbose=self.config.verbose
+            )
+        
+        def answer_transform(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            """Use the structured answer when there is one, otherwise generate from the email context"""
+            structured_answer = inputs["structured_answer"]
+            if not structured_answer:
+                if self._llm_stage_fits("answer", answer_chain, inputs):
+                    return {"final_answer": self._run_llm_stage("answer", answer_chain, inputs)}
+                if fallback_answer_chain is not None and self._llm_stage_fits("answer_fallback", fallback_answer_chain, inputs):
+                    current_deadline().degrade("fallback_model", self.config.fallback_model_name)
+                    return {"final_answer": self._run_llm_stage("answer_fallback", fallback_answer_chain, inputs)}
+                current_deadline().degrade("retrieval_only")
+                with METRICS.span("answer", path="retrieval_only"):
+                    return {"final_answer": self._retrieval_only_answer(inputs["retrieved_docs"])}
+            if self.config.structured_answers == "phrase":
+                if self._llm_stage_fits("answer", phrase_chain, inputs):
+                    return {"final_answer": self._run_llm_stage("answer", phrase_chain, inputs)}
+                current_deadline().degrade("skip_phrasing")
+            with METRICS.span("answer", path="structured"):
+                return {"final_answer": structured_answer}
+        
+        answer_stage = TransformChain(
+            input_variables=["original_question", "resolved_question", "email_context", "emails_retrieved", "scope_used", "structured_answer", "retrieved_docs"],
+            output_variables=["final_answer"],
+            transform=answer_transform
         )
         
         # ============ BUILD SEQUENTIAL CHAIN ============
         self.sequential_chain = SequentialChain(
             chains=[
-                context_chain,
-                analysis_chain,
+                self._transform_stage(context_chain, resolve_question),
+                self._transform_stage(analysis_chain, analyze_question),
                 retrieval_transform,
-                answer_chain
+                context_transform,
+                answer_stage
             ],
             input_variables=["original_question", "chat_history"],
             output_variables=["final_answer", "resolved_question", "query_analysis", "emails_retrieved"],
-            verbose=True,
+            verbose=self.config.verbose,
             memory=None
         )
         
         logger.info("✓ Sequential Chain built successfully")
+        
+        if self.config.executor != "dag":
+            return
+        
+        # ============ DAG: same stages, no-op skipping + speculative retrieval ============
+        def speculative_retrieval(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            """Retrieve for the raw question while resolution and analysis run"""
+            with METRICS.span("speculative_retrieval") as span:
+                try:
+                    emails = self._fetch_and_process_emails()
+                    emails = self.indexed_emails or emails
+                    if not emails or not self._ensure_vectorstore(emails):
+                        return {"speculative_docs": None}
+                    docs = self._retrieve_relevant(inputs["original_question"], emails, "NO")
+                    span.set(retrieved_docs=len(docs))
+                    return {"speculative_docs": docs}
+                except Exception as e:
+                    logger.warning(f"Speculative retrieval failed: {e}")
+                    return {"speculative_docs": None}
+        
+        def retrieve_after_speculation(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            # Speculation searched with the raw question; it only stands if resolution kept it
+            if (
+                inputs["speculative_docs"] is not None
+                and inputs["resolved_question"].strip() != inputs["original_question"].strip()
+            ):
+                METRICS.inc("email_rag_speculation_total", result="discarded")
+                inputs = {**inputs, "speculative_docs": None}
+            return retrieve_emails_transform(inputs)
+        
+        def skip_resolution(inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            # With no history there is nothing to resolve against
+            if not (inputs["chat_history"] or "").strip():
+                return {"resolved_question": inputs["original_question"]}
+            return None
+        
+        self.dag_executor = DAGExecutor(
+            stages=[
+                Stage(
+                    "context_resolution",
+                    resolve_question,
+                    inputs=["original_question", "chat_history"],
+                    outputs=["resolved_question"],
+                    skip=skip_resolution
+                ),
+                Stage(
+                    "speculative_retrieval",
+                    speculative_retrieval,
+                    inputs=["original_question"],
+                    outputs=["speculative_docs"]
+                ),
+                Stage(
+                    "analysis",
+                    analyze_question,
+                    inputs=["resolved_question"],
+                    outputs=["query_analysis"]
+                ),
+                Stage(
+                    "retrieval",
+                    retrieve_after_speculation,
+                    inputs=["original_question", "resolved_question", "query_analysis", "speculative_docs"],
+                    outputs=["retrieved_docs", "scope_used", "needs_count", "structured_answer"]
+                ),
+                Stage(
+                    "context_assembly",
+                    rerank_and_build_context_transform,
+                    inputs=context_transform.input_variables,
+                    outputs=context_transform.output_variables
+                ),
+                Stage(
+                    "answer",
+                    answer_transform,
+                    inputs=answer_stage.input_variables,
+                    outputs=answer_stage.output_variables
+                ),
+            ],
+            input_variables=["original_question", "chat_history"]
+        )
+        logger.info("✓ DAG executor built")
+    
+    def _run_llm_stage(self, stage: str, llm_chain: LLMChain, inputs: Dict[str, Any]) -> str:
+        """Run an LLMChain inside a span that records its prompt and completion tokens"""
+        prompt_inputs = {k: inputs[k] for k in llm_chain.input_keys}
+        with METRICS.span(stage) as span:
+            output = llm_chain.predict(**prompt_inputs)
+            span.set(
+                prompt_tokens=estimate_tokens(llm_chain.prompt.format(**prompt_inputs)),
+                completion_tokens=estimate_tokens(output)
+            )
+        STAGE_COSTS.observe(stage, span.duration_ms, span.attrs["prompt_tokens"], span.attrs["completion_tokens"])
+        return output
+    
+    @staticmethod
+    def _transform_stage(llm_chain: LLMChain, transform) -> TransformChain:
+        """Wrap a stage function around an LLMChain so the SequentialChain can run it"""
+        return TransformChain(
+            input_variables=llm_chain.input_keys,
+            output_variables=[llm_chain.output_key],
+            transform=transform
+        )
+    
+    @staticmethod
+    def _llm_stage_fits(stage: str, llm_chain: LLMChain, inputs: Dict[str, Any], then_ms: float = 0.0) -> bool:
+        """Whether this LLM stage, and then_ms of work after it, fit in the request's remaining budget"""
+        d = current_deadline()
+        if d.unlimited:
+            return True
+        prompt = llm_chain.prompt.format(**{k: inputs[k] for k in llm_chain.input_keys})
+        return d.allows(STAGE_COSTS.estimate_ms(stage, estimate_tokens(prompt)) + then_ms)
+    
+    @staticmethod
+    def _reserve_ms(stage: str, template: str) -> float:
+        """Time to keep for a later stage, assuming its smallest useful prompt"""
+        return STAGE_COSTS.estimate_ms(stage, estimate_tokens(template) + MIN_DEGRADED_CONTEXT_TOKENS)
+    
+    def _fit_context_to_deadline(self, docs, email_context: str, inputs: Dict[str, Any]):
+        """Drop the lowest-ranked documents until the answer prompt fits the remaining budget"""
+        d = current_deadline()
+        if d.unlimited or len(docs) <= 1:
+            return docs, email_context
+        fixed_tokens = estimate_tokens(ANSWER_GENERATION_TEMPLATE) + 2 * estimate_tokens(inputs["resolved_question"])
+        affordable = STAGE_COSTS.affordable_prompt_tokens("answer", d.remaining_ms()) - fixed_tokens
+        if estimate_tokens(email_context) <= affordable or affordable < MIN_DEGRADED_CONTEXT_TOKENS:
+            # Fits as is, or nothing worth generating from would fit; the answer stage decides
+            return docs, email_context
+        kept = list(docs)
+        while len(kept) > 1 and estimate_tokens(email_context) > affordable:
+            kept.pop()
+            email_context = self._build_email_context(kept)
+        d.degrade("shrink_context", f"k={len(kept)}/{len(docs)}")
+        return kept, email_context
+    
+    @staticmethod
+    def _heuristic_analysis(question: str) -> str:
+        """Keyword stand-in for the analysis LLM call, in the same format _parse_analysis reads"""
+        q = question.lower()
+        needs_count = bool(re.search(r"\b(how many|count|number of)\b", q))
+        scope_all = bool(re.search(r"\b(all|every|list)\b.*\b(emails?|mails?|messages?)\b", q)) or (
+            needs_count and re.search(r"\b(emails?|mails?|messages?)\b\s*(did i (get|receive)|today|so far)?\W*$", q)
+        )
+        return (
+            f"SCOPE: {'ALL' if scope_all else 'RELEVANT'}\n"
+            f"SEARCH_TERMS: {', '.join(re.findall(r'[a-z0-9]{4,}', q))}\n"
+            f"NEEDS_COUNT: {'YES' if needs_count else 'NO'}\n"
+            f"INFO_TYPE: general"
+        )
+    
+    @staticmethod
+    def _retrieval_only_answer(docs) -> str:
+        """The answer when no generation fits the budget: the retrieved emails themselves"""
+        if not docs:
+            return "No emails found."
+        lines = [f"I couldn't write a full answer in time. The most relevant emails ({len(docs)}):"]
+        for i, doc in enumerate(docs, 1):
+            meta = doc.metadata
+            lines.append(f"{i}. {meta.get('subject') or '(no subject)'} - {meta.get('from', '')} ({meta.get('date', '')})")
+        return "\n".join(lines)
     
     def _call(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
         """Execute the sequential chain"""
+        with self.in_flight_lock:
+            self.in_flight += 1
+        try:
+            return self._run_sequential(inputs)
+        finally:
+            with self.in_flight_lock:
+                self.in_flight -= 1
+    
+    def _run_sequential(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
         try:
             question = inputs["question"]
             logger.info(f"\n{'='*80}")
@@ -396,11 +929,17 @@ YOUR ANSWER:"""
                 except:
                     chat_history = ""
             
-            # Run sequential chain
-            result = self.sequential_chain({
-                "original_question": question,
-                "chat_history": chat_history
-            })
+            # Run sequential chain; every stage span lands in one trace log line
+            budget_ms = inputs.get("budget_ms", self.config.budget_ms)
+            with deadline(budget_ms) as request_deadline, METRICS.trace("email_chain", budget_ms=budget_ms):
+                chain_inputs = {
+                    "original_question": question,
+                    "chat_history": chat_history
+                }
+                if self.dag_executor is not None:
+                    result = self.dag_executor.run(chain_inputs)
+                else:
+                    result = self.sequential_chain(chain_inputs)
             
             answer = result.get("final_answer", "No answer generated.")
             
@@ -415,13 +954,14 @@ YOUR ANSWER:"""
             logger.info(f"✅ Sequential Chain completed")
             logger.info(f"   Resolved: {result.get('resolved_question', 'N/A')}")
             logger.info(f"   Emails Retrieved: {result.get('emails_retrieved', 0)}")
+            logger.info(f"   Path: {', '.join(request_deadline.path)}")
             logger.info(f"{'='*80}\n")
             
-            return {"answer": answer}
+            return {"answer": answer, "path": request_deadline.path}
             
         except Exception as e:
             logger.error(f"Error in sequential chain execution: {e}", exc_info=True)
-            return {"answer": f"An error occurred: {str(e)}"}
+            return {"answer": f"An error occurred: {str(e)}", "path": ["error"]}
     
     def _parse_analysis(self, analysis_text: str) -> Dict[str, str]:
         """Parse LLM analysis output"""
@@ -458,44 +998,137 @@ YOUR ANSWER:"""
         
         if self.last_fetch_date == today_str and self.all_emails:
             logger.info(f"Using cached emails ({len(self.all_emails)} emails)")
+            METRICS.cache_hit("emails")
             return self.all_emails
         
+        METRICS.cache_hit("emails", hit=False)
+        
         if os.path.exists(data_fname):
             try:
                 with open(data_fname, "r", encoding="utf-8") as f:
                     emails = json.load(f)
-                    logger.info(f"✓ Loaded {len(emails)} emails from file")
-                    self.all_emails = emails
-                    self.last_fetch_date = today_str
-                    return emails
+                logger.info(f"✓ Loaded {len(emails)} emails from file")
+                if any("clean_body" not in email for email in emails):
+                    # Files written before ingest-time cleaning: clean once and persist
+                    for email in emails:
+                        EmailProcessor.clean_body(email)
+                    with file_lock(data_fname):
+                        atomic_write_json(data_fname, emails, ensure_ascii=False, indent=2)
+                self._set_emails(emails, today_str)
+                return emails
             except Exception as e:
                 logger.error(f"Error loading emails: {e}")
         
         logger.info(f"📧 Fetching emails for {today_str}...")
         try:
-            emails = fetch_emails_since(today)
+            emails = fetch_emails_since(today, account=self.config.imap_account, data_dir=self.config.data_dir)
             if not emails:
                 return []
             
             for email in emails:
                 email["date"] = EmailProcessor.normalize_date(email.get("date", ""))
             
-            with open(data_fname, "w", encoding="utf-8") as f:
-                json.dump(emails, f, ensure_ascii=False, indent=2)
+            self._set_emails(emails, today_str)
+            
+            with file_lock(data_fname):
+                atomic_write_json(data_fname, emails, ensure_ascii=False, indent=2)
             
-            self.all_emails = emails
-            self.last_fetch_date = today_str
             return emails
         except Exception as e:
             logger.error(f"Error fetching emails: {e}")
             return []
     
+    def _set_emails(self, emails: List[Dict], fetch_date: str):
+        """Cache the day's emails, collapse near-duplicates and rebuild the thread index"""
+        self.all_emails = emails
+        self.last_fetch_date = fetch_date
+        # Covers emails loaded from disk whose attachments were never (or only partly) extracted
+        self.vectorstore_manager.attachments.submit_missing(emails)
+        self.dead_hashes = self._tombstoned_hashes()
+        
+        if self.config.collapse_near_duplicates:
+            self.indexed_emails = self._near_duplicate_detector().collapse(emails)
+        else:
+            self.indexed_emails = list(emails)
+        
+        self.thread_index = ThreadIndex(self.indexed_emails)
+        self.thread_of_hash = {
+            EmailProcessor.generate_email_hash(email): email["thread_id"]
+            for email in self.indexed_emails
+        }
+        
+        # Compact per-email documents for ALL-scope context, persisted next to the day's emails
+        chunker = self.vectorstore_manager.chunker
+        self.digest_store = EmailDigestStore.load_or_build(
+            os.path.join(self.config.data_dir, f"digests_{fetch_date}.json"),
+            self.indexed_emails,
+            paragraphs_fn=lambda e: chunker.paragraphs(chunker.clean_body(EmailProcessor.clean_body(e))),
+            hash_fn=EmailProcessor.generate_email_hash
+        )
+    
+    def release_email_cache(self) -> bool:
+        """
+        Forget the cached day of emails so memory can be reclaimed; the next
+        question reloads it from data_dir. Refused while a question is being
+        answered, since the stages read this state without locking.
+        """
+        with self.in_flight_lock:
+            if self.in_flight or not self.all_emails:
+                return False
+            self.all_emails = []
+            self.indexed_emails = []
+            self.digest_store = None
+            self.thread_index = None
+            self.thread_of_hash = {}
+            self.near_duplicates = None
+            self.last_fetch_date = None
+            return True
+    
+    @property
+    def index_version(self) -> str:
+        """Changes whenever answers may change: new day's emails, rebuilt/extended/compacted index"""
+        return f"{self.last_fetch_date}:{self.vectorstore_manager.version}"
+    
+    def _live_emails(self, emails: List[Dict]) -> List[Dict]:
+        """emails without the tombstoned ones, which stay in the cached day until it is reloaded"""
+        if not self.dead_hashes:
+            return emails
+        return [e for e in emails if EmailProcessor.generate_email_hash(e) not in self.dead_hashes]
+    
+    def _tombstoned_hashes(self) -> set:
+        return {
+            EmailProcessor.generate_email_hash(record)
+            for record in TombstoneStore(self.config.data_dir).records()
+        }
+    
+    def compact(self, policy: Optional[RetentionPolicy] = None) -> Dict[str, int]:
+        """Apply retention to data_dir, then drop dead vectors from the index (run by retention.Compactor)"""
+        stats = apply_retention(self.config.data_dir, policy)
+        self.dead_hashes = self._tombstoned_hashes()
+        if self.last_fetch_date and (stats["emails_removed"] or any(
+            EmailProcessor.generate_email_hash(e) in self.dead_hashes for e in self.all_emails
+        )):
+            self.last_fetch_date = None  # cached emails may include expired or dead ones; reload them from disk
+        alive = {EmailProcessor.generate_email_hash(e) for e in iter_retained_emails(self.config.data_dir)}
+        stats["vectors_removed"] = self.vectorstore_manager.compact(alive - self.dead_hashes)
+        return stats
+    
+    def _near_duplicate_detector(self) -> NearDuplicateDetector:
+        if self.near_duplicates is None:
+            self.near_duplicates = near_duplicate_detector(self.config, self.vectorstore_manager.chunker)
+        return self.near_duplicates
+    
     def _ensure_vectorstore(self, emails: List[Dict]) -> bool:
         """Ensure vectorstore is ready"""
         try:
+            METRICS.cache_hit("vectorstore", hit=self.vectorstore_manager.vectorstore is not None)
             if self.vectorstore_manager.vectorstore is None:
                 self.vectorstore_manager.load_or_create(emails)
-            return self.vectorstore_manager.vectorstore is not None
+            ready = self.vectorstore_manager.vectorstore is not None
+            if ready and self.attachments_indexed_for != self.last_fetch_date:
+                self.attachments_indexed_for = self.last_fetch_date
+                self.vectorstore_manager.index_attachments_in_background(emails)
+            return ready
         except Exception as e:
             logger.error(f"Error ensuring vectorstore: {e}")
             return False
@@ -503,76 +1136,203 @@ YOUR ANSWER:"""
     def _get_all_unique_documents(self, emails: List[Dict]):
         """Get all unique email documents"""
         try:
-            all_docs = self.vectorstore_manager._prepare_documents(emails)
+            if self.digest_store is not None:
+                # Digests are precomputed newest first, so this is just a slice (padded for hidden ones)
+                docs = self.digest_store.documents(0, MAX_CONTEXT_EMAILS + len(self.dead_hashes))
+                return [d for d in docs if d.metadata.get("email_hash") not in self.dead_hashes][:MAX_CONTEXT_EMAILS]
+            all_docs = self.vectorstore_manager._prepare_documents(self._live_emails(emails))
             return self._deduplicate_documents(all_docs)[:MAX_CONTEXT_EMAILS]
         except Exception as e:
             logger.error(f"Error getting all documents: {e}")
             return []
     
+    def _retrieve_relevant(self, question: str, emails: List[Dict], needs_count: str):
+        """Semantic search for a RELEVANT-scope question, collapsed to threads"""
+        k = min(len(emails), self.config.k_value if needs_count == "NO" else MAX_CONTEXT_EMAILS)
+        docs = self._get_semantic_documents(question, k)
+        if self.config.thread_mode:
+            docs = self._collapse_to_threads(docs)
+        return docs
+    
     def _get_semantic_documents(self, question: str, k: int):
         """Get semantically relevant documents"""
         try:
-            retriever = self.vectorstore_manager.vectorstore.as_retriever(
-                search_kwargs={"k": k}
-            )
-            relevant_docs = retriever.get_relevant_documents(question)
-            return self._deduplicate_documents(relevant_docs)
+            relevant_docs = self.vectorstore_manager.vectorstore.similarity_search(question, k=k)
+            if self.dead_hashes:
+                relevant_docs = [d for d in relevant_docs if d.metadata.get("email_hash") not in self.dead_hashes]
+            return self._deduplicate_documents(relevant_docs, merge_chunks=True)
         except Exception as e:
             logger.error(f"Error in semantic search: {e}")
             return []
     
-    def _deduplicate_documents(self, documents):
-        """Remove duplicate documents"""
-        seen_hashes = set()
-        unique_docs = []
+    def _rerank_documents(self, question: str, documents):
+        """Rerank candidates with the cross-encoder and report the prompt savings"""
+        try:
+            before_tokens = estimate_tokens(self._build_email_context(documents))
+            kept, stats = self.reranker.rerank(question, documents)
+            after_tokens = estimate_tokens(self._build_email_context(kept))
+            logger.info(
+                f"🔎 Reranked {stats['scored']}/{len(documents)} docs in {stats['elapsed_ms']:.1f} ms "
+                f"(budget {self.config.rerank_budget_ms:.0f} ms{', exhausted' if stats['budget_hit'] else ''}); "
+                f"kept {len(kept)}, prompt ~{before_tokens} -> ~{after_tokens} tokens "
+                f"(saved ~{before_tokens - after_tokens} prefill tokens)"
+            )
+            return kept
+        except Exception as e:
+            logger.error(f"Error reranking documents: {e}")
+            return documents
+    
+    def _deduplicate_documents(self, documents, merge_chunks: bool = False):
+        """
+        Keep one document per email. With merge_chunks, every retrieved chunk of
+        an email is folded into that document instead of being dropped.
+        """
+        merged = {}
         
         for doc in documents:
             email_hash = doc.metadata.get("email_hash")
-            if email_hash and email_hash not in seen_hashes:
-                seen_hashes.add(email_hash)
-                unique_docs.append(doc)
+            if not email_hash:
+                continue
+            if email_hash not in merged:
+                merged[email_hash] = Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+            elif merge_chunks and doc.page_content not in merged[email_hash].page_content:
+                merged[email_hash].page_content += f"\n\n{doc.page_content}"
+        
+        return list(merged.values())
+    
+    def _collapse_to_threads(self, documents):
+        """Replace retrieved chunks with the conversations they belong to, in rank order"""
+        if self.thread_index is None:
+            return documents
+        
+        thread_ids = []
+        attachment_chunks = {}
+        for doc in documents:
+            thread_id = doc.metadata.get("thread_id") or self.thread_of_hash.get(doc.metadata.get("email_hash"))
+            if thread_id and thread_id not in thread_ids and self.thread_index.get(thread_id):
+                thread_ids.append(thread_id)
+            if thread_id and doc.metadata.get("attachment"):
+                # Thread documents are rebuilt from bodies; carry retrieved attachment text over
+                attachment_chunks.setdefault(thread_id, []).append(doc.page_content)
+        
+        return self._thread_documents(thread_ids, attachment_chunks) if thread_ids else documents
+    
+    def _thread_documents(self, thread_ids: List[str], attachment_chunks: Optional[Dict[str, List[str]]] = None):
+        """Build one document per thread with every message in date order, quoted history stripped"""
+        chunker = self.vectorstore_manager.chunker
+        documents = []
         
-        return unique_docs
+        for thread_id in thread_ids:
+            members = self.thread_index.get(thread_id)
+            latest = self.thread_index.latest(thread_id)
+            parts = []
+            for email in members:
+                body = chunker.clean_body(EmailProcessor.clean_body(email))
+                if len(body) > MAX_THREAD_MESSAGE_CHARS:
+                    body = body[:MAX_THREAD_MESSAGE_CHARS] + " ... (truncated)"
+                header = f"[{email.get('date', '')}] {email.get('from', '')}"
+                parts.append(f"{header}:\n{body}" if len(members) > 1 else body)
+            parts.extend((attachment_chunks or {}).get(thread_id, []))
+            
+            documents.append(Document(
+                page_content="\n\n".join(parts),
+                metadata={
+                    "email_hash": EmailProcessor.generate_email_hash(latest),
+                    "thread_id": thread_id,
+                    "thread_size": len(members),
+                    "email_count": sum(email.get("duplicate_count", 1) for email in members),
+                    "from": ", ".join(self.thread_index.participants(thread_id)),
+                    "sender_email": latest.get("sender_email", ""),
+                    "date": latest.get("date", ""),
+                    "subject": self.thread_index.subject(thread_id)
+                }
+            ))
+        
+        return documents
     
     def _build_email_context(self, documents) -> str:
         """Build formatted email context for LLM"""
         today_str = datetime.date.today().isoformat()
         
+        total_emails = sum(doc.metadata.get("email_count", 1) for doc in documents)
+        
         context = f"Today's date: {today_str}\n"
-        context += f"Total emails: {len(documents)}\n\n"
+        context += f"Total emails: {total_emails}\n\n"
         context += "=" * 80 + "\n\n"
         
         for i, doc in enumerate(documents, 1):
-            context += f"EMAIL #{i}:\n"
-            context += f"{doc.page_content}\n"
+            thread_size = doc.metadata.get("thread_size", 1)
+            if thread_size > 1:
+                context += f"THREAD #{i} ({thread_size} emails):\n"
+            else:
+                context += f"EMAIL #{i}:\n"
+            context += f"{self._format_document(doc)}\n"
             context += "=" * 80 + "\n\n"
         
         return context
     
+    @staticmethod
+    def _format_document(doc) -> str:
+        """Render a chunk with its headers, which are kept in metadata rather than embedded"""
+        meta = doc.metadata
+        header = (
+            f"From: {meta.get('from', '')}\n"
+            f"Sender Email: {meta.get('sender_email', '')}\n"
+            f"Date: {meta.get('date', '')}\n"
+            f"Subject: {meta.get('subject', '')}\n"
+        )
+        if meta.get("email_count", 1) > meta.get("thread_size", 1):
+            header += f"Near-duplicate copies received: {meta['email_count']}\n"
+        return f"{header}\n{doc.page_content}"
+    
     def clear_memory(self):
         """Clear conversation memory"""
         if self.internal_memory:
             self.internal_memory.clear()
             logger.info("✓ Memory cleared")
 
-def make_email_chain(config: Optional[EmailRAGConfig] = None) -> EmailRAGSequentialChain:
-    """Factory function to create Email RAG Sequential Chain"""
+def make_models(config: Optional[EmailRAGConfig] = None):
+    """Load the (llm, embeddings) pair; one pair can back many chains"""
+    if config is None:
+        config = EmailRAGConfig()
+    logger.info(f"LLM: {config.model_name}")
+    logger.info(f"Embeddings: {config.embedding_model}")
+    return make_llm(config), SentenceTransformerEmbeddings(model_name=config.embedding_model)
+
+_fallback_llms: Dict[str, Any] = {}
+_fallback_llms_lock = threading.Lock()
+
+def make_fallback_llm(config: EmailRAGConfig):
+    """The smaller model used when the main one won't answer in budget; loaded once per model name"""
+    with _fallback_llms_lock:
+        if config.fallback_model_name not in _fallback_llms:
+            logger.info(f"Fallback LLM: {config.fallback_model_name}")
+            _fallback_llms[config.fallback_model_name] = make_llm(replace(config, model_name=config.fallback_model_name))
+        return _fallback_llms[config.fallback_model_name]
+
+def fallback_llms() -> Dict[str, Any]:
+    """Fallback LLMs loaded so far, by model name (for memory accounting)"""
+    with _fallback_llms_lock:
+        return dict(_fallback_llms)
+
+def make_email_chain(
+    config: Optional[EmailRAGConfig] = None,
+    llm: Optional[Any] = None,
+    embeddings: Optional[Any] = None
+) -> EmailRAGSequentialChain:
+    """Factory function to create Email RAG Sequential Chain; pass llm/embeddings to share loaded models"""
     if config is None:
         config = EmailRAGConfig()
     
     try:
         logger.info(f"Initializing Sequential Email RAG Chain...")
-        logger.info(f"LLM: {config.model_name}")
-        logger.info(f"Embeddings: {config.embedding_model}")
         logger.info(f"Memory: {config.enable_memory}")
         
-        llm = GPT4All(
-            model=config.model_name,
-            allow_download=True,
-            max_tokens=config.max_tokens
-        )
-        
-        embeddings = SentenceTransformerEmbeddings(model_name=config.embedding_model)
+        logger.info(f"LLM: {config.model_name}{' (shared)' if llm is not None else ''}")
+        if llm is None:
+            llm = make_llm(config)
+        if embeddings is None:
+            embeddings = SentenceTransformerEmbeddings(model_name=config.embedding_model)
         
         chain = EmailRAGSequentialChain(
             llm=llm,
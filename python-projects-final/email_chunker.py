@@ -0,0 +1,165 @@
+# email_chunker.py
+import re
+import hashlib
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Tuple
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger(__name__)
+
+# Lines that start a quoted reply/forward history; everything below is dropped
+REPLY_HEADER_PATTERNS = [
+    re.compile(r"^On\b.{0,200}\bwrote:\s*$", re.IGNORECASE),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+    re.compile(r"^From:\s.+\s*$", re.IGNORECASE),
+]
+# Outlook-style quote blocks only count when the next line looks like a header too
+OUTLOOK_FOLLOWUP = re.compile(r"^(Sent|Date|To|Subject):\s", re.IGNORECASE)
+
+SIGNATURE_DELIMITERS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^Sent from my\b", re.IGNORECASE),
+    re.compile(r"^Get Outlook for\b", re.IGNORECASE),
+]
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+DEFAULT_BOILERPLATE_MIN_COUNT = 2
+
+
+class EmailChunker:
+    """
+    Email-aware chunking:
+    1. strips quoted reply history and signatures
+    2. drops boilerplate paragraphs (footers) already seen in another email of the corpus
+    3. packs the remaining paragraphs into chunks of up to chunk_size characters
+    Headers stay in metadata; page_content only carries body text.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int,
+        boilerplate_min_count: int = DEFAULT_BOILERPLATE_MIN_COUNT
+    ):
+        self.chunk_size = chunk_size
+        self.boilerplate_min_count = boilerplate_min_count
+        # Only used for single paragraphs that are larger than a chunk
+        self._fallback_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+
+    @staticmethod
+    def strip_quoted(text: str) -> str:
+        lines = text.splitlines()
+        kept = []
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped.startswith(">"):
+                continue
+            next_line = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            # Clients often wrap "On <date>, <name> wrote:" over two lines
+            if stripped.startswith("On ") and next_line.endswith("wrote:"):
+                break
+            if any(p.match(stripped) for p in REPLY_HEADER_PATTERNS):
+                if not stripped.lower().startswith("from:"):
+                    break
+                if OUTLOOK_FOLLOWUP.match(next_line):
+                    break
+            kept.append(line)
+        return "\n".join(kept).strip()
+
+    @staticmethod
+    def strip_signature(text: str) -> str:
+        lines = text.splitlines()
+        for i, line in enumerate(lines):
+            if any(p.match(line.strip()) for p in SIGNATURE_DELIMITERS):
+                return "\n".join(lines[:i]).strip()
+        return text.strip()
+
+    @staticmethod
+    def paragraphs(text: str) -> List[str]:
+        # HTML-derived text has one text node per line and no blank lines
+        parts = PARAGRAPH_BREAK.split(text) if PARAGRAPH_BREAK.search(text) else text.splitlines()
+        return [p.strip() for p in parts if p.strip()]
+
+    @staticmethod
+    def paragraph_hash(paragraph: str) -> str:
+        # Normalize case, whitespace and digits so dated/numbered footers hash the same
+        normalized = re.sub(r"\d", "0", re.sub(r"\s+", " ", paragraph.lower())).strip()
+        return hashlib.md5(normalized.encode()).hexdigest()
+
+    def clean_body(self, body: str) -> str:
+        return self.strip_signature(self.strip_quoted(body or ""))
+
+    def chunk_corpus(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Document]:
+        """Chunk (body, metadata) pairs; bodies should already be HTML-cleaned"""
+        bodies = [self.paragraphs(self.clean_body(body)) for body, _ in items]
+
+        # Count in how many emails each paragraph occurs
+        occurrences = Counter()
+        for paras in bodies:
+            occurrences.update({self.paragraph_hash(p) for p in paras})
+
+        seen_boilerplate = set()
+        documents = []
+        dropped = 0
+        for paras, (_, metadata) in zip(bodies, items):
+            kept = []
+            for p in paras:
+                h = self.paragraph_hash(p)
+                if occurrences[h] >= self.boilerplate_min_count:
+                    if h in seen_boilerplate:
+                        dropped += 1
+                        continue
+                    seen_boilerplate.add(h)
+                kept.append(p)
+
+            chunks = self._pack(kept) or [metadata.get("subject", "") or "(no content)"]
+            for i, chunk in enumerate(chunks):
+                documents.append(Document(
+                    page_content=chunk,
+                    metadata={**metadata, "chunk_index": i}
+                ))
+
+        logger.info(
+            f"✓ Chunked {len(items)} emails into {len(documents)} chunks "
+            f"({dropped} boilerplate paragraphs deduplicated)"
+        )
+        return documents
+
+    def chunk_document(self, text: str, metadata: Dict[str, Any], prefix: str = "") -> List[Document]:
+        """Chunk attachment text: no quote/signature stripping, each chunk starts with prefix"""
+        chunks = self._pack(self.paragraphs(text or ""))
+        return [
+            Document(page_content=f"{prefix}{chunk}", metadata={**metadata, "chunk_index": i})
+            for i, chunk in enumerate(chunks)
+        ]
+
+    def _pack(self, paragraphs: List[str]) -> List[str]:
+        """Greedily pack whole paragraphs into chunks of up to chunk_size characters"""
+        chunks = []
+        current = ""
+        for p in paragraphs:
+            if len(p) > self.chunk_size:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                lines = [line.strip() for line in p.splitlines() if line.strip()]
+                if len(lines) > 1:
+                    chunks.extend(self._pack(lines))
+                else:
+                    chunks.extend(self._fallback_splitter.split_text(p))
+                continue
+            if current and len(current) + 2 + len(p) > self.chunk_size:
+                chunks.append(current)
+                current = p
+            else:
+                current = f"{current}\n\n{p}" if current else p
+        if current:
+            chunks.append(current)
+        return chunks
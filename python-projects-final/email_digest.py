@@ -0,0 +1,133 @@
+# email_digest.py
+import os
+import re
+import json
+import logging
+from typing import Dict, Any, List, Callable, Optional
+
+from langchain.schema import Document
+
+from atomic_io import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+DIGEST_BODY_CHARS = 400
+DIGEST_VERSION = 1
+
+# Paragraphs carrying links, amounts, dates or times are what ALL-scope questions usually ask for
+SIGNAL_RE = re.compile(
+    r"https?://|www\.|[$€£₹]\s?\d|\b\d{1,2}[:/.-]\d{1,2}\b|\b(deadline|due|meeting|invoice|order|otp|code)\b",
+    re.IGNORECASE
+)
+HEADER_FIELDS = ("email_hash", "from", "sender_email", "date", "subject", "thread_id", "email_count")
+
+
+def trim_body(paragraphs: List[str], limit: int = DIGEST_BODY_CHARS) -> str:
+    """
+    Keep the paragraphs with the most signal within limit characters,
+    then restore their original order so the digest still reads naturally.
+    """
+    ranked = sorted(
+        range(len(paragraphs)),
+        key=lambda i: (0 if SIGNAL_RE.search(paragraphs[i]) else 1, i)
+    )
+    chosen, used = [], 0
+    for i in ranked:
+        size = len(paragraphs[i]) + 1
+        if used + size > limit:
+            if not chosen:
+                chosen.append(i)
+                used = limit
+            continue
+        chosen.append(i)
+        used += size
+    body = "\n".join(paragraphs[i] for i in sorted(chosen))
+    return body[:limit] + (" ..." if len(body) > limit else "")
+
+
+class EmailDigestStore:
+    """
+    Compact per-email representation (headers + trimmed body) kept in parallel
+    arrays ordered newest first. ALL-scope context is a slice of these arrays.
+    """
+
+    def __init__(self, headers: List[Dict[str, Any]], bodies: List[str]):
+        self.headers = headers
+        self.bodies = bodies
+
+    def __len__(self) -> int:
+        return len(self.bodies)
+
+    @classmethod
+    def build(
+        cls,
+        emails: List[Dict[str, Any]],
+        paragraphs_fn: Callable[[Dict[str, Any]], List[str]],
+        hash_fn: Callable[[Dict[str, Any]], str]
+    ) -> "EmailDigestStore":
+        rows = []
+        for email in emails:
+            header = {
+                "email_hash": hash_fn(email),
+                "from": email.get("from", ""),
+                "sender_email": email.get("sender_email", ""),
+                "date": email.get("date", ""),
+                "subject": email.get("subject", ""),
+                "thread_id": email.get("thread_id", ""),
+                "email_count": email.get("duplicate_count", 1),
+            }
+            rows.append((header, trim_body(paragraphs_fn(email))))
+        rows.sort(key=lambda row: row[0]["date"], reverse=True)
+        return cls([h for h, _ in rows], [b for _, b in rows])
+
+    @classmethod
+    def load_or_build(
+        cls,
+        path: str,
+        emails: List[Dict[str, Any]],
+        paragraphs_fn: Callable[[Dict[str, Any]], List[str]],
+        hash_fn: Callable[[Dict[str, Any]], str]
+    ) -> "EmailDigestStore":
+        """Reuse the persisted digests when they were built from the same emails"""
+        expected = sorted(hash_fn(e) for e in emails)
+        store = cls.load(path)
+        if store is not None and sorted(h["email_hash"] for h in store.headers) == expected:
+            return store
+
+        store = cls.build(emails, paragraphs_fn, hash_fn)
+        store.save(path)
+        logger.info(f"✓ Built {len(store)} email digests")
+        return store
+
+    @classmethod
+    def load(cls, path: str) -> Optional["EmailDigestStore"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != DIGEST_VERSION:
+                return None
+            headers = [dict(zip(HEADER_FIELDS, row)) for row in data["headers"]]
+            return cls(headers, data["bodies"])
+        except Exception as e:
+            logger.warning(f"Failed to load email digests: {e}")
+            return None
+
+    def save(self, path: str):
+        try:
+            # Another chain may load this file while it is being written
+            atomic_write_json(path, {
+                "version": DIGEST_VERSION,
+                "headers": [[h.get(k) for k in HEADER_FIELDS] for h in self.headers],
+                "bodies": self.bodies,
+            }, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"Error saving email digests: {e}")
+
+    def documents(self, start: int = 0, stop: Optional[int] = None) -> List[Document]:
+        """Documents for a slice of the newest-first arrays"""
+        return [
+            Document(page_content=body, metadata=dict(header))
+            for header, body in zip(self.headers[start:stop], self.bodies[start:stop])
+        ]
@@ -0,0 +1,149 @@
+# email_query.py
+import re
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_LISTED = 50
+
+LATEST_RE = re.compile(r"\b(latest|last|most recent|newest)\b.*\bfrom\s+(?P<sender>.+)", re.IGNORECASE)
+FROM_RE = re.compile(r"\bfrom\s+(?P<sender>.+)", re.IGNORECASE)
+COUNT_RE = re.compile(r"\b(how many|count|number of)\b", re.IGNORECASE)
+# Only counts of emails themselves: "how many emails", not "how many meetings/unread emails/people"
+COUNT_EMAILS_RE = re.compile(
+    r"\b(how many|count|number of)\s+(all\s+)?((my|the)\s+)?(e-?mails?|mails|messages)\b",
+    re.IGNORECASE
+)
+# What may surround a plain count: "how many emails did I get today so far?"
+COUNT_FILLER_RE = re.compile(
+    r"\b(did|do|have|has|had|i|we|get|got|receive|received|were|was|are|there|today|so far|in|my|inbox|me)\b|[\?\.!,]",
+    re.IGNORECASE
+)
+# The day files hold today's emails; any other window needs the LLM
+TIME_WINDOW_RE = re.compile(
+    r"\b(yesterday|this (week|month|year)|last|past|since|ago|weeks?|months?|years?|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    re.IGNORECASE
+)
+SENDERS_RE = re.compile(
+    r"\b(who (sent|emailed|mailed|wrote)|which senders|senders|group(ed)? by sender|per sender|by sender)\b",
+    re.IGNORECASE
+)
+LIST_RE = re.compile(
+    r"\b(list|show|what are|give me|display)\b.*\b(emails|mails|subjects|titles|messages)\b",
+    re.IGNORECASE
+)
+# Topical qualifiers need semantic retrieval, not metadata
+TOPIC_RE = re.compile(
+    r"\b(about|regarding|related to|concerning|containing|mentioning|with|that|which|where)\b",
+    re.IGNORECASE
+)
+# Words that end a sender phrase: "from Amazon today?" -> "Amazon"
+SENDER_TAIL_RE = re.compile(
+    r"\s+\b(today|yesterday|this (morning|afternoon|week)|so far|recently|please)\b.*$|[\?\.!,]+$",
+    re.IGNORECASE
+)
+
+
+def _count(n: int, noun: str) -> str:
+    """'1 email', '2 emails'"""
+    return f"{n} {noun}{'s' if n != 1 else ''}"
+
+
+class EmailQueryEngine:
+    """
+    Deterministic answers for aggregate questions (counts, senders, subject lists,
+    latest email from someone) computed straight from email metadata.
+    """
+
+    def __init__(self, emails: List[Dict[str, Any]]):
+        self.emails = emails
+
+    @staticmethod
+    def _sender_label(email: Dict[str, Any]) -> str:
+        return email.get("from") or email.get("sender_email") or "(unknown sender)"
+
+    def from_sender(self, sender: str) -> List[Dict[str, Any]]:
+        pat = re.compile(re.escape(sender.strip()), re.IGNORECASE)
+        return [
+            e for e in self.emails
+            if pat.search(e.get("from", "") or "") or pat.search(e.get("sender_email", "") or "")
+        ]
+
+    def count(self, sender: Optional[str] = None) -> int:
+        return len(self.from_sender(sender) if sender else self.emails)
+
+    def group_by_sender(self) -> List[tuple]:
+        return Counter(self._sender_label(e) for e in self.emails).most_common()
+
+    def subjects(self, sender: Optional[str] = None) -> List[str]:
+        emails = self.from_sender(sender) if sender else self.emails
+        return [e.get("subject", "") or "(no subject)" for e in emails]
+
+    def latest_from(self, sender: str) -> Optional[Dict[str, Any]]:
+        matches = self.from_sender(sender)
+        return max(matches, key=lambda e: e.get("date", "")) if matches else None
+
+    @staticmethod
+    def _extract_sender(match) -> str:
+        return SENDER_TAIL_RE.sub("", match.group("sender")).strip().strip("\"'")
+
+    @staticmethod
+    def _is_plain_email_count(q: str, from_match) -> bool:
+        """A count of emails (optionally from one sender) with no other qualifier"""
+        m = COUNT_EMAILS_RE.search(q)
+        if not m:
+            return False
+        rest = q[:m.start()] + " " + q[m.end():from_match.start() if from_match else len(q)]
+        return not COUNT_FILLER_RE.sub(" ", rest).strip()
+
+    def answer(self, question: str) -> Optional[str]:
+        """Answer an aggregate question, or return None when it needs the LLM"""
+        q = question.strip()
+
+        m = LATEST_RE.search(q)
+        if m:
+            sender = self._extract_sender(m)
+            email = self.latest_from(sender) if sender else None
+            if email is None:
+                return None
+            return (
+                f"The latest email from {sender} is \"{email.get('subject', '(no subject)')}\" "
+                f"sent by {self._sender_label(email)} on {email.get('date', 'an unknown date')}."
+            )
+
+        if TOPIC_RE.search(q) or TIME_WINDOW_RE.search(q):
+            return None
+
+        from_match = FROM_RE.search(q)
+        sender = self._extract_sender(from_match) if from_match else None
+        if sender and not self.from_sender(sender):
+            # Unknown sender phrase (e.g. "from last week"); let the LLM handle it
+            return None
+
+        if COUNT_RE.search(q) and not SENDERS_RE.search(q):
+            if not self._is_plain_email_count(q, from_match):
+                return None
+            n = self.count(sender)
+            suffix = f" from {sender}" if sender else ""
+            return f"You received {_count(n, 'email')}{suffix} today."
+
+        if SENDERS_RE.search(q):
+            groups = self.group_by_sender()
+            if not groups:
+                return "You haven't received any emails today."
+            lines = [f"- {label}: {_count(n, 'email')}" for label, n in groups[:MAX_LISTED]]
+            return f"{_count(len(self.emails), 'email')} from {_count(len(groups), 'sender')} today:\n" + "\n".join(lines)
+
+        if LIST_RE.search(q):
+            subjects = self.subjects(sender)
+            if not subjects:
+                return "You haven't received any emails today."
+            lines = [f"{i}. {s}" for i, s in enumerate(subjects[:MAX_LISTED], 1)]
+            more = f"\n... and {len(subjects) - MAX_LISTED} more" if len(subjects) > MAX_LISTED else ""
+            suffix = f" from {sender}" if sender else ""
+            return f"{_count(len(subjects), 'email')}{suffix} today:\n" + "\n".join(lines) + more
+
+        return None
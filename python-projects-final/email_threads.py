@@ -0,0 +1,118 @@
+# email_threads.py
+import re
+import hashlib
+import logging
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+REPLY_PREFIX_RE = re.compile(r"^\s*((re|fw|fwd|aw|sv|wg)(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+
+
+def parse_message_ids(value: Any) -> List[str]:
+    """Extract <message-id> tokens from a header value or a list of them"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        value = " ".join(value)
+    return MESSAGE_ID_RE.findall(value)
+
+
+def normalize_subject(subject: str) -> str:
+    """Drop Re:/Fwd: style prefixes so replies share their thread's subject"""
+    return re.sub(r"\s+", " ", REPLY_PREFIX_RE.sub("", subject or "")).strip().lower()
+
+
+def _date_sort_key(email: Dict[str, Any]) -> str:
+    raw = email.get("date", "") or ""
+    try:
+        return parsedate_to_datetime(raw).astimezone().strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        # Already normalized by EmailProcessor.normalize_date, or unparseable
+        return raw
+
+
+class ThreadIndex:
+    """
+    Groups emails into conversations.
+    Messages are linked through Message-ID / In-Reply-To / References;
+    replies without usable headers fall back to their normalized subject.
+    """
+
+    def __init__(self, emails: List[Dict[str, Any]]):
+        self._parent: Dict[str, str] = {}
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self._build(emails)
+
+    def _find(self, key: str) -> str:
+        self._parent.setdefault(key, key)
+        while self._parent[key] != key:
+            self._parent[key] = self._parent[self._parent[key]]
+            key = self._parent[key]
+        return key
+
+    def _union(self, a: str, b: str):
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a != root_b:
+            self._parent[root_b] = root_a
+
+    @staticmethod
+    def _node_key(email: Dict[str, Any], position: int) -> str:
+        msg_ids = parse_message_ids(email.get("message_id"))
+        return msg_ids[0] if msg_ids else f"#{position}"
+
+    def _build(self, emails: List[Dict[str, Any]]):
+        keys = [self._node_key(e, i) for i, e in enumerate(emails)]
+        subject_roots: Dict[str, str] = {}
+
+        for key, email in zip(keys, emails):
+            self._find(key)
+            related = parse_message_ids(email.get("references")) + parse_message_ids(email.get("in_reply_to"))
+            for ref in related:
+                self._union(ref, key)
+
+            subject = normalize_subject(email.get("subject", ""))
+            if not subject:
+                continue
+            is_reply = bool(REPLY_PREFIX_RE.match(email.get("subject", "") or ""))
+            if subject not in subject_roots:
+                subject_roots[subject] = key
+            elif is_reply and not related:
+                self._union(subject_roots[subject], key)
+
+        grouped = defaultdict(list)
+        for key, email in zip(keys, emails):
+            grouped[self._find(key)].append(email)
+
+        for root, members in grouped.items():
+            thread_id = hashlib.md5(root.encode()).hexdigest()
+            members.sort(key=_date_sort_key)
+            for email in members:
+                email["thread_id"] = thread_id
+            self.threads[thread_id] = members
+
+        logger.info(f"✓ Reconstructed {len(self.threads)} threads from {len(emails)} emails")
+
+    def get(self, thread_id: str) -> List[Dict[str, Any]]:
+        return self.threads.get(thread_id, [])
+
+    def subject(self, thread_id: str) -> str:
+        members = self.get(thread_id)
+        if not members:
+            return ""
+        return REPLY_PREFIX_RE.sub("", members[0].get("subject", "") or "").strip()
+
+    def participants(self, thread_id: str) -> List[str]:
+        seen = []
+        for email in self.get(thread_id):
+            sender = email.get("from", "")
+            if sender and sender not in seen:
+                seen.append(sender)
+        return seen
+
+    def latest(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        members = self.get(thread_id)
+        return members[-1] if members else None
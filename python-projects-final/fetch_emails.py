@@ -3,18 +3,43 @@ import imaplib
 import email
 import os
 import datetime
-import json
 import re
+import logging
+from dataclasses import dataclass
+from typing import Optional
 from email.header import decode_header
-from bs4 import BeautifulSoup
+from html_cleaning import html_to_text, clean_text
+from atomic_io import atomic_write_json, file_lock
+from attachments import save_attachments, get_extractor
+from retention import sync_tombstones
+from raw_archive import RAW_ARCHIVE_ENABLED, ArchiveCorruptError, RawArchive
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 IMAP_SERVER = os.getenv("EMAIL_IMAP_SERVER", "imap.gmail.com")
 IMAP_PORT = int(os.getenv("EMAIL_IMAP_PORT", 993))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASSWORD")
+# Plain IMAP is only meant for local stand-ins (benchmarks/fake_imap.py)
+IMAP_SSL = os.getenv("EMAIL_IMAP_SSL", "1").lower() not in ("0", "false", "no")
+
+
+@dataclass
+class IMAPAccount:
+    """Mailbox to log in to; tenants.py builds one per tenant"""
+    user: Optional[str]
+    password: Optional[str]
+    server: str = "imap.gmail.com"
+    port: int = 993
+    ssl: bool = True
+
+
+def default_account():
+    """The EMAIL_* settings above, read at call time so benchmarks can repoint them"""
+    return IMAPAccount(EMAIL_USER, EMAIL_PASS, IMAP_SERVER, IMAP_PORT, IMAP_SSL)
 
 
 def _decode_mime_words(value):
@@ -45,8 +70,8 @@ def _get_body(msg):
             if part.get_content_type() == "text/html":
                 payload = part.get_payload(decode=True)
                 if payload:
-                    soup = BeautifulSoup(payload, "html.parser")
-                    return soup.get_text("\n")
+                    charset = part.get_content_charset() or "utf-8"
+                    return html_to_text(payload.decode(charset, errors="ignore"))
     else:
         payload = msg.get_payload(decode=True)
         if payload:
@@ -54,47 +79,128 @@ def _get_body(msg):
     return ""
 
 
-def fetch_emails_since(date=None, mailbox="INBOX"):
-    """Fetch emails since given date (date is a datetime.date). Defaults to today."""
+def _connect(account):
+    if account.ssl:
+        return imaplib.IMAP4_SSL(account.server, account.port)
+    return imaplib.IMAP4(account.server, account.port)
+
+
+def parse_message(uid, raw, clean=True, attachment_dir=None):
+    """
+    Turn one raw RFC822 message into the email dict stored in data/.
+    With attachment_dir, supported attachments are stored there and listed under "attachments".
+    """
+    msg = email.message_from_bytes(raw)
+    subject = _decode_mime_words(msg.get("Subject"))
+    frm = _decode_mime_words(msg.get("From"))
+    date_hdr = _decode_mime_words(msg.get("Date"))
+    message_id = str(msg.get("Message-ID") or "").strip()
+    in_reply_to = str(msg.get("In-Reply-To") or "").strip()
+    references = re.findall(r"<[^<>\s]+>", str(msg.get("References") or ""))
+    body = _get_body(msg) or ""
+
+    # try to extract an email address from the From header
+    m = re.search(r"<([^>]+)>", frm)
+    sender_email = m.group(1) if m else (re.search(r"[\w\.-]+@[\w\.-]+", frm).group(0) if re.search(r"[\w\.-]+@[\w\.-]+", frm) else None)
+
+    record = {
+        "uid": uid.decode() if isinstance(uid, bytes) else str(uid),
+        "message_id": message_id,
+        "in_reply_to": in_reply_to,
+        "references": references,
+        "date": date_hdr,
+        "from": frm,
+        "sender_email": sender_email,
+        "subject": subject,
+        "body": body
+    }
+    if clean:
+        record["clean_body"] = clean_text(body)
+    if attachment_dir:
+        try:
+            record["attachments"] = save_attachments(msg, attachment_dir)
+        except Exception as e:
+            logger.warning(f"Could not save attachments of message {record['uid']}: {e}")
+            record["attachments"] = []
+    return record
+
+
+def _uidvalidity(imap):
+    typ, data = imap.response("UIDVALIDITY")
+    return data[0].decode() if data and data[0] else None
+
+
+def _archived(archive, mailbox, uidvalidity, uid):
+    # Without UIDVALIDITY a stored UID could name a different message
+    if archive is None or not uidvalidity:
+        return None
+    try:
+        return archive.get(mailbox, uidvalidity, uid)
+    except (ArchiveCorruptError, OSError) as e:
+        logger.warning(f"Re-downloading message {uid} of {mailbox}: {e}")
+        return None
+
+
+def fetch_emails_since(date=None, mailbox="INBOX", progress=None, extract_attachments=True,
+                       account=None, data_dir="data", track_deletions=True, archive_raw=RAW_ARCHIVE_ENABLED):
+    """
+    Fetch emails since given date (date is a datetime.date). Defaults to today.
+    progress(done, total) is called after each message; raising from it aborts the fetch.
+    Attachment text is extracted in the background (attachments.get_extractor(data_dir)), never in this loop.
+    account defaults to the EMAIL_* settings; results are saved under data_dir.
+    Messages are addressed by UID, so stored ones that later disappear from the
+    server are tombstoned (retention.sync_tombstones) when track_deletions is set.
+    With archive_raw, raw messages are kept in data_dir/raw (raw_archive.py) and
+    ones already archived are read from there instead of being downloaded again.
+    """
+    account = account or default_account()
+    archive = RawArchive.for_data_dir(data_dir) if archive_raw else None
+    extractor = get_extractor(data_dir) if extract_attachments else None
     if date is None:
         date = datetime.date.today()
     date_str = date.strftime("%d-%b-%Y")  # IMAP date format
-    imap = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT)
-    imap.login(EMAIL_USER, EMAIL_PASS)
-    imap.select(mailbox)
-
-    typ, data = imap.search(None, f'(SINCE "{date_str}")')
-    emails = []
-    if data and data[0]:
-        for num in data[0].split():
-            typ, msg_data = imap.fetch(num, "(RFC822)")
-            raw = msg_data[0][1]
-            msg = email.message_from_bytes(raw)
-            subject = _decode_mime_words(msg.get("Subject"))
-            frm = _decode_mime_words(msg.get("From"))
-            date_hdr = _decode_mime_words(msg.get("Date"))
-            body = _get_body(msg) or ""
-
-            # try to extract an email address from the From header
-            m = re.search(r"<([^>]+)>", frm)
-            sender_email = m.group(1) if m else (re.search(r"[\w\.-]+@[\w\.-]+", frm).group(0) if re.search(r"[\w\.-]+@[\w\.-]+", frm) else None)
-
-            emails.append({
-                "uid": num.decode() if isinstance(num, bytes) else str(num),
-                "date": date_hdr,
-                "from": frm,
-                "sender_email": sender_email,
-                "subject": subject,
-                "body": body
-            })
-
-    imap.close()
-    imap.logout()
-
-    os.makedirs("data", exist_ok=True)
-    fname = f"data/emails_{date.isoformat()}.json"
-    with open(fname, "w", encoding="utf-8") as f:
-        json.dump(emails, f, ensure_ascii=False, indent=2)
+    imap = _connect(account)
+    imap.login(account.user, account.password)
+    try:
+        imap.select(mailbox)
+        uidvalidity = _uidvalidity(imap)
+
+        # UIDs, unlike sequence numbers, stay stable across sessions and expunges
+        typ, data = imap.uid("SEARCH", None, f'(SINCE "{date_str}")')
+        emails = []
+        uids = data[0].split() if data and data[0] else []
+        for i, uid in enumerate(uids, 1):
+            raw = _archived(archive, mailbox, uidvalidity, uid)
+            if raw is None:
+                typ, msg_data = imap.uid("FETCH", uid, "(RFC822)")
+                raw = msg_data[0][1]
+                if archive is not None and uidvalidity:
+                    archive.add(raw, mailbox, uidvalidity, uid)
+            record = parse_message(uid, raw, attachment_dir=extractor.base_dir if extractor else None)
+            record["mailbox"] = mailbox
+            record["uidvalidity"] = uidvalidity
+            for attachment in record.get("attachments", []):
+                extractor.submit(attachment)
+            emails.append(record)
+            if progress:
+                progress(i, len(uids))
+
+        if track_deletions:
+            try:
+                sync_tombstones(imap, mailbox, uidvalidity, data_dir)
+            except Exception as e:
+                logger.warning(f"Could not check {mailbox} for deleted messages: {e}")
+
+        imap.close()
+    finally:
+        imap.logout()
+        if archive is not None:
+            archive.sync()
+
+    # Readers may load this file while a fetch runs; never expose a half-written one
+    fname = os.path.join(data_dir, f"emails_{date.isoformat()}.json")
+    with file_lock(fname):  # retention rewrites day files under the same lock
+        atomic_write_json(fname, emails, ensure_ascii=False, indent=2)
 
     return emails
 
@@ -0,0 +1,63 @@
+# html_cleaning.py
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prefer selectolax (lexbor, C) and fall back to BeautifulSoup with lxml / the stdlib parser
+try:
+    from selectolax.lexbor import LexborHTMLParser as _FastParser
+    BACKEND = "selectolax"
+except ImportError:
+    _FastParser = None
+    try:
+        import lxml  # noqa: F401
+        BACKEND = "lxml"
+    except ImportError:
+        BACKEND = "html.parser"
+
+HTML_MARKER_RE = re.compile(r"<(html|body|div|p|br|table|td|span|a|img|font)\b", re.IGNORECASE)
+NON_CONTENT_TAGS = ("script", "style", "head", "noscript")
+
+
+def looks_like_html(text: str) -> bool:
+    return bool(text) and HTML_MARKER_RE.search(text[:4096]) is not None
+
+
+def _strip_lines(text: str) -> str:
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def html_to_text(raw_html, backend: str = None) -> str:
+    """Convert an HTML body to text, one block of text per line"""
+    if not raw_html:
+        return ""
+    backend = backend or BACKEND
+    if isinstance(raw_html, bytes):
+        raw_html = raw_html.decode(errors="ignore")
+
+    if backend == "selectolax" and _FastParser is not None:
+        tree = _FastParser(raw_html)
+        for node in tree.css(",".join(NON_CONTENT_TAGS)):
+            node.decompose()
+        root = tree.body or tree.root
+        return _strip_lines(root.text(separator="\n")) if root is not None else ""
+
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(raw_html, "lxml" if backend == "lxml" else "html.parser")
+    for node in soup(list(NON_CONTENT_TAGS)):
+        node.decompose()
+    return soup.get_text(separator="\n", strip=True)
+
+
+def clean_text(body: str) -> str:
+    """Single cleaning step used at ingest: HTML is converted, plain text is only trimmed"""
+    if not body:
+        return ""
+    try:
+        if looks_like_html(body):
+            return html_to_text(body)
+        return body.strip()
+    except Exception as e:
+        logger.error(f"Error cleaning HTML: {e}")
+        return body
@@ -0,0 +1,147 @@
+# jobs.py
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+MAX_FINISHED_JOBS = 100
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's function when it checks progress after cancel() was called"""
+
+
+class Job:
+    def __init__(self, kind: str, key: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.state = QUEUED
+        self.progress = 0.0
+        self.message = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.requests = 1  # how many callers were coalesced onto this job
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def report(self, progress: float, message: str = ""):
+        """Called by the job function; also the point where cancellation takes effect"""
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        self.progress = max(0.0, min(1.0, progress))
+        if message:
+            self.message = message
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes; False on timeout"""
+        return self._done.wait(timeout)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "state": self.state,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "requests": self.requests,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Background jobs with coalescing: while a job for a key (e.g. "fetch:INBOX:2024-05-01")
+    is queued or running, submitting the same key returns that job instead of
+    starting another download or index build.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}
+
+    def submit(self, kind: str, key: str, fn: Callable[[Job], Any]) -> Job:
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None and job.state in ACTIVE_STATES and not job.cancel_requested:
+                job.requests += 1
+                logger.info(f"Coalesced {kind} request onto job {job.id}")
+                return job
+
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._prune()
+        self._pool.submit(self._run, job, fn)
+        logger.info(f"📋 Queued {kind} job {job.id} ({key})")
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        if job.cancel_requested:
+            self._finish(job, CANCELLED, message="cancelled before start")
+            return
+        job.state = RUNNING
+        job.started_at = time.time()
+        job.message = "running"
+        try:
+            result = fn(job)
+            job.progress = 1.0
+            self._finish(job, SUCCEEDED, result=result, message="done")
+        except JobCancelled:
+            self._finish(job, CANCELLED, message="cancelled")
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}", exc_info=True)
+            self._finish(job, FAILED, error=str(e), message="failed")
+
+    def _finish(self, job: Job, state: str, result: Any = None, error: Optional[str] = None, message: str = ""):
+        with self._lock:
+            job.state = state
+            job.result = result
+            job.error = error
+            job.message = message or state
+            job.finished_at = time.time()
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+        job._done.set()
+        duration = job.finished_at - (job.started_at or job.created_at)
+        logger.info(f"Job {job.id} ({job.kind}) {state} in {duration:.1f}s")
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.state not in ACTIVE_STATES]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Request cancellation; running jobs stop at their next report() call"""
+        job = self._jobs.get(job_id)
+        if job is not None and job.state in ACTIVE_STATES:
+            job._cancel.set()
+            job.message = "cancelling"
+        return job
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
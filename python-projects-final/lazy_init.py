@@ -0,0 +1,91 @@
+# lazy_init.py
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+# background: start loading when the server starts, answer /health immediately
+# on_demand:  load on the first request that needs it
+# eager:      load before the server accepts requests (the old behaviour)
+INIT_MODE = os.getenv("EMAIL_RAG_INIT_MODE", "background").lower()
+INIT_WAIT_SECONDS = float(os.getenv("EMAIL_RAG_INIT_WAIT_SECONDS", 300))
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class NotReadyError(RuntimeError):
+    """Raised when a lazy resource did not become ready in time (or failed to load)"""
+
+
+class LazyResource:
+    """
+    Builds an expensive object (LLM chain, vectorstore) at most once, either in
+    a background thread or on first use. Imports of heavy libraries belong
+    inside the factory so importing the server module stays cheap.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        self._value = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _load(self):
+        with self._lock:
+            if self.state != PENDING:
+                return
+            self.state = LOADING
+        logger.info(f"⏳ Loading {self.name}...")
+        start = time.perf_counter()
+        try:
+            self._value = self.factory()
+            self.state = READY
+        except Exception as e:
+            logger.error(f"Failed to load {self.name}: {e}", exc_info=True)
+            self.error = str(e)
+            self.state = FAILED
+        finally:
+            self.load_ms = (time.perf_counter() - start) * 1000
+            METRICS.observe("email_rag_init_duration_ms", self.load_ms, resource=self.name)
+            self._done.set()
+        if self.state == READY:
+            logger.info(f"✓ {self.name} ready in {self.load_ms / 1000:.1f}s")
+
+    def start(self) -> "LazyResource":
+        """Begin loading according to INIT_MODE"""
+        if INIT_MODE == "eager":
+            self._load()
+        elif INIT_MODE == "background":
+            threading.Thread(target=self._load, name=f"init-{self.name}", daemon=True).start()
+        return self
+
+    def get(self, timeout: float = INIT_WAIT_SECONDS) -> Any:
+        """Return the resource, loading it now if nobody has started yet"""
+        if self.state == PENDING:
+            self._load()
+        if not self._done.wait(timeout):
+            raise NotReadyError(f"{self.name} is still loading")
+        if self.state == FAILED:
+            raise NotReadyError(f"{self.name} failed to load: {self.error}")
+        return self._value
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def status(self) -> Dict[str, Any]:
+        status = {"state": self.state}
+        if self.load_ms is not None:
+            status["load_ms"] = round(self.load_ms, 1)
+        if self.error:
+            status["error"] = self.error
+        return status
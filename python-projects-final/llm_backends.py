@@ -0,0 +1,131 @@
+# llm_backends.py
+import os
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GPT4ALL_MODEL_DIR = Path.home() / ".cache" / "gpt4all"
+MB = 1024 * 1024
+
+DEFAULT_MODEL = "mistral-7b-instruct-v0.1.Q4_0.gguf"
+DEFAULT_LLM_BACKEND = os.getenv("EMAIL_RAG_LLM_BACKEND", "gpt4all")
+# A llama.cpp server (llama-server --port 8080 -np 8 -cb) or vLLM; both batch concurrent requests
+DEFAULT_LLM_BASE_URL = os.getenv("EMAIL_RAG_LLM_BASE_URL", "http://127.0.0.1:8080/v1")
+DEFAULT_LLM_API_KEY = os.getenv("EMAIL_RAG_LLM_API_KEY", "")
+# Provider keys are only ever sent to that provider; any other server needs EMAIL_RAG_LLM_API_KEY
+PROVIDER_KEY_ENV = {
+    "api.openai.com": "OPENAI_API_KEY",
+    "openrouter.ai": "OPENROUTER_API_KEY",
+}
+
+
+@dataclass
+class LLMConfig:
+    """LLM settings for the scripts that don't use EmailRAGConfig (chat.py, query.py, summarize.py)"""
+    model_name: str = os.getenv("EMAIL_RAG_LLM_MODEL", DEFAULT_MODEL)
+    llm_backend: str = DEFAULT_LLM_BACKEND
+    llm_base_url: str = DEFAULT_LLM_BASE_URL
+    llm_api_key: str = DEFAULT_LLM_API_KEY
+    max_tokens: int = 200  # GPT4All's own default
+    n_ctx: int = 8192
+    prefix_cache_mb: int = 2048
+    llm_timeout_s: float = 300.0
+    verbose: bool = False
+
+
+def resolve_model_path(model_name: str) -> str:
+    """Local path of a GGUF model, reusing GPT4All's download directory when the name is bare"""
+    if os.path.exists(model_name):
+        return model_name
+    cached = GPT4ALL_MODEL_DIR / model_name
+    if cached.exists():
+        return str(cached)
+    raise FileNotFoundError(
+        f"Model {model_name} not found; pass a path or download it once with the gpt4all backend"
+    )
+
+
+def make_gpt4all(config):
+    from langchain_community.llms import GPT4All
+    return GPT4All(
+        model=config.model_name,
+        allow_download=True,
+        max_tokens=config.max_tokens
+    )
+
+
+def make_llamacpp(config):
+    """
+    llama.cpp with a prefix KV cache. Every completion stores its KV state keyed
+    by token prefix; the next prompt restores the longest matching state and
+    only prefills the new suffix. The prompt templates keep their static
+    instructions (and, for the answer stage, the email context) ahead of the
+    per-question text so consecutive calls share long prefixes.
+    """
+    from langchain_community.llms import LlamaCpp
+
+    llm = LlamaCpp(
+        model_path=resolve_model_path(config.model_name),
+        n_ctx=config.n_ctx,
+        max_tokens=min(config.max_tokens, config.n_ctx // 2),
+        temperature=0.1,
+        verbose=config.verbose
+    )
+    if config.prefix_cache_mb > 0:
+        from llama_cpp import LlamaRAMCache
+        llm.client.set_cache(LlamaRAMCache(capacity_bytes=config.prefix_cache_mb * MB))
+        logger.info(f"✓ Prefix KV cache enabled ({config.prefix_cache_mb} MB)")
+    return llm
+
+
+def resolve_api_key(config) -> str:
+    """config.llm_api_key, else the provider's own key variable when llm_base_url is that provider"""
+    if config.llm_api_key:
+        return config.llm_api_key
+    env = PROVIDER_KEY_ENV.get(urlparse(config.llm_base_url).hostname or "")
+    return os.getenv(env, "") if env else ""
+
+
+def make_openai_compat(config):
+    """
+    Client for an OpenAI-compatible completions endpoint. Concurrent chain calls
+    become concurrent HTTP requests that the server decodes in one batch, instead
+    of queueing behind a single in-process model.
+    """
+    from langchain_openai import OpenAI
+
+    logger.info(f"LLM server: {config.llm_base_url}")
+    return OpenAI(
+        model=config.model_name,
+        base_url=config.llm_base_url,
+        api_key=resolve_api_key(config) or "not-needed",  # local servers ignore the key
+        max_tokens=config.max_tokens,
+        temperature=0.1,
+        timeout=config.llm_timeout_s,
+        max_retries=2
+    )
+
+
+BACKENDS = {
+    "gpt4all": make_gpt4all,
+    "llamacpp": make_llamacpp,
+    "openai_compat": make_openai_compat,
+}
+
+
+def make_llm(config=None):
+    """Build the LLM selected by config.llm_backend (LLMConfig() from the environment if omitted)"""
+    if config is None:
+        config = LLMConfig()
+    try:
+        factory = BACKENDS[config.llm_backend]
+    except KeyError:
+        raise ValueError(f"Unknown llm_backend {config.llm_backend!r}; choose from {sorted(BACKENDS)}")
+    logger.info(f"LLM backend: {config.llm_backend}")
+    return factory(config)
@@ -3,6 +3,7 @@ import argparse
 import datetime
 import json
 import os
+import sys
 # summarize.py
 
 from fetch_emails import fetch_emails_since
@@ -17,6 +18,9 @@ def main():
     parser.add_argument("--summarize", action="store_true", help="Summarize today's emails into 5 bullets")
     parser.add_argument("--ask", type=str, help="Ask a question to the QA system (retrieval)")
     parser.add_argument("--from", dest="from_query", type=str, help="Check if email from this name/email arrived today")
+    parser.add_argument("--batch", type=str, help="Answer every question in this file (one per line, or JSONL with id/question)")
+    parser.add_argument("--output", type=str, help="Write --batch answers as JSONL here instead of stdout")
+    parser.add_argument("--concurrency", type=int, default=1, help="Parallel LLM calls for --batch (keep 1 for in-process gpt4all/llamacpp backends)")
     args = parser.parse_args()
 
     today = datetime.date.today()
@@ -50,6 +54,22 @@ def main():
         print("Answer:\n")
         print(ask(args.ask))
 
+    if args.batch:
+        from llm_backends import make_llm
+        from vectorstore import load_vectorstore
+        from batch_qa import read_questions, run_batch
+
+        # Load the index and the model once for the whole file
+        vs = load_vectorstore()
+        llm = make_llm()
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            stats = run_batch(read_questions(args.batch), vs, vs.embeddings, llm, out, k=10, concurrency=args.concurrency)
+        finally:
+            if args.output:
+                out.close()
+        print(f"Answered {stats['questions']} questions ({stats['errors']} errors) in {stats['elapsed_ms'] / 1000:.1f}s", file=sys.stderr)
+
     if args.from_query:
         found, matches = did_receive_from(args.from_query, today)
         print("Found:", found)
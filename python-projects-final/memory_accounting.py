@@ -0,0 +1,407 @@
+# memory_accounting.py
+"""
+Where the server's memory goes, and a budget that keeps it bounded.
+
+MemoryAccountant estimates the bytes held by each component:
+
+    models       LLM weights (model file size; 0 for remote backends), the
+                 embedding model and any fallback LLMs, shared by all tenants
+    index        vectors of each tenant's FAISS / quantized index
+    docstore     document texts and metadata behind each index
+    email_cache  emails, thread index and digests cached on each chain
+    sessions     conversation memory of each chain
+    reranker     per-chain cross-encoder, when reranking is enabled
+
+With EMAIL_RAG_MEMORY_BUDGET_MB set, enforce() frees memory while the
+accounted total is over budget, in EMAIL_RAG_MEMORY_EVICTION_ORDER: trim
+conversation memory to the last SESSION_KEEP_TURNS turns, drop email caches
+(reloaded from data/ on the next question; any tenant's, including the most
+recent, unless it is answering), then evict whole tenants other than the most
+recent; least recently used tenants go first and models are never evicted. The budget is
+checked against the estimates, not RSS: freed Python objects don't always
+shrink RSS. The report shows RSS next to them so the gap is visible.
+
+EMAIL_RAG_TRACEMALLOC=delta records each stage's net allocation on its span;
+=snapshot also keeps the top allocating lines per stage. tracemalloc is
+process-wide, so concurrent requests blur each other's numbers, and it slows
+everything down; enable it to investigate, not in normal serving.
+
+    python memory_accounting.py --url http://127.0.0.1:8000 [--json]
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+import tracemalloc
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+MEMORY_BUDGET_MB = int(os.getenv("EMAIL_RAG_MEMORY_BUDGET_MB", 0))  # 0 = report only
+EVICTION_ORDER = tuple(os.getenv("EMAIL_RAG_MEMORY_EVICTION_ORDER", "sessions,email_cache,tenants").split(","))
+SESSION_KEEP_TURNS = int(os.getenv("EMAIL_RAG_SESSION_KEEP_TURNS", 2))
+TRACEMALLOC_MODE = os.getenv("EMAIL_RAG_TRACEMALLOC", "off").lower()  # off, delta or snapshot
+TRACEMALLOC_TOP = int(os.getenv("EMAIL_RAG_TRACEMALLOC_TOP", 5))
+MB = 1024 * 1024
+DOC_OVERHEAD = 400  # Document object, its metadata dict and docstore entry
+
+
+def _str_bytes(value: Any) -> int:
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_str_bytes(k) + _str_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_str_bytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def torch_bytes(model: Any) -> int:
+    """Parameter and buffer bytes of a torch module, found on model, model.model or model.client"""
+    for candidate in (model, getattr(model, "model", None), getattr(model, "client", None)):
+        if candidate is not None and hasattr(candidate, "parameters"):
+            tensors = list(candidate.parameters()) + list(getattr(candidate, "buffers", lambda: [])())
+            return sum(t.numel() * t.element_size() for t in tensors)
+    return 0
+
+
+def llm_bytes(llm: Any) -> int:
+    """Weights file size of a local LLM (mmapped, so resident once touched) plus its prefix KV cache"""
+    if llm is None or "openai" in type(llm).__name__.lower():
+        return 0  # served by another process
+    from llm_backends import resolve_model_path
+    total = 0
+    name = getattr(llm, "model_path", None) or getattr(llm, "model", None)
+    if isinstance(name, str):
+        try:
+            total += os.path.getsize(resolve_model_path(name))
+        except (FileNotFoundError, OSError):
+            pass
+    cache = getattr(getattr(llm, "client", None), "cache", None)
+    total += int(getattr(cache, "cache_size", 0) or 0)
+    return total
+
+
+def model_bytes(model: Any) -> int:
+    return torch_bytes(model) or llm_bytes(model)
+
+
+def index_bytes(vectorstore: Any) -> int:
+    if vectorstore is None:
+        return 0
+    if hasattr(vectorstore, "memory_footprint"):
+        footprint = vectorstore.memory_footprint()
+        return footprint["codes_bytes"] + footprint["offsets_bytes"]
+    index = vectorstore.index
+    return int(index.ntotal * index.d * 4)
+
+
+def docstore_bytes(vectorstore: Any) -> int:
+    if vectorstore is None:
+        return 0
+    if hasattr(vectorstore, "memory_footprint"):
+        return 0  # QuantizedVectorIndex reads documents from disk; its offsets count as index
+    docs = getattr(vectorstore.docstore, "_dict", {}).values()
+    return sum(_str_bytes(d.page_content) + _str_bytes(d.metadata) + DOC_OVERHEAD for d in docs)
+
+
+def _vectorstore_of(chain: Any) -> Any:
+    manager = getattr(chain, "vectorstore_manager", None)
+    if manager is not None:
+        return manager.vectorstore
+    return getattr(getattr(chain, "retriever", None), "vectorstore", None)
+
+
+def email_cache_bytes(chain: Any) -> int:
+    seen, total = set(), 0
+    for email in list(getattr(chain, "all_emails", None) or []) + list(getattr(chain, "indexed_emails", None) or []):
+        if id(email) not in seen:
+            seen.add(id(email))
+            total += _str_bytes(email)
+    digests = getattr(chain, "digest_store", None)
+    if digests is not None:
+        total += _str_bytes(digests.headers) + _str_bytes(digests.bodies)
+    # The thread index only references the email dicts counted above
+    total += _str_bytes(getattr(chain, "thread_of_hash", None) or {})
+    return total
+
+
+def _session_messages(chain: Any) -> List[Any]:
+    memory = getattr(chain, "internal_memory", None)
+    return list(getattr(getattr(memory, "chat_memory", None), "messages", None) or [])
+
+
+def session_bytes(chain: Any) -> int:
+    return sum(_str_bytes(getattr(m, "content", "")) + DOC_OVERHEAD for m in _session_messages(chain))
+
+
+class _SizeCache:
+    """Sizes of large, rarely changing objects, keyed by identity and a cheap change marker"""
+
+    def __init__(self):
+        self._sizes: Dict[int, Tuple[Any, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, obj: Any, marker: Any, measure: Callable[[Any], int]) -> int:
+        with self._lock:
+            cached = self._sizes.get(id(obj))
+        if cached is not None and cached[0] == marker:
+            return cached[1]
+        size = measure(obj)
+        with self._lock:
+            self._sizes[id(obj)] = (marker, size)
+        return size
+
+    def retain(self, objs: Iterable[Any]):
+        keep = {id(o) for o in objs}
+        with self._lock:
+            self._sizes = {k: v for k, v in self._sizes.items() if k in keep}
+
+
+_sizes = _SizeCache()
+
+
+def _vectorstore_marker(vectorstore: Any) -> Any:
+    index = getattr(vectorstore, "index", None)
+    return getattr(index, "ntotal", None) if index is not None else len(vectorstore)
+
+
+def chain_components(chain: Any) -> Dict[str, int]:
+    """Bytes per component of one tenant's chain (EmailRAGSequentialChain or a chat.py chatbot)"""
+    vectorstore = _vectorstore_of(chain)
+    components = {"index": index_bytes(vectorstore), "docstore": 0, "email_cache": 0, "sessions": 0, "reranker": 0}
+    if vectorstore is not None:
+        components["docstore"] = _sizes.get(vectorstore, _vectorstore_marker(vectorstore), docstore_bytes)
+    components["email_cache"] = email_cache_bytes(chain)
+    components["sessions"] = session_bytes(chain)
+    reranker = getattr(chain, "reranker", None)
+    if reranker is not None:
+        components["reranker"] = _sizes.get(reranker, None, torch_bytes)
+    return components
+
+
+def chain_bytes(chain: Any) -> int:
+    return sum(chain_components(chain).values())
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Current RSS from /proc; None where there is no procfs"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def trim_sessions(chain: Any, keep_turns: int = SESSION_KEEP_TURNS) -> bool:
+    memory = getattr(chain, "internal_memory", None)
+    messages = _session_messages(chain)
+    if len(messages) <= keep_turns * 2:
+        return False
+    memory.chat_memory.messages = messages[-keep_turns * 2:] if keep_turns else []
+    return True
+
+
+def drop_email_cache(chain: Any) -> bool:
+    """Forget the cached day of emails unless the chain is answering a question right now"""
+    release = getattr(chain, "release_email_cache", None)
+    return bool(release and release())
+
+
+class StageMemoryProfiler:
+    """Span hook recording tracemalloc figures per pipeline stage"""
+
+    def __init__(self, mode: str = TRACEMALLOC_MODE, top_n: int = TRACEMALLOC_TOP):
+        self.mode = mode
+        self.top_n = top_n
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("delta", "snapshot")
+
+    def install(self) -> "StageMemoryProfiler":
+        if self.enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            METRICS.add_span_hook(self.profile)
+            logger.info(f"🔬 tracemalloc profiling of pipeline stages ({self.mode})")
+        return self
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    @contextmanager
+    def profile(self, span):
+        before_bytes = tracemalloc.get_traced_memory()[0]
+        before = self._snapshot() if self.mode == "snapshot" else None
+        try:
+            yield
+        finally:
+            delta = tracemalloc.get_traced_memory()[0] - before_bytes
+            span.set(mem_delta_kb=round(delta / 1024, 1))
+            stage = {"last_delta_kb": round(delta / 1024, 1)}
+            if before is not None:
+                stage["top"] = [str(stat) for stat in self._snapshot().compare_to(before, "lineno")[:self.top_n]]
+            with self._lock:
+                previous = self.stages.get(span.stage, {})
+                stage["calls"] = previous.get("calls", 0) + 1
+                stage["max_delta_kb"] = max(previous.get("max_delta_kb", stage["last_delta_kb"]), stage["last_delta_kb"])
+                self.stages[span.stage] = stage
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            traced, peak = tracemalloc.get_traced_memory()
+            return {"mode": self.mode, "traced_bytes": traced, "peak_bytes": peak, "stages": dict(self.stages)}
+
+
+class MemoryAccountant:
+    """
+    Accounts the shared models from models_fn() (name -> model, empty while
+    loading) and every tenant of the given TenantCaches, and enforces
+    budget_bytes (0 = no budget) over their total.
+    """
+
+    def __init__(self, models_fn: Callable[[], Dict[str, Any]], caches: List[Any],
+                 budget_bytes: int = MEMORY_BUDGET_MB * MB, order: Tuple[str, ...] = EVICTION_ORDER,
+                 profiler: Optional[StageMemoryProfiler] = None):
+        self.models_fn = models_fn
+        self.caches = caches
+        self.budget_bytes = budget_bytes
+        self.order = order
+        self.profiler = profiler
+        self._enforce_lock = threading.Lock()
+
+    def _models(self) -> Dict[str, int]:
+        return {name: _sizes.get(model, None, model_bytes) for name, model in self.models_fn().items()}
+
+    def report(self) -> Dict[str, Any]:
+        models = self._models()
+        tenants, totals = {}, {"models": sum(models.values())}
+        for cache in self.caches:
+            for tenant_id, chain in cache.items():
+                components = chain_components(chain)
+                tenants[f"{cache.name}:{tenant_id}"] = components
+                for name, size in components.items():
+                    totals[name] = totals.get(name, 0) + size
+        _sizes.retain(
+            [_vectorstore_of(chain) for cache in self.caches for _, chain in cache.items()]
+            + [getattr(chain, "reranker", None) for cache in self.caches for _, chain in cache.items()]
+            + list(self.models_fn().values())
+        )
+        accounted = sum(totals.values())
+        rss = process_rss_bytes()
+        report = {
+            "accounted_bytes": accounted,
+            "rss_bytes": rss,
+            "unaccounted_bytes": rss - accounted if rss is not None else None,
+            "budget_bytes": self.budget_bytes or None,
+            "components": totals,
+            "models": models,
+            "tenants": tenants,
+        }
+        if self.profiler is not None and self.profiler.enabled:
+            report["tracemalloc"] = self.profiler.report()
+        return report
+
+    def _total(self) -> int:
+        # TenantCache keeps each tenant's chain_bytes from its last load/refresh
+        return sum(self._models().values()) + sum(cache.stats()["bytes"] for cache in self.caches)
+
+    def enforce(self) -> List[str]:
+        """Free memory in self.order until the accounted total is within budget; returns what was done"""
+        if not self.budget_bytes or not self._enforce_lock.acquire(blocking=False):
+            return []  # no budget, or another request is already enforcing it
+        actions = []
+        try:
+            total = self._total()
+            if total <= self.budget_bytes:
+                return []
+            for step in self.order:
+                for cache in self.caches:
+                    # Least recently used first; the most recent tenant is never evicted, but its
+                    # email cache may be (release_email_cache refuses while it is answering)
+                    lru = list(reversed(cache.items()))
+                    for position, (tenant_id, chain) in enumerate(lru):
+                        if total <= self.budget_bytes:
+                            break
+                        newest = position == len(lru) - 1
+                        if step == "sessions":
+                            changed = trim_sessions(chain)
+                        elif step == "email_cache":
+                            changed = drop_email_cache(chain)
+                        elif step == "tenants" and not newest:
+                            changed = cache.evict(tenant_id)
+                        else:
+                            changed = False
+                        if not changed:
+                            continue
+                        if step != "tenants":
+                            cache.refresh(tenant_id)
+                        total = self._total()
+                        actions.append(f"{step}:{cache.name}:{tenant_id}")
+                        METRICS.inc("email_rag_memory_evictions_total", step=step)
+        finally:
+            self._enforce_lock.release()
+        if actions:
+            logger.info(
+                f"♻️ Memory budget {self.budget_bytes / MB:.0f} MB: {', '.join(actions)} "
+                f"(now ~{total / MB:.0f} MB accounted)"
+            )
+        if total > self.budget_bytes:
+            logger.warning(f"Memory still over budget after evictions: ~{total / MB:.0f} MB accounted")
+        return actions
+
+
+def _print_report(report: Dict[str, Any]):
+    def mb(value):
+        return "-" if value is None else f"{value / MB:10.1f} MB"
+    print(f"{'accounted':<32}{mb(report['accounted_bytes'])}")
+    print(f"{'rss':<32}{mb(report['rss_bytes'])}")
+    print(f"{'unaccounted (rss - accounted)':<32}{mb(report['unaccounted_bytes'])}")
+    print(f"{'budget':<32}{mb(report['budget_bytes'])}")
+    print("\ncomponents")
+    for name, size in sorted(report["components"].items(), key=lambda kv: -kv[1]):
+        print(f"  {name:<30}{mb(size)}")
+    print("\nmodels")
+    for name, size in report["models"].items():
+        print(f"  {name:<30}{mb(size)}")
+    print("\ntenants")
+    for tenant, components in report["tenants"].items():
+        print(f"  {tenant:<30}{mb(sum(components.values()))}  "
+              + ", ".join(f"{k}={v / MB:.1f}" for k, v in components.items() if v))
+    if "tracemalloc" in report:
+        print("\ntracemalloc (net KB per stage, last call)")
+        for stage, figures in report["tracemalloc"]["stages"].items():
+            print(f"  {stage:<30}{figures['last_delta_kb']:10.1f} KB (max {figures['max_delta_kb']:.1f}, {figures['calls']} calls)")
+            for line in figures.get("top", []):
+                print(f"      {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show a running server's memory accounting (GET /memory)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of server.py or server2.py")
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON report")
+    args = parser.parse_args()
+
+    with urllib.request.urlopen(args.url.rstrip("/") + "/memory", timeout=30) as response:
+        report = json.load(response)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# near_duplicates.py
+import re
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+SHINGLE_SIZE = 5
+MIN_SHINGLES = 8
+DEFAULT_THRESHOLD = 0.8
+
+# Multiply-shift hashing: ((a * x + b) mod 2^64) >> 32 with odd a; uint64 arithmetic wraps, which is the mod
+_rng = np.random.default_rng(1729)
+_A = _rng.integers(0, 1 << 63, NUM_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 1 << 63, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def shingles(text: str) -> set:
+    """Word 5-grams over normalized text; digits and URLs are masked so counters/tracking links don't matter"""
+    text = re.sub(r"https?://\S+", " url ", (text or "").lower())
+    words = re.findall(r"\w+", re.sub(r"\d+", "0", text))
+    if len(words) < SHINGLE_SIZE:
+        return {_hash64(" ".join(words))} if words else set()
+    return {_hash64(" ".join(words[i:i + SHINGLE_SIZE])) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(shingle_set: set) -> np.ndarray:
+    """All permutations over all shingles in one (permutations x shingles) array operation"""
+    hashes = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def estimated_similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+class NearDuplicateDetector:
+    """
+    Clusters near-identical emails with MinHash + LSH banding.
+    Buckets are scoped per sender so short, generic bodies from different
+    people ("Thanks!") never collapse into each other. Every pair in a bucket
+    is compared and matches are merged with union-find, so A~B and B~C
+    cluster together even when A and C share no bucket.
+
+    Signatures are cached by a digest of the email's text. Reuse one detector
+    for a mailbox and re-collapsing it (a reload, a new fetch) only hashes
+    emails it has not seen; the cache keeps just the last call's emails.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, text_fn: Optional[Callable[[Dict], str]] = None):
+        self.threshold = threshold
+        self.text_fn = text_fn or (lambda e: f"{e.get('subject', '')}\n{e.get('body', '')}")
+        self._signatures: Dict[bytes, Optional[np.ndarray]] = {}
+
+    def _signature(self, text: str, cache: Dict[bytes, Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        """MinHash of text, or None when it is too short to compare"""
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        if key not in cache:
+            cached = self._signatures.get(key, False)
+            if cached is False:
+                shingle_set = shingles(text)
+                cached = minhash_signature(shingle_set) if len(shingle_set) >= MIN_SHINGLES else None
+            cache[key] = cached
+        return cache[key]
+
+    def cluster(self, emails: List[Dict[str, Any]]) -> List[List[int]]:
+        """Return clusters as lists of positions into emails"""
+        parent = list(range(len(emails)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        rows = NUM_PERMUTATIONS // NUM_BANDS
+        signatures: Dict[int, np.ndarray] = {}
+        buckets = defaultdict(list)
+        cache: Dict[bytes, Optional[np.ndarray]] = {}
+
+        for i, email in enumerate(emails):
+            sig = self._signature(self.text_fn(email), cache)
+            if sig is None:
+                continue
+            signatures[i] = sig
+            sender = (email.get("sender_email") or email.get("from") or "").lower()
+            for band in range(NUM_BANDS):
+                buckets[(sender, band, sig[band * rows:(band + 1) * rows].tobytes())].append(i)
+        self._signatures = cache
+
+        min_matches = self.threshold * NUM_PERMUTATIONS
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            block = np.stack([signatures[i] for i in members])
+            for pos, i in enumerate(members[:-1]):
+                # One row against every later row of the bucket at once
+                matches = (block[pos + 1:] == block[pos]).sum(axis=1) >= min_matches
+                for other in np.flatnonzero(matches):
+                    a, b = find(i), find(members[pos + 1 + other])
+                    if a != b:
+                        parent[b] = a
+
+        clusters = defaultdict(list)
+        for i in range(len(emails)):
+            clusters[find(i)].append(i)
+        return list(clusters.values())
+
+    def collapse(self, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Keep one representative per cluster (the most recent message), annotated
+        with duplicate_count and the uids of the messages it stands for.
+        Input order is preserved for the representatives.
+        """
+        representatives = []
+        for members in sorted(self.cluster(emails), key=min):
+            if len(members) == 1:
+                representatives.append(emails[members[0]])
+                continue
+            latest = max(members, key=lambda i: (emails[i].get("date", ""), i))
+            rep = dict(emails[latest])
+            rep["duplicate_count"] = len(members)
+            rep["duplicate_uids"] = [emails[i].get("uid") for i in members]
+            representatives.append(rep)
+
+        collapsed = len(emails) - len(representatives)
+        if collapsed:
+            logger.info(f"✓ Collapsed {collapsed} near-duplicate emails ({len(emails)} -> {len(representatives)})")
+        return representatives
@@ -0,0 +1,188 @@
+# quantized_index.py
+import os
+import json
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import faiss
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_INDEX_VERSION = 1
+MODES = ("int8", "binary")
+META_FILE = "quantized.json"
+VECTORS_FILE = "vectors.npy"
+CODES_FILE = "codes.faiss"
+DOCS_FILE = "docs.jsonl"
+OFFSETS_FILE = "doc_offsets.npy"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class QuantizedVectorIndex:
+    """
+    Two-stage vector store for large mailboxes.
+
+    The first pass searches compact codes held in RAM: scalar int8 (1 byte per
+    dimension) or binary sign bits (1 bit per dimension, Hamming distance). The
+    top k * rescore_factor candidates are then rescored by exact cosine
+    similarity against float32 vectors memory-mapped from disk, so only the
+    candidate rows are paged in. Documents live in a JSONL file, memory-mapped
+    the same way and read by offset, instead of a pickled in-memory docstore.
+    Both maps are opened in load(), so an instance keeps reading the files it
+    was loaded from even after a rebuild swaps the directory underneath it.
+
+    Exposes similarity_search() like the LangChain FAISS store.
+    """
+
+    def __init__(self, mode: str, embeddings: Any, codes: Any, vectors: np.ndarray,
+                 docs: np.ndarray, offsets: np.ndarray, rescore_factor: int = 4):
+        if mode not in MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}; choose from {MODES}")
+        self.mode = mode
+        self.embeddings = embeddings
+        self.codes = codes
+        self.vectors = vectors
+        self.docs = docs
+        self.offsets = offsets
+        self.rescore_factor = rescore_factor
+
+    @staticmethod
+    def _build_codes(mode: str, vectors: np.ndarray):
+        dim = vectors.shape[1]
+        if mode == "int8":
+            codes = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        else:
+            codes = faiss.IndexBinaryFlat(dim)
+        if not len(vectors):
+            # e.g. compaction removed every row; the SQ can't be trained on nothing, and search_vector never reads it
+            return codes
+        if mode == "int8":
+            codes.train(vectors)
+            codes.add(vectors)
+        else:
+            codes.add(np.packbits(vectors > 0, axis=1))
+        return codes
+
+    @classmethod
+    def build(cls, path: str, documents: List[Document], embeddings: Any, mode: str) -> None:
+        """Embed documents and write the quantized index files into path"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}; choose from {MODES}")
+        vectors = _normalize(np.asarray(embeddings.embed_documents([d.page_content for d in documents])))
+        cls._write(path, documents, vectors, mode)
+
+    @classmethod
+    def _write(cls, path: str, documents: List[Document], vectors: np.ndarray, mode: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, VECTORS_FILE), vectors)
+        codes = cls._build_codes(mode, vectors)
+        if mode == "int8":
+            faiss.write_index(codes, os.path.join(path, CODES_FILE))
+        else:
+            faiss.write_index_binary(codes, os.path.join(path, CODES_FILE))
+
+        offsets = []
+        with open(os.path.join(path, DOCS_FILE), "wb") as f:
+            for doc in documents:
+                offsets.append(f.tell())
+                line = json.dumps({"text": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False)
+                f.write(line.encode("utf-8") + b"\n")
+        np.save(os.path.join(path, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": QUANTIZED_INDEX_VERSION,
+                "mode": mode,
+                "dim": int(vectors.shape[1]),
+                "count": int(vectors.shape[0]),
+            }, f)
+        logger.info(f"✓ Built {mode} index: {vectors.shape[0]} vectors x {vectors.shape[1]} dims")
+
+    @classmethod
+    def load(cls, path: str, embeddings: Any, mode: str, rescore_factor: int = 4) -> "QuantizedVectorIndex":
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != QUANTIZED_INDEX_VERSION or meta.get("mode") != mode:
+            raise ValueError(f"Index at {path} is {meta.get('mode')} v{meta.get('version')}, expected {mode}")
+
+        codes_path = os.path.join(path, CODES_FILE)
+        codes = faiss.read_index(codes_path) if mode == "int8" else faiss.read_index_binary(codes_path)
+        return cls(
+            mode=mode,
+            embeddings=embeddings,
+            codes=codes,
+            vectors=np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r"),
+            docs=cls._map_docs(os.path.join(path, DOCS_FILE)),
+            offsets=np.load(os.path.join(path, OFFSETS_FILE)),
+            rescore_factor=rescore_factor
+        )
+
+    @staticmethod
+    def _map_docs(docs_path: str) -> np.ndarray:
+        if not os.path.getsize(docs_path):
+            return np.zeros(0, dtype=np.uint8)  # mmap of an empty file fails
+        return np.memmap(docs_path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def search_vector(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """(row, cosine score) for the k best rows: quantized first pass, exact rescoring"""
+        if not len(self):
+            return []
+        query = _normalize(query.reshape(1, -1))
+        n_candidates = min(len(self), max(k * self.rescore_factor, k))
+        if self.mode == "int8":
+            _, ids = self.codes.search(query, n_candidates)
+        else:
+            _, ids = self.codes.search(np.packbits(query > 0, axis=1), n_candidates)
+
+        candidates = np.sort(ids[0][ids[0] >= 0])  # sorted rows read the mmap sequentially
+        scores = np.asarray(self.vectors[candidates]) @ query[0]
+        best = np.argsort(-scores)[:k]
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+    def _record(self, row: int) -> Dict[str, Any]:
+        start = int(self.offsets[row])
+        end = int(self.offsets[row + 1]) if row + 1 < len(self.offsets) else len(self.docs)
+        return json.loads(self.docs[start:end].tobytes())
+
+    def _documents(self, rows: List[int]) -> List[Document]:
+        docs = []
+        for row in rows:
+            record = self._record(row)
+            docs.append(Document(page_content=record["text"], metadata=record["metadata"]))
+        return docs
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        hits = self.search_vector(vector, k)
+        return list(zip(self._documents([row for row, _ in hits]), [score for _, score in hits]))
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def write_subset(self, path: str, rows: List[int]) -> None:
+        """Write a new index with only these rows, reusing the stored vectors instead of re-embedding"""
+        rows = sorted(rows)
+        self._write(path, self._documents(rows), np.ascontiguousarray(self.vectors[rows]), self.mode)
+
+    def documents_metadata(self) -> List[Dict[str, Any]]:
+        """Metadata of every row, in row order (one sequential pass over the docs map)"""
+        return [self._record(row)["metadata"] for row in range(len(self))]
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes held in RAM by the codes vs. what stays on disk"""
+        return {
+            "codes_bytes": int(self.codes.ntotal * self.codes.code_size),
+            "offsets_bytes": int(self.offsets.nbytes),
+            "mmap_vectors_bytes": int(self.vectors.nbytes),
+            "mmap_docs_bytes": int(self.docs.nbytes),
+        }
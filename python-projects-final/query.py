@@ -6,14 +6,14 @@ import re
 from dotenv import load_dotenv
 load_dotenv()
 # summarize.py
-from langchain_community.llms import GPT4All
+from llm_backends import make_llm
 
 from langchain.chains import RetrievalQA
 from vectorstore import load_vectorstore
 
 def make_qa():
     vs = load_vectorstore()
-    llm = GPT4All(model="mistral-7b-instruct-v0.1.Q4_0.gguf", allow_download=True)
+    llm = make_llm()
     qa = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
@@ -0,0 +1,369 @@
+# raw_archive.py
+"""
+Local archive of raw RFC822 messages, so re-processing never goes back to IMAP.
+
+Messages are appended to segment files (data/raw/segment-000001.seg, ...),
+each record zlib-compressed on its own behind a small header:
+
+    magic "RAW1" | compressed length (u32) | CRC32 of the raw bytes (u32) | zlib data
+
+index.jsonl has one line per archived message: its UID key (mailbox,
+UIDVALIDITY, UID), the SHA-256 of the raw bytes, and the segment/offset/length
+of its record. Reading a message is one seek and one read. Identical raw
+messages (the same mail in two mailboxes) are stored once. New segments start
+at RAW_SEGMENT_MB.
+
+fetch_emails_since archives every message it downloads and reads archived
+ones back instead of fetching them again. Re-ingest rebuilds the day files
+from the archive with the current parser and cleaner:
+
+    python raw_archive.py reingest --data-dir data [--date 2024-05-01] [--reindex]
+    python raw_archive.py stats --data-dir data
+    python raw_archive.py show --data-dir data INBOX 1 42
+"""
+import os
+import re
+import json
+import zlib
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from atomic_io import atomic_write_json, file_lock
+from retention import day_files, uid_key, _load
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+RAW_ARCHIVE_ENABLED = os.getenv("EMAIL_RAG_RAW_ARCHIVE", "1").lower() not in ("0", "false", "no")
+RAW_SEGMENT_MB = int(os.getenv("EMAIL_RAG_RAW_SEGMENT_MB", 64))
+RAW_COMPRESSION_LEVEL = int(os.getenv("EMAIL_RAG_RAW_COMPRESSION_LEVEL", 6))
+RAW_DIR = "raw"
+INDEX_FILE = "index.jsonl"
+MAGIC = b"RAW1"
+HEADER = struct.Struct(">4sII")
+SEGMENT_RE = re.compile(r"^segment-(\d{6})\.seg$")
+MB = 1024 * 1024
+
+Key = Tuple[str, str, str]  # (mailbox, uidvalidity, uid), as retention.uid_key
+
+
+class ArchiveCorruptError(IOError):
+    """A record doesn't match its index entry (torn write, truncated segment)"""
+
+
+def _key(mailbox: str, uidvalidity: Any, uid: Any) -> Key:
+    uid = uid.decode() if isinstance(uid, bytes) else uid
+    return mailbox, str(uidvalidity), str(uid)
+
+
+class RawArchive:
+    """
+    Append-only raw message store for one data dir. Writers serialize on a
+    file lock; each instance picks up entries other processes appended when
+    a lookup misses.
+    """
+
+    def __init__(self, root: str, segment_bytes: int = RAW_SEGMENT_MB * MB):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._by_key: Dict[Key, Dict[str, Any]] = {}
+        self._by_hash: Dict[str, Dict[str, Any]] = {}
+        self._index_pos = 0  # bytes of index.jsonl already loaded
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @classmethod
+    def for_data_dir(cls, data_dir: str) -> "RawArchive":
+        return cls(os.path.join(data_dir, RAW_DIR))
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.root, f"segment-{segment:06d}.seg")
+
+    def _segments_on_disk(self) -> List[int]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(self.root)) if m)
+
+    def _refresh(self):
+        """Load index lines appended since the last refresh"""
+        with self._lock:
+            if not os.path.exists(self.index_path):
+                return
+            if os.path.getsize(self.index_path) < self._index_pos:
+                # Rewritten by retain(): start over
+                self._by_key, self._by_hash, self._index_pos = {}, {}, 0
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_pos)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # a writer is halfway through this line
+                    self._index_pos += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipping unreadable line in {self.index_path}")
+                        continue
+                    self._by_key[_key(entry["mailbox"], entry["uidvalidity"], entry["uid"])] = entry
+                    self._by_hash.setdefault(entry["sha256"], entry)
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def __contains__(self, key: Key) -> bool:
+        return self.entry(*key) is not None
+
+    def entry(self, mailbox: str, uidvalidity: Any, uid: Any) -> Optional[Dict[str, Any]]:
+        key = _key(mailbox, uidvalidity, uid)
+        if key not in self._by_key:
+            self._refresh()
+        return self._by_key.get(key)
+
+    def add(self, raw: bytes, mailbox: str, uidvalidity: Any, uid: Any) -> Dict[str, Any]:
+        """Archive one message (a no-op if this UID is already archived)"""
+        key = _key(mailbox, uidvalidity, uid)
+        sha256 = hashlib.sha256(raw).hexdigest()
+        with file_lock(self.index_path):
+            self._refresh()
+            if key in self._by_key:
+                return self._by_key[key]
+
+            stored = self._by_hash.get(sha256)
+            if stored is not None:
+                location = {k: stored[k] for k in ("segment", "offset", "length", "size")}
+            else:
+                location = self._append_record(raw)
+            entry = {"mailbox": key[0], "uidvalidity": key[1], "uid": key[2], "sha256": sha256, **location}
+            line = (json.dumps(entry) + "\n").encode("utf-8")
+            with open(self.index_path, "ab") as f:
+                f.write(line)
+            with self._lock:
+                self._index_pos += len(line)  # refreshed under the same lock, so this line follows directly
+                self._by_key[key] = entry
+                self._by_hash.setdefault(sha256, entry)
+        METRICS.inc("email_rag_raw_archive_bytes_total", location["length"] if stored is None else 0)
+        return entry
+
+    def _append_record(self, raw: bytes) -> Dict[str, int]:
+        # Caller holds the file lock
+        os.makedirs(self.root, exist_ok=True)
+        payload = zlib.compress(raw, RAW_COMPRESSION_LEVEL)
+        record = HEADER.pack(MAGIC, len(payload), zlib.crc32(raw)) + payload
+        segment = max(self._segments_on_disk(), default=1)
+        path = self._segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) + len(record) > self.segment_bytes:
+            segment += 1
+            path = self._segment_path(segment)
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(record)
+        return {"segment": segment, "offset": offset, "length": len(record), "size": len(raw)}
+
+    def sync(self):
+        """fsync the index and the newest segment; fetches call this once at the end"""
+        paths = [self.index_path] + [self._segment_path(s) for s in self._segments_on_disk()[-1:]]
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    os.fsync(f.fileno())
+
+    def _read(self, entry: Dict[str, Any], f=None) -> bytes:
+        if f is None:
+            with open(self._segment_path(entry["segment"]), "rb") as f:
+                return self._read(entry, f)
+        f.seek(entry["offset"])
+        record = f.read(entry["length"])
+        if len(record) != entry["length"]:
+            raise ArchiveCorruptError(f"Truncated record for UID {entry['uid']} in segment {entry['segment']}")
+        magic, length, crc = HEADER.unpack_from(record)
+        if magic != MAGIC or length != len(record) - HEADER.size:
+            raise ArchiveCorruptError(f"Bad record header for UID {entry['uid']} in segment {entry['segment']}")
+        raw = zlib.decompress(record[HEADER.size:])
+        if zlib.crc32(raw) != crc:
+            raise ArchiveCorruptError(f"Checksum mismatch for UID {entry['uid']} in segment {entry['segment']}")
+        return raw
+
+    def get(self, mailbox: str, uidvalidity: Any, uid: Any) -> Optional[bytes]:
+        """The raw message, or None if it isn't archived"""
+        entry = self.entry(mailbox, uidvalidity, uid)
+        METRICS.cache_hit("raw_archive", hit=entry is not None)
+        return self._read(entry) if entry is not None else None
+
+    def get_by_hash(self, sha256: str) -> Optional[bytes]:
+        if sha256 not in self._by_hash:
+            self._refresh()
+        entry = self._by_hash.get(sha256)
+        return self._read(entry) if entry is not None else None
+
+    def replay(self, keys: Optional[List[Key]] = None) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+        """
+        (index entry, raw message) for the given keys, or for everything, read
+        segment by segment in file order so the disk sees sequential reads.
+        """
+        self._refresh()
+        if keys is None:
+            entries = list(self._by_key.values())
+        else:
+            entries = [self._by_key[_key(*k)] for k in keys if _key(*k) in self._by_key]
+        entries.sort(key=lambda e: (e["segment"], e["offset"]))
+        f, segment = None, None
+        try:
+            for entry in entries:
+                if entry["segment"] != segment:
+                    if f is not None:
+                        f.close()
+                    segment = entry["segment"]
+                    f = open(self._segment_path(segment), "rb")
+                yield entry, self._read(entry, f)
+        finally:
+            if f is not None:
+                f.close()
+
+    def retain(self, keys: set) -> Dict[str, int]:
+        """
+        Forget every message whose key isn't in keys and delete segments left
+        without live records. Partly-live segments are kept as they are.
+        """
+        with file_lock(self.index_path):
+            self._refresh()
+            live = [e for k, e in self._by_key.items() if k in keys]
+            if len(live) == len(self._by_key):
+                return {"forgotten": 0, "segments_removed": 0}
+            on_disk = self._segments_on_disk()
+            used = {e["segment"] for e in live} | set(on_disk[-1:])  # new records still go to the newest one
+            dead_segments = set(on_disk) - used
+
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in live:
+                    f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.index_path)
+            for segment in dead_segments:
+                os.remove(self._segment_path(segment))
+
+            forgotten = len(self._by_key) - len(live)
+            with self._lock:
+                self._by_key = {_key(e["mailbox"], e["uidvalidity"], e["uid"]): e for e in live}
+                self._by_hash = {}
+                for entry in live:
+                    self._by_hash.setdefault(entry["sha256"], entry)
+                self._index_pos = os.path.getsize(self.index_path)
+        logger.info(f"🧹 Raw archive {self.root}: forgot {forgotten} messages, removed {len(dead_segments)} segments")
+        return {"forgotten": forgotten, "segments_removed": len(dead_segments)}
+
+    def stats(self) -> Dict[str, Any]:
+        self._refresh()
+        segments = sorted({e["segment"] for e in self._by_key.values()})
+        on_disk = sum(os.path.getsize(self._segment_path(s)) for s in segments if os.path.exists(self._segment_path(s)))
+        unique = {e["sha256"]: e for e in self._by_key.values()}.values()
+        raw_bytes = sum(e["size"] for e in unique)
+        return {
+            "messages": len(self._by_key),
+            "unique_messages": len(unique),
+            "segments": len(segments),
+            "raw_bytes": raw_bytes,
+            "segment_bytes": on_disk,
+            "compression_ratio": round(raw_bytes / on_disk, 2) if on_disk else None,
+        }
+
+
+def reingest(data_dir: str, dates: Optional[List[str]] = None, extract_attachments: bool = True) -> Dict[str, int]:
+    """
+    Rebuild data/emails_<date>.json from the archive with the current parser
+    and cleaner. Stored dates and fields added after parsing (thread ids,
+    duplicate counts) are kept, so email hashes don't change. Messages missing
+    from the archive keep their old record. Attachments are saved and queued
+    on the data_dir's extractor, as a fetch would.
+    """
+    from fetch_emails import parse_message
+    from attachments import get_extractor
+
+    archive = RawArchive.for_data_dir(data_dir)
+    extractor = get_extractor(data_dir) if extract_attachments else None
+    stats = {"files": 0, "reparsed": 0, "missing": 0}
+    for day, path in day_files(data_dir):
+        if dates and day.isoformat() not in dates:
+            continue
+        with file_lock(path):  # a fetch or retention pass may be writing this day file
+            records = _load(path)
+            position = {uid_key(r): i for i, r in enumerate(records) if uid_key(r) is not None}
+            reparsed = 0
+            # Streamed in archive order; only one raw message is held at a time
+            for entry, raw in archive.replay(list(position)):
+                i = position[_key(entry["mailbox"], entry["uidvalidity"], entry["uid"])]
+                parsed = parse_message(records[i]["uid"], raw, attachment_dir=extractor.base_dir if extractor else None)
+                for attachment in parsed.get("attachments", []):
+                    extractor.submit(attachment)
+                parsed["date"] = records[i].get("date", parsed["date"])
+                records[i] = {**records[i], **parsed}
+                reparsed += 1
+            stats["reparsed"] += reparsed
+            stats["missing"] += len(records) - reparsed
+            atomic_write_json(path, records, ensure_ascii=False, indent=2)
+        # Digests are keyed by email hash, which re-ingest keeps; drop them so they're rebuilt
+        digest = os.path.join(data_dir, f"digests_{day.isoformat()}.json")
+        if os.path.exists(digest):
+            os.remove(digest)
+        stats["files"] += 1
+    logger.info(
+        f"✓ Re-ingested {stats['reparsed']} emails in {stats['files']} day files from {archive.root}"
+        + (f" ({stats['missing']} not archived, kept as they were)" if stats["missing"] else "")
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw RFC822 archive: stats, lookup and re-ingest")
+    parser.add_argument("--data-dir", default="data")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Message, segment and compression figures")
+    show = sub.add_parser("show", help="Print one archived message")
+    show.add_argument("mailbox")
+    show.add_argument("uidvalidity")
+    show.add_argument("uid")
+    re_ingest = sub.add_parser("reingest", help="Re-parse day files from the archive, no IMAP")
+    re_ingest.add_argument("--date", action="append", help="Only this day file (repeatable)")
+    re_ingest.add_argument("--reindex", action="store_true", help="Rebuild the vectorstore from the newest day afterwards")
+    re_ingest.add_argument("--persist-dir", default="faiss_index")
+    re_ingest.add_argument("--quantization", default="none", choices=["none", "int8", "binary"])
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(RawArchive.for_data_dir(args.data_dir).stats(), indent=2))
+    elif args.command == "show":
+        raw = RawArchive.for_data_dir(args.data_dir).get(args.mailbox, args.uidvalidity, args.uid)
+        if raw is None:
+            raise SystemExit("Not archived")
+        print(raw.decode("utf-8", errors="replace"))
+    else:
+        from attachments import get_extractor, shutdown_pool
+        print(reingest(args.data_dir, args.date))
+        get_extractor(args.data_dir).wait()  # the pool dies with this process; the index should include the text
+        shutdown_pool()
+        files = day_files(args.data_dir)
+        if args.reindex and files and not _reindex(args, _load(files[0][1])):
+            raise SystemExit("Vectorstore build failed")
+
+
+def _reindex(args, emails: List[Dict[str, Any]]) -> bool:
+    """Rebuild the index the way the chain builds it: chunked, collapsed, with email hashes"""
+    from langchain.embeddings import SentenceTransformerEmbeddings
+    from email_chain import EmailRAGConfig, VectorStoreManager, near_duplicate_detector
+    from email_threads import ThreadIndex
+
+    config = EmailRAGConfig(data_dir=args.data_dir, persist_dir=args.persist_dir, quantization=args.quantization)
+    manager = VectorStoreManager(config, SentenceTransformerEmbeddings(model_name=config.embedding_model))
+    if config.collapse_near_duplicates:
+        emails = near_duplicate_detector(config, manager.chunker).collapse(emails)
+    ThreadIndex(emails)  # tags each email with the thread_id stored in its metadata
+    return manager.build_vectorstore(emails) is not None
+
+
+if __name__ == "__main__":
+    main()
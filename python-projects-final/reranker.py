@@ -0,0 +1,81 @@
+# reranker.py
+import time
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """Scores retrieved documents with a small CPU cross-encoder and keeps the top few"""
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_RERANK_MODEL,
+        top_n: int = 5,
+        batch_size: int = 16,
+        budget_ms: float = 250.0,
+        max_length: int = 256,
+        model: Optional[Any] = None,
+    ):
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        # Anything with CrossEncoder.predict(pairs, batch_size=...) works (benchmarks pass a stub)
+        if model is None:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+        self.model = model
+
+    def rerank(self, query: str, documents: List) -> Tuple[List, dict]:
+        """
+        Score documents in batches until the budget runs out. The first batch
+        is a single document; after that each batch only takes as many
+        documents as the last batch's per-document cost says still fit, so
+        the budget is checked per document rather than per batch.
+        Documents that were not scored in time keep their retrieval order
+        and are only used to fill the remaining slots.
+        """
+        if len(documents) <= self.top_n:
+            return documents, {"scored": 0, "elapsed_ms": 0.0, "budget_hit": False}
+
+        start = time.perf_counter()
+        scores: List[float] = []
+        budget_hit = False
+        ms_per_doc = None
+
+        while len(scores) < len(documents):
+            remaining_ms = self.budget_ms - (time.perf_counter() - start) * 1000
+            take = min(self.batch_size, len(documents) - len(scores))
+            take = 1 if ms_per_doc is None else min(take, int(remaining_ms / ms_per_doc))
+            if remaining_ms <= 0 or take <= 0:
+                budget_hit = True
+                break
+            batch = documents[len(scores):len(scores) + take]
+            pairs = [(query, doc.page_content) for doc in batch]
+            batch_start = time.perf_counter()
+            scores.extend(float(s) for s in self.model.predict(pairs, batch_size=self.batch_size))
+            ms_per_doc = (time.perf_counter() - batch_start) * 1000 / len(batch)
+
+        scored = sorted(
+            zip(scores, documents[:len(scores)]),
+            key=lambda pair: pair[0],
+            reverse=True
+        )
+        kept = [doc for _, doc in scored[:self.top_n]]
+        if len(kept) < self.top_n:
+            kept.extend(documents[len(scores):len(scores) + self.top_n - len(kept)])
+
+        stats = {
+            "scored": len(scores),
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+            "budget_hit": budget_hit,
+        }
+        if budget_hit:
+            logger.debug(
+                f"Rerank budget {self.budget_ms:.0f} ms spent after {len(scores)}/{len(documents)} docs"
+                + (f" (~{ms_per_doc:.1f} ms/doc)" if ms_per_doc else "")
+            )
+        return kept, stats
@@ -0,0 +1,254 @@
+# retention.py
+"""
+Retention, tombstones and background compaction.
+
+- Retention (opt-in, EMAIL_RAG_RETENTION_DAYS / EMAIL_RAG_RETENTION_MAX_EMAILS):
+  data/emails_<date>.json files older than max_age_days are deleted. If the
+  rest still hold more than max_emails messages, the oldest ones are dropped.
+  With neither set, no mail is deleted for age or count.
+- Tombstones: every fetch compares the UIDs stored locally with the UIDs the
+  server still has (UID SEARCH over the retained window). Messages that were
+  expunged or moved away are recorded in data/tombstones.json. Retention then
+  removes them from the day files, and the chain hides them from search
+  results right away.
+- Compaction: a background loop applies retention and rewrites each loaded
+  vectorstore without the vectors of emails that are no longer retained, once
+  they make up at least COMPACTION_MIN_DEAD_FRACTION of the index. The stored
+  vectors are reused, so nothing is re-embedded.
+- Raw archive: messages no day file holds anymore are dropped from
+  data/raw (raw_archive.py) along with the segments they leave empty.
+- Attachments: blobs and extracted text in data/attachments that no retained
+  email references are deleted (attachments.py).
+"""
+import os
+import re
+import json
+import time
+import logging
+import datetime
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from atomic_io import atomic_write_json, file_lock
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: nothing is deleted unless one of these is set
+RETENTION_DAYS = int(os.getenv("EMAIL_RAG_RETENTION_DAYS", 0))
+RETENTION_MAX_EMAILS = int(os.getenv("EMAIL_RAG_RETENTION_MAX_EMAILS", 0))
+COMPACTION_INTERVAL_S = float(os.getenv("EMAIL_RAG_COMPACTION_INTERVAL_S", 3600))
+COMPACTION_MIN_DEAD_FRACTION = float(os.getenv("EMAIL_RAG_COMPACTION_MIN_DEAD_FRACTION", 0.1))
+TOMBSTONE_FILE = "tombstones.json"
+DAY_FILE_RE = re.compile(r"^emails_(\d{4}-\d{2}-\d{2})\.json$")
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_days: int = RETENTION_DAYS  # 0 keeps every day
+    max_emails: int = RETENTION_MAX_EMAILS  # 0 keeps every email
+
+
+def day_files(data_dir: str) -> List[Tuple[datetime.date, str]]:
+    """(date, path) of every emails_<date>.json, newest first"""
+    if not os.path.isdir(data_dir):
+        return []
+    files = []
+    for name in os.listdir(data_dir):
+        m = DAY_FILE_RE.match(name)
+        if m:
+            files.append((datetime.date.fromisoformat(m.group(1)), os.path.join(data_dir, name)))
+    return sorted(files, reverse=True)
+
+
+def _load(path: str) -> List[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping unreadable {path}: {e}")
+        return []
+
+
+def iter_retained_emails(data_dir: str) -> Iterator[Dict[str, Any]]:
+    for _, path in day_files(data_dir):
+        yield from _load(path)
+
+
+def uid_key(email: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+    """(mailbox, uidvalidity, uid), or None for records fetched before UIDs were stored"""
+    if not email.get("uidvalidity"):
+        return None
+    return email.get("mailbox", "INBOX"), str(email["uidvalidity"]), str(email["uid"])
+
+
+class TombstoneStore:
+    """Expunged messages of one data dir: their UID key plus the fields the chain hashes"""
+
+    def __init__(self, data_dir: str):
+        self.path = os.path.join(data_dir, TOMBSTONE_FILE)
+
+    def records(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        return _load(self.path)
+
+    def keys(self) -> set:
+        return {uid_key(r) for r in self.records()}
+
+    def add(self, emails: List[Dict[str, Any]]) -> int:
+        if not emails:
+            return 0
+        with file_lock(self.path):
+            records = self.records()
+            known = {uid_key(r) for r in records}
+            now = time.time()
+            for email in emails:
+                if uid_key(email) in known:
+                    continue
+                records.append({
+                    "mailbox": email.get("mailbox", "INBOX"),
+                    "uidvalidity": email["uidvalidity"],
+                    "uid": email["uid"],
+                    "message_id": email.get("message_id", ""),
+                    "from": email.get("from", ""),
+                    "date": email.get("date", ""),
+                    "subject": email.get("subject", ""),
+                    "tombstoned_at": now
+                })
+            atomic_write_json(self.path, records, ensure_ascii=False)
+        return len(emails)
+
+    def prune(self, older_than: float) -> int:
+        """Forget tombstones whose emails have aged out of retention anyway"""
+        with file_lock(self.path):
+            records = self.records()
+            kept = [r for r in records if r.get("tombstoned_at", 0) >= older_than]
+            if len(kept) != len(records):
+                atomic_write_json(self.path, kept, ensure_ascii=False)
+        return len(records) - len(kept)
+
+
+def sync_tombstones(imap, mailbox: str, uidvalidity: str, data_dir: str) -> int:
+    """
+    Tombstone locally stored messages of this mailbox that the server no longer
+    has. Uses the caller's selected IMAP connection; one UID SEARCH per sync.
+    """
+    files = day_files(data_dir)
+    if not files or not uidvalidity:
+        return 0
+    local = [
+        e for _, path in files for e in _load(path)
+        if uid_key(e) is not None and e.get("mailbox", "INBOX") == mailbox
+    ]
+    stale = [e for e in local if str(e["uidvalidity"]) != str(uidvalidity)]
+    if stale:
+        # The server renumbered the mailbox; old UIDs say nothing about deletions
+        logger.warning(f"UIDVALIDITY of {mailbox} changed; {len(stale)} stored UIDs can't be checked")
+    local = [e for e in local if str(e["uidvalidity"]) == str(uidvalidity)]
+    if not local:
+        return 0
+
+    window = files[-1][0].strftime("%d-%b-%Y")  # every stored message was fetched SINCE its file's date
+    typ, data = imap.uid("SEARCH", None, f'(SINCE "{window}")')
+    live = {uid.decode() for uid in data[0].split()} if data and data[0] else set()
+    known = TombstoneStore(data_dir).keys()
+    expunged = [e for e in local if str(e["uid"]) not in live and uid_key(e) not in known]
+    if expunged:
+        TombstoneStore(data_dir).add(expunged)
+        METRICS.inc("email_rag_tombstones_total", len(expunged))
+        logger.info(f"🪦 {len(expunged)} messages were deleted or moved on the server")
+    return len(expunged)
+
+
+def apply_retention(data_dir: str, policy: Optional[RetentionPolicy] = None,
+                    today: Optional[datetime.date] = None) -> Dict[str, int]:
+    """Delete expired day files and trim tombstoned/over-count emails from the rest"""
+    policy = policy or RetentionPolicy()
+    today = today or datetime.date.today()
+    cutoff = today - datetime.timedelta(days=policy.max_age_days) if policy.max_age_days else None
+    tombstones = TombstoneStore(data_dir)
+    dead = tombstones.keys()
+    stats = {"files_removed": 0, "emails_removed": 0, "emails_kept": 0, "attachments_removed": 0}
+
+    for day, path in day_files(data_dir):
+        # Same lock as every day-file writer, so a fetch finishing now isn't overwritten with stale data
+        with file_lock(path):
+            emails = _load(path)
+            room = policy.max_emails - stats["emails_kept"] if policy.max_emails else len(emails)
+            if (cutoff and day < cutoff) or room <= 0:
+                os.remove(path)
+                digest = os.path.join(data_dir, f"digests_{day.isoformat()}.json")
+                if os.path.exists(digest):
+                    os.remove(digest)
+                stats["files_removed"] += 1
+                stats["emails_removed"] += len(emails)
+                continue
+
+            kept = [e for e in emails if uid_key(e) is None or uid_key(e) not in dead]
+            kept = kept[-room:]  # files are in server order, oldest first
+            if len(kept) != len(emails):
+                atomic_write_json(path, kept, ensure_ascii=False, indent=2)
+                stats["emails_removed"] += len(emails) - len(kept)
+            stats["emails_kept"] += len(kept)
+
+    if cutoff:
+        tombstones.prune(time.mktime(cutoff.timetuple()))
+    from raw_archive import RAW_DIR, RawArchive
+    if os.path.isdir(os.path.join(data_dir, RAW_DIR)):
+        # Raw messages live as long as a day file still holds them
+        RawArchive.for_data_dir(data_dir).retain({uid_key(e) for e in iter_retained_emails(data_dir)})
+    from attachments import attachment_dir, get_extractor
+    if os.path.isdir(attachment_dir(data_dir)):
+        stats["attachments_removed"] = get_extractor(data_dir).retain({
+            a["sha256"] for e in iter_retained_emails(data_dir) for a in e.get("attachments", [])
+        })
+    if stats["files_removed"] or stats["emails_removed"]:
+        METRICS.inc("email_rag_retention_removed_emails_total", stats["emails_removed"])
+        logger.info(
+            f"🧹 Retention on {data_dir}: removed {stats['files_removed']} day files and "
+            f"{stats['emails_removed']} emails, kept {stats['emails_kept']}"
+        )
+    return stats
+
+
+class Compactor:
+    """
+    Background loop that runs every task from tasks_fn() each interval_s.
+    Tasks are zero-argument callables, e.g. a loaded chain's compact() or
+    apply_retention for a tenant that isn't loaded.
+    """
+
+    def __init__(self, tasks_fn: Callable[[], Iterable[Callable[[], Any]]],
+                 interval_s: float = COMPACTION_INTERVAL_S):
+        self.tasks_fn = tasks_fn
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self):
+        try:
+            tasks = list(self.tasks_fn())
+        except Exception as e:
+            logger.error(f"Could not list compaction tasks: {e}", exc_info=True)
+            return
+        for task in tasks:
+            try:
+                with METRICS.span("compaction"):
+                    task()
+            except Exception as e:
+                logger.error(f"Compaction task failed: {e}", exc_info=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.run_once()
+
+    def start(self) -> "Compactor":
+        if self.interval_s > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="compactor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
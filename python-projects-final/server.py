@@ -1,13 +1,20 @@
 # server.py
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import Depends, FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import datetime, os, json
 
-from chat import make_chatbot
-from fetch_emails import fetch_emails_since
-from vectorstore import build_vectorstore_from_emails
-from query import ask, did_receive_from
+from jobs import JobManager
+from lazy_init import LazyResource, NotReadyError
+from memory_accounting import MemoryAccountant, StageMemoryProfiler
+from retention import Compactor, apply_retention
+from singleflight import SingleFlight, chat_key
+from tenants import (
+    Tenant, TenantAuthError, TenantCache, UnknownTenantError, all_tenant_ids, authenticate, bearer_token, get_tenant
+)
+from tracing import METRICS
 
 app = FastAPI()
 
@@ -20,29 +27,185 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-chatbot = make_chatbot()
+def _make_models():
+    # langchain, sentence-transformers and the GPT4All model load here, not at import time
+    from llm_backends import make_llm
+    from vectorstore import EMBED_MODEL, SentenceTransformerEmbeddings
+    return make_llm(), SentenceTransformerEmbeddings(model_name=EMBED_MODEL)
+
+# Loaded once and shared by every tenant's chatbot
+models = LazyResource("models", _make_models)
+
+def _make_chatbot(tenant):
+    from chat import make_chatbot
+    llm, embeddings = models.get()
+    return make_chatbot(tenant.persist_dir, llm=llm, embeddings=embeddings)
+
+# One chatbot per tenant (X-Tenant-ID header), least recently used ones evicted
+chatbots = TenantCache("chatbot", _make_chatbot)
+
+# Every /build re-indexes today's file, so only the day files need retention here
+compactor = Compactor(lambda: [
+    lambda data_dir=get_tenant(tenant_id).data_dir: apply_retention(data_dir) for tenant_id in all_tenant_ids()
+])
+
+def _loaded_models():
+    if not models.ready:
+        return {}
+    llm, embeddings = models.get()
+    return {"llm": llm, "embeddings": embeddings}
+
+# Per-component sizes for /memory; evicts tenants over EMAIL_RAG_MEMORY_BUDGET_MB
+profiler = StageMemoryProfiler()
+memory = MemoryAccountant(_loaded_models, [chatbots], profiler=profiler)
+
+@app.on_event("startup")
+def start_loading():
+    models.start()
+    compactor.start()
+    profiler.install()
+
+def _tenant(x_tenant_id: Optional[str] = Header(default=None),
+            authorization: Optional[str] = Header(default=None)) -> Tenant:
+    """Resolve the X-Tenant-ID header and check the tenant's bearer token, turning failures into HTTP errors"""
+    try:
+        return authenticate(x_tenant_id, bearer_token(authorization))
+    except TenantAuthError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 class Question(BaseModel):
     question: str
 
+# Identical questions asked while one is being answered share that answer
+chat_flights = SingleFlight("chat")
+
 @app.post("/chat")
-def chat_api(q: Question):
-    result = chatbot({"question": q.question, "chat_history": []})
-    return {"answer": result["answer"]}
+def chat_api(q: Question, tenant: Tenant = Depends(_tenant)):
+    try:
+        bot = chatbots.get(tenant.tenant_id)
+    except NotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    def answer():
+        with METRICS.trace("chat", tenant=tenant.tenant_id):
+            return bot({"question": q.question, "chat_history": []})["answer"]
+    # A rebuilt index means a new chatbot object, so id(bot) versions the index
+    answer, _ = chat_flights.do(chat_key(q.question, tenant.tenant_id, id(bot)), answer)
+    memory.enforce()
+    return {"answer": answer}
+
+# One running fetch per tenant/mailbox/day and one build per index; duplicate requests join the running job
+jobs = JobManager()
+
+def _fetch_job(tenant, mailbox: str):
+    def run(job):
+        from fetch_emails import fetch_emails_since
+        today = datetime.date.today()
+        with METRICS.trace("fetch", tenant=tenant.tenant_id) as span:
+            emails = fetch_emails_since(
+                today,
+                mailbox=mailbox,
+                progress=lambda done, total: job.report(done / total, f"Fetched {done}/{total} emails"),
+                account=tenant.account,
+                data_dir=tenant.data_dir
+            )
+            span.set(emails=len(emails))
+        return {"fetched": len(emails)}
+    return jobs.submit("fetch", f"fetch:{tenant.tenant_id}:{mailbox}:{datetime.date.today().isoformat()}", run)
 
+def _build_job(tenant):
+    def run(job):
+        from vectorstore import build_vectorstore_from_emails
+        today = datetime.date.today()
+        data_fname = os.path.join(tenant.data_dir, f"emails_{today.isoformat()}.json")
+        if not os.path.exists(data_fname):
+            raise FileNotFoundError("No emails found. Run fetch first.")
+        with open(data_fname, "r", encoding="utf-8") as f:
+            emails = json.load(f)
+        _, embeddings = models.get()
+        with METRICS.trace("build", tenant=tenant.tenant_id, emails=len(emails)):
+            build_vectorstore_from_emails(
+                emails, progress=job.report, persist_dir=tenant.persist_dir, embeddings=embeddings,
+                data_dir=tenant.data_dir
+            )
+        chatbots.evict(tenant.tenant_id)  # the next /chat loads the new index
+        return {"status": "Vectorstore built", "emails": len(emails)}
+    return jobs.submit("build", f"build:{tenant.tenant_id}:faiss_index", run)
+
+def _job_tenant(job):
+    # Keys are "<kind>:<tenant>:..."
+    return job.key.split(":")[1]
+
+def _tenant_job(job_id: str, tenant):
+    job = jobs.get(job_id)
+    # Never show one tenant another tenant's jobs
+    if job is None or _job_tenant(job) != tenant.tenant_id:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.post("/jobs/fetch", status_code=202)
+def start_fetch(mailbox: str = "INBOX", tenant: Tenant = Depends(_tenant)):
+    # Day files, tombstones and the index hold one mailbox per data_dir; another
+    # mailbox would overwrite the same emails_<date>.json
+    if mailbox.upper() != "INBOX":
+        raise HTTPException(status_code=400, detail="Only INBOX can be fetched")
+    return _fetch_job(tenant, "INBOX").as_dict()
+
+@app.post("/jobs/build", status_code=202)
+def start_build(tenant: Tenant = Depends(_tenant)):
+    return _build_job(tenant).as_dict()
+
+@app.get("/jobs")
+def list_jobs(tenant: Tenant = Depends(_tenant)):
+    return {"jobs": [job.as_dict() for job in jobs.list() if _job_tenant(job) == tenant.tenant_id]}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str, tenant: Tenant = Depends(_tenant)):
+    return _tenant_job(job_id, tenant).as_dict()
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str, tenant: Tenant = Depends(_tenant)):
+    _tenant_job(job_id, tenant)
+    return jobs.cancel(job_id).as_dict()
+
+# Blocking forms kept for older clients; they wait on the (coalesced) job
 @app.get("/fetch")
-def fetch():
-    today = datetime.date.today()
-    emails = fetch_emails_since(today)
-    return {"fetched": len(emails)}
+def fetch(tenant: Tenant = Depends(_tenant)):
+    job = _fetch_job(tenant, "INBOX")
+    job.wait()
+    if job.error:
+        return {"error": job.error}
+    return job.result or {"error": job.message}
 
 @app.get("/build")
-def build():
-    today = datetime.date.today()
-    data_fname = f"data/emails_{today.isoformat()}.json"
-    if not os.path.exists(data_fname):
-        return {"error": "No emails found. Run fetch first."}
-    with open(data_fname, "r", encoding="utf-8") as f:
-        emails = json.load(f)
-    build_vectorstore_from_emails(emails)
-    return {"status": "Vectorstore built"}
+def build(tenant: Tenant = Depends(_tenant)):
+    job = _build_job(tenant)
+    job.wait()
+    if job.error:
+        return {"error": job.error}
+    return job.result or {"error": job.message}
+
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Readiness: the models are loaded and /chat will answer without waiting on them"""
+    status = {"ready": models.ready, "models": models.status(), "tenants": chatbots.stats()}
+    return JSONResponse(status, status_code=200 if models.ready else 503)
+
+@app.get("/memory")
+def memory_report():
+    """Estimated bytes per component (models, index, docstore) and per tenant"""
+    return memory.report()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return METRICS.render_prometheus()
@@ -1,8 +1,17 @@
 # Updated server.py
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import Depends, FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from email_chain import make_email_chain
+from lazy_init import LazyResource, NotReadyError
+from memory_accounting import MemoryAccountant, StageMemoryProfiler
+from retention import Compactor, apply_retention
+from singleflight import SingleFlight, chat_key
+from tenants import (
+    Tenant, TenantAuthError, TenantCache, UnknownTenantError, all_tenant_ids, authenticate, bearer_token, get_tenant
+)
+from tracing import METRICS
 
 app = FastAPI()
 
@@ -14,21 +23,114 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the chain once
-email_chain = make_email_chain()
+def _make_models():
+    # Heavy imports (langchain, sentence-transformers, FAISS) and the model load happen here
+    from email_chain import make_models
+    return make_models()
+
+# Load the models once, in the background (see lazy_init.INIT_MODE); every tenant shares them
+models = LazyResource("models", _make_models)
+
+def _make_tenant_chain(tenant):
+    from email_chain import EmailRAGConfig, make_email_chain
+    llm, embeddings = models.get()
+    config = EmailRAGConfig(
+        data_dir=tenant.data_dir,
+        persist_dir=tenant.persist_dir,
+        imap_account=tenant.account
+    )
+    return make_email_chain(config, llm=llm, embeddings=embeddings)
+
+# One chain per tenant (X-Tenant-ID header), least recently used ones evicted
+email_chains = TenantCache("email_chain", _make_tenant_chain)
+
+def _compaction_tasks():
+    """Loaded tenants compact their index too; the others only get file retention"""
+    loaded = dict(email_chains.items())
+    tasks = [chain.compact for chain in loaded.values()]
+    for tenant_id in all_tenant_ids():
+        if tenant_id not in loaded:
+            tasks.append(lambda data_dir=get_tenant(tenant_id).data_dir: apply_retention(data_dir))
+    return tasks
+
+compactor = Compactor(_compaction_tasks)
+
+def _loaded_models():
+    if not models.ready:
+        return {}
+    from email_chain import fallback_llms
+    llm, embeddings = models.get()
+    return {"llm": llm, "embeddings": embeddings, **{f"fallback:{name}": m for name, m in fallback_llms().items()}}
+
+# Per-component sizes for /memory; evicts sessions, email caches, then tenants over EMAIL_RAG_MEMORY_BUDGET_MB
+profiler = StageMemoryProfiler()
+memory = MemoryAccountant(_loaded_models, [email_chains], profiler=profiler)
+
+@app.on_event("startup")
+def start_loading():
+    models.start()
+    compactor.start()
+    profiler.install()
+
+def _tenant(x_tenant_id: Optional[str] = Header(default=None),
+            authorization: Optional[str] = Header(default=None)) -> Tenant:
+    """Resolve the X-Tenant-ID header and check the tenant's bearer token, turning failures into HTTP errors"""
+    try:
+        return authenticate(x_tenant_id, bearer_token(authorization))
+    except TenantAuthError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 class Question(BaseModel):
     question: str
+    budget_ms: Optional[float] = None  # latency budget; the chain degrades to meet it (EMAIL_RAG_CHAT_BUDGET_MS if unset)
+
+# Identical questions asked while one is being answered share that answer
+chat_flights = SingleFlight("chat")
 
 @app.post("/chat")
-def chat_api(q: Question):
+def chat_api(q: Question, tenant: Tenant = Depends(_tenant)):
     """Single endpoint that handles everything: fetch → build → chat"""
-    result = email_chain({"question": q.question})
+    try:
+        chain = email_chains.get(tenant.tenant_id)
+    except NotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    inputs = {"question": q.question}
+    if q.budget_ms is not None:
+        inputs["budget_ms"] = q.budget_ms
+    def answer():
+        result = chain(inputs)
+        email_chains.refresh(tenant.tenant_id)  # the first question fetches and indexes the mailbox
+        memory.enforce()
+        return result
+    # A budget can change the answer (degraded path), so only equal budgets share one
+    version = f"{chain.index_version}:{q.budget_ms}"
+    result, _ = chat_flights.do(chat_key(q.question, tenant.tenant_id, version), answer)
     return {
         "answer": result["answer"],
-        
+        "path": result["path"],
     }
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
\ No newline at end of file
+    """Liveness: the process is up, even while the chain is still loading"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Readiness: the models are loaded and /chat will answer without waiting on them"""
+    status = {"ready": models.ready, "models": models.status(), "tenants": email_chains.stats()}
+    return JSONResponse(status, status_code=200 if models.ready else 503)
+
+@app.get("/memory")
+def memory_report():
+    """Estimated bytes per component (models, index, docstore, email cache, sessions) and per tenant"""
+    return memory.report()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Stage latency histograms, token counters and cache hit rates (Prometheus text format)"""
+    return METRICS.render_prometheus()
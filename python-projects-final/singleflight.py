@@ -0,0 +1,81 @@
+# singleflight.py
+"""
+Coalescing of identical in-flight requests.
+
+When many dashboards open at once they send the same question ("how many
+emails today?") within the same second. SingleFlight runs the first call and
+hands its result, or its exception, to every identical call that arrives
+while it is running. Nothing is cached after the call finishes, so a later
+request always gets a fresh answer.
+"""
+import re
+import logging
+import threading
+import unicodedata
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Case, Unicode form, whitespace and trailing punctuation don't change the answer"""
+    text = unicodedata.normalize("NFKC", question or "").casefold()
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ")
+
+
+def chat_key(question: str, tenant_id: str, index_version: Any) -> Tuple[str, str, str]:
+    return normalize_question(question), tenant_id, str(index_version)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(result of fn, whether it was shared with an identical call already in flight)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            METRICS.inc("email_rag_singleflight_total", group=self.name, role="follower")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        METRICS.inc("email_rag_singleflight_total", group=self.name, role="leader")
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.info(f"🔗 {self.name}: one execution served {call.waiters + 1} identical requests")
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -1,34 +1,25 @@
-# summarize.py - Using FREE OpenRouter
-import os
+# summarize.py
+# Any backend from llm_backends works; for OpenRouter set EMAIL_RAG_LLM_BACKEND=openai_compat,
+# EMAIL_RAG_LLM_BASE_URL=https://openrouter.ai/api/v1 and OPENROUTER_API_KEY
 from dotenv import load_dotenv
 load_dotenv()
 
 from langchain.prompts.prompt import PromptTemplate
-from langchain_community.llms import GPT4All
-
-# Get your FREE API key from https://openrouter.ai/settings/keys
-OPENROUTER_KEY = os.getenv("OPENROUTER_API_KEY")
+from llm_backends import make_llm
 
 def summarize_emails(emails, bullets=20):
     
     # Prepare combined email text
     parts = []
     for e in emails:
-        body = e.get("body", "") or ""
+        body = e.get("clean_body") or e.get("body", "") or ""
         if len(body) > 800:
             body = body[:800] + " ... (truncated)"
         parts.append(f"From: {e['from']}\nSubject: {e['subject']}\nBody:\n{body}")
 
     combined = "\n\n---\n\n".join(parts) if parts else "No emails."
 
-    # Use FREE OpenRouter model - DeepSeek R1 is free and powerful!
-    llm = GPT4All(
-        model="mistral-7b-instruct-v0.1.Q4_0.gguf"
-        # api_key=OPENROUTER_KEY,
-        # base_url="https://openrouter.ai/api/v1",
-        # temperature=0,
-        # max_tokens=800
-    )
+    llm = make_llm()
 
     template = """You are an assistant that reads emails and creates concise summaries.
 
@@ -49,4 +40,4 @@ Summary bullets:"""
         result = chain.invoke({"emails": combined, "bullets": bullets})
         return result.content if hasattr(result, 'content') else str(result)
     except Exception as e:
-        return f"Error: {str(e)}. Make sure you have a valid OpenRouter API key."
\ No newline at end of file
+        return f"Error: {str(e)}. Check the LLM backend settings (EMAIL_RAG_LLM_*)."
\ No newline at end of file
@@ -0,0 +1,344 @@
+# tenants.py
+"""
+Tenant-scoped mailboxes, so one server can host many users.
+
+Each tenant has its own IMAP account and its own data/ and faiss_index/ under
+tenants/<tenant_id>/. API calls name the tenant in the X-Tenant-ID header.
+Calls without it go to the "default" tenant, which keeps the single-mailbox
+layout (./data, ./faiss_index, EMAIL_USER/EMAIL_PASSWORD), so existing
+deployments are unaffected.
+
+The header alone proves nothing, so every call must also carry the tenant's
+API token as "Authorization: Bearer <token>". `tenants.py add` issues a
+token for a new tenant and `tenants.py token` issues a replacement. Only
+its SHA-256 is stored in tenant.json. Tenants without a token are
+refused. The default tenant takes EMAIL_RAG_API_TOKEN and is open when
+that variable is unset, as it always was.
+
+Per-tenant state (chains with their vectorstores and emails) is held in a
+TenantCache: an LRU bounded by entry count and estimated bytes. Cold tenants
+are evicted and reloaded from disk on their next request.
+
+    python tenants.py add alice --user alice@example.com --password-env ALICE_IMAP_PASSWORD
+    python tenants.py token alice
+    python tenants.py list
+"""
+import os
+import re
+import hmac
+import json
+import time
+import hashlib
+import logging
+import argparse
+import secrets
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from atomic_io import atomic_write_json
+from fetch_emails import IMAPAccount, default_account
+from memory_accounting import chain_bytes
+from tracing import METRICS
+
+logger = logging.getLogger(__name__)
+
+TENANTS_DIR = os.getenv("EMAIL_RAG_TENANTS_DIR", "tenants")
+TENANT_CACHE_ENTRIES = int(os.getenv("EMAIL_RAG_TENANT_CACHE_ENTRIES", 64))
+TENANT_CACHE_MB = int(os.getenv("EMAIL_RAG_TENANT_CACHE_MB", 4096))
+DEFAULT_TENANT = "default"
+TENANT_HEADER = "X-Tenant-ID"
+DEFAULT_TENANT_TOKEN = os.getenv("EMAIL_RAG_API_TOKEN")
+TENANT_FILE = "tenant.json"
+# Tenant ids become directory names: no separators, no leading dot
+TENANT_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+MB = 1024 * 1024
+
+
+class UnknownTenantError(LookupError):
+    """No tenant.json for this tenant id"""
+
+
+class TenantAuthError(PermissionError):
+    """Missing or wrong API token for the tenant"""
+
+
+@dataclass
+class Tenant:
+    tenant_id: str
+    data_dir: str
+    persist_dir: str
+    account: IMAPAccount
+    token_sha256: Optional[str] = None  # None: no token issued
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    if not TENANT_ID_RE.match(tenant_id or ""):
+        raise ValueError(f"Invalid tenant id {tenant_id!r}")
+    return tenant_id
+
+
+def _tenant_root(tenant_id: str) -> str:
+    return os.path.join(TENANTS_DIR, validate_tenant_id(tenant_id))
+
+
+def get_tenant(tenant_id: Optional[str] = None) -> Tenant:
+    """Resolve a tenant id (None or "default" for the single-mailbox layout)"""
+    if not tenant_id or tenant_id == DEFAULT_TENANT:
+        token_sha256 = hash_token(DEFAULT_TENANT_TOKEN) if DEFAULT_TENANT_TOKEN else None
+        return Tenant(DEFAULT_TENANT, "data", "faiss_index", default_account(), token_sha256)
+
+    root = _tenant_root(tenant_id)
+    settings = _read_settings(tenant_id)
+
+    # Prefer a reference to an environment variable over a password stored on disk
+    password = os.getenv(settings["password_env"]) if settings.get("password_env") else settings.get("password")
+    return Tenant(
+        tenant_id=tenant_id,
+        data_dir=os.path.join(root, "data"),
+        persist_dir=os.path.join(root, "faiss_index"),
+        account=IMAPAccount(
+            user=settings["user"],
+            password=password,
+            server=settings.get("imap_server", "imap.gmail.com"),
+            port=int(settings.get("imap_port", 993)),
+            ssl=settings.get("imap_ssl", True)
+        ),
+        token_sha256=settings.get("token_sha256")
+    )
+
+
+def _read_settings(tenant_id: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(_tenant_root(tenant_id), TENANT_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UnknownTenantError(f"Unknown tenant {tenant_id!r}")
+
+
+def _write_settings(tenant_id: str, settings: Dict[str, Any]):
+    path = os.path.join(_tenant_root(tenant_id), TENANT_FILE)
+    atomic_write_json(path, settings, indent=2)
+    os.chmod(path, 0o600)
+
+
+def authenticate(tenant_id: Optional[str], token: Optional[str]) -> Tenant:
+    """The tenant named by X-Tenant-ID, if token is its API token"""
+    tenant = get_tenant(tenant_id)
+    if tenant.tenant_id == DEFAULT_TENANT and tenant.token_sha256 is None:
+        return tenant  # single-mailbox deployment without EMAIL_RAG_API_TOKEN
+    if tenant.token_sha256 is None:
+        raise TenantAuthError(f"Tenant {tenant.tenant_id!r} has no API token; issue one with `tenants.py token`")
+    if not token or not hmac.compare_digest(hash_token(token), tenant.token_sha256):
+        raise TenantAuthError(f"Invalid API token for tenant {tenant.tenant_id!r}")
+    return tenant
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """The token of an "Authorization: Bearer <token>" header"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return token.strip() or None
+
+
+def issue_token(tenant_id: str) -> str:
+    """Give a registered tenant a new API token (the old one stops working) and return it"""
+    settings = _read_settings(tenant_id)
+    token = secrets.token_urlsafe(32)
+    settings["token_sha256"] = hash_token(token)
+    _write_settings(tenant_id, settings)
+    logger.info(f"🔑 Issued a new API token for tenant {tenant_id}")
+    return token
+
+
+def register_tenant(tenant_id: str, user: str, password_env: Optional[str] = None,
+                    password: Optional[str] = None, imap_server: str = "imap.gmail.com",
+                    imap_port: int = 993, imap_ssl: bool = True) -> Tenant:
+    """Create or update tenants/<tenant_id>/tenant.json; an existing API token is kept"""
+    if tenant_id == DEFAULT_TENANT:
+        raise ValueError("The default tenant is configured through EMAIL_* environment variables")
+    settings = {"user": user, "imap_server": imap_server, "imap_port": imap_port, "imap_ssl": imap_ssl}
+    if password_env:
+        settings["password_env"] = password_env
+    elif password:
+        settings["password"] = password
+    try:
+        token_sha256 = _read_settings(tenant_id).get("token_sha256")
+    except UnknownTenantError:
+        token_sha256 = None
+    if token_sha256:
+        settings["token_sha256"] = token_sha256
+    _write_settings(tenant_id, settings)
+    logger.info(f"✓ Registered tenant {tenant_id}")
+    return get_tenant(tenant_id)
+
+
+def all_tenant_ids() -> List[str]:
+    return [DEFAULT_TENANT] + list_tenants()
+
+
+def list_tenants() -> List[str]:
+    if not os.path.isdir(TENANTS_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(TENANTS_DIR)
+        if os.path.exists(os.path.join(TENANTS_DIR, name, TENANT_FILE))
+    )
+
+
+def estimate_footprint(value: Any) -> int:
+    """
+    Estimated bytes held by a tenant's chain: index, docstore, cached emails and
+    conversation memory (memory_accounting.chain_components). Models are shared
+    across tenants and not counted.
+    """
+    return chain_bytes(value)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "loaded_at")
+
+    def __init__(self, value: Any, size: int):
+        self.value = value
+        self.size = size
+        self.loaded_at = time.time()
+
+
+class TenantCache:
+    """
+    LRU of per-tenant objects built by loader(tenant). Concurrent requests for
+    a cold tenant share one load. After each load or refresh() the least
+    recently used tenants are evicted until the cache is within max_entries
+    and max_bytes (the most recent tenant is always kept).
+    """
+
+    def __init__(self, name: str, loader: Callable[[Tenant], Any],
+                 size_fn: Callable[[Any], int] = estimate_footprint,
+                 max_entries: int = TENANT_CACHE_ENTRIES, max_bytes: int = TENANT_CACHE_MB * MB):
+        self.name = name
+        self.loader = loader
+        self.size_fn = size_fn
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, tenant_id: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(tenant_id)
+            return entry
+
+    def get(self, tenant_id: Optional[str] = None) -> Any:
+        """The tenant's object, loading it if it is not cached"""
+        tenant_id = tenant_id or DEFAULT_TENANT
+        entry = self._lookup(tenant_id)
+        if entry is not None:
+            METRICS.cache_hit(self.name)
+            return entry.value
+
+        tenant = get_tenant(tenant_id)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(tenant_id, threading.Lock())
+        with load_lock:
+            entry = self._lookup(tenant_id)  # loaded while we waited
+            if entry is not None:
+                METRICS.cache_hit(self.name)
+                return entry.value
+            METRICS.cache_hit(self.name, hit=False)
+
+            start = time.perf_counter()
+            value = self.loader(tenant)
+            load_ms = (time.perf_counter() - start) * 1000
+            METRICS.observe("email_rag_tenant_load_ms", load_ms, cache=self.name)
+            size = self.size_fn(value)
+            logger.info(f"✓ Loaded {self.name} for tenant {tenant_id} in {load_ms:.0f} ms (~{size / MB:.1f} MB)")
+
+            with self._lock:
+                self._entries[tenant_id] = _Entry(value, size)
+                self._evict_over_budget()
+        return value
+
+    def refresh(self, tenant_id: Optional[str] = None):
+        """Re-measure a tenant after a request grew its state (first fetch, index build)"""
+        tenant_id = tenant_id or DEFAULT_TENANT
+        with self._lock:
+            entry = self._entries.get(tenant_id)  # not a use: recency stays as it was
+        if entry is None:
+            return
+        size = self.size_fn(entry.value)
+        with self._lock:
+            entry.size = size
+            self._evict_over_budget()
+
+    def evict(self, tenant_id: Optional[str] = None) -> bool:
+        """Drop a tenant, e.g. after its index was rebuilt on disk; the next get() reloads it"""
+        with self._lock:
+            return self._entries.pop(tenant_id or DEFAULT_TENANT, None) is not None
+
+    def _evict_over_budget(self):
+        # Caller holds self._lock
+        total = sum(e.size for e in self._entries.values())
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            tenant_id, entry = self._entries.popitem(last=False)
+            total -= entry.size
+            METRICS.inc("email_rag_tenant_evictions_total", cache=self.name)
+            logger.info(f"♻️ Evicted {self.name} for tenant {tenant_id} (~{entry.size / MB:.1f} MB)")
+
+    def items(self) -> List[Any]:
+        """(tenant_id, value) of every loaded tenant, most recently used first"""
+        with self._lock:
+            return [(tenant_id, entry.value) for tenant_id, entry in reversed(self._entries.items())]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": sum(e.size for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "tenants": list(reversed(self._entries)),  # most recently used first
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage tenants (one mailbox each)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Register or update a tenant")
+    add.add_argument("tenant_id")
+    add.add_argument("--user", required=True, help="IMAP login")
+    add.add_argument("--password-env", help="Environment variable holding the IMAP password")
+    add.add_argument("--imap-server", default="imap.gmail.com")
+    add.add_argument("--imap-port", type=int, default=993)
+    add.add_argument("--no-ssl", action="store_true")
+    token = sub.add_parser("token", help="Issue a new API token for a tenant (the old one stops working)")
+    token.add_argument("tenant_id")
+    sub.add_parser("list", help="List registered tenants")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        tenant = register_tenant(
+            args.tenant_id, args.user, password_env=args.password_env,
+            imap_server=args.imap_server, imap_port=args.imap_port, imap_ssl=not args.no_ssl
+        )
+        print(f"Tenant {tenant.tenant_id}: data in {tenant.data_dir}, index in {tenant.persist_dir}")
+        if tenant.token_sha256 is None:
+            print(f"API token (shown once): {issue_token(tenant.tenant_id)}")
+    elif args.command == "token":
+        print(f"API token for {args.tenant_id} (shown once): {issue_token(args.tenant_id)}")
+    else:
+        for tenant_id in list_tenants():
+            print(tenant_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# tracing.py
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("email_rag_trace", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) used for prompt-size reporting"""
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bucket bound containing the q-quantile (None if empty)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            running += n
+            if running >= target:
+                return bound
+        return float("inf")
+
+
+class Span:
+    def __init__(self, stage: str, attrs: Dict[str, Any]):
+        self.stage = stage
+        self.attrs = dict(attrs)
+        self.duration_ms = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"stage": self.stage, "duration_ms": round(self.duration_ms, 2), **self.attrs}
+
+
+class MetricsRegistry:
+    """
+    In-process stage spans, counters and histograms.
+    Spans recorded inside a trace() block are also collected and logged
+    as a single structured line when the trace ends.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._span_hooks: List[Callable[[Span], Any]] = []
+
+    def add_span_hook(self, hook: Callable[[Span], Any]):
+        """hook(span) returns a context manager entered around the body of every span (e.g. memory profiling)"""
+        self._span_hooks.append(hook)
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+            self._histograms[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def cache_hit(self, cache: str, hit: bool = True):
+        self.inc("email_rag_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        span = Span(stage, attrs)
+        start = time.perf_counter()
+        try:
+            if self._span_hooks:
+                with ExitStack() as hooks:
+                    for hook in self._span_hooks:
+                        hooks.enter_context(hook(span))
+                    yield span
+            else:
+                yield span
+        except Exception:
+            span.set(error=True)
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - start) * 1000
+            self.observe("email_rag_stage_duration_ms", span.duration_ms, stage=stage)
+            for key in ("prompt_tokens", "completion_tokens"):
+                if key in span.attrs:
+                    self.inc(f"email_rag_{key}_total", span.attrs[key], stage=stage)
+            if "retrieved_docs" in span.attrs:
+                self.observe("email_rag_retrieved_docs", span.attrs["retrieved_docs"], buckets=COUNT_BUCKETS, stage=stage)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.append(span.as_dict())
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Collect every span of one request and log them as one JSON line"""
+        spans: List[Dict[str, Any]] = []
+        token = _current_trace.set(spans)
+        try:
+            with self.span(name, **attrs) as root:
+                yield root
+        finally:
+            _current_trace.reset(token)
+            logger.info(json.dumps({"trace": name, "spans": spans}, default=str))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {
+                    f"{name}{dict(labels)}": value for (name, labels), value in self._counters.items()
+                },
+                "histograms": {
+                    f"{name}{dict(labels)}": {
+                        "count": h.count,
+                        "sum": round(h.sum, 2),
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                    }
+                    for (name, labels), h in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                running = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    running += n
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {running}")
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {h.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
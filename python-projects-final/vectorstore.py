@@ -5,36 +5,54 @@ load_dotenv()
 
 from langchain.embeddings import SentenceTransformerEmbeddings
 from langchain.vectorstores import FAISS
+from atomic_io import file_lock, replace_directory
+from attachments import get_extractor
 
 EMBED_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
 PERSIST_DIR = "faiss_index"
 
-def build_vectorstore_from_emails(emails, persist=True):
+def build_vectorstore_from_emails(emails, persist=True, progress=None, persist_dir=PERSIST_DIR, embeddings=None,
+                                  data_dir="data"):
+    """progress(fraction, message) is called between stages; raising from it aborts the build"""
     texts = []
     metadatas = []
+    extractor = get_extractor(data_dir)
     for e in emails:
-        text = f"From: {e['from']}\nDate: {e['date']}\nSubject: {e['subject']}\n\n{e['body']}"
+        body = e.get("clean_body") or e["body"]
+        text = f"From: {e['from']}\nDate: {e['date']}\nSubject: {e['subject']}\n\n{body}"
         texts.append(text)
         metadatas.append({
             "from": e["from"],
             "sender_email": e.get("sender_email"),
             "date": e["date"],
             "subject": e["subject"],
-            "body": e["body"][:200] 
+            "body": body[:200]
         })
-
-    embeddings = SentenceTransformerEmbeddings(model_name=EMBED_MODEL)
+        # Extracted attachment text (see attachments.py) goes into the same store, one entry per attachment
+        for attachment in e.get("attachments", []):
+            attachment_text = extractor.text(attachment["sha256"])
+            if attachment_text:
+                texts.append(f"From: {e['from']}\nDate: {e['date']}\nSubject: {e['subject']}\n"
+                             f"Attachment: {attachment['filename']}\n\n{attachment_text}")
+                metadatas.append({**metadatas[-1], "attachment": attachment["filename"]})
+
+    if progress:
+        progress(0.1, f"Embedding {len(texts)} emails")
+    embeddings = embeddings or SentenceTransformerEmbeddings(model_name=EMBED_MODEL)
     vectorstore = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
 
     if persist:
-        os.makedirs(PERSIST_DIR, exist_ok=True)
-        vectorstore.save_local(PERSIST_DIR)
+        if progress:
+            progress(0.9, "Saving index")
+        # Written to a temp dir and swapped in, so concurrent loads never see a partial index
+        replace_directory(persist_dir, vectorstore.save_local)
 
     return vectorstore
 
 
-def load_vectorstore():
-    embeddings = SentenceTransformerEmbeddings(model_name=EMBED_MODEL)
-    if not os.path.exists(PERSIST_DIR):
-        raise FileNotFoundError("Index not found. Run build_vectorstore_from_emails first.")
-    return FAISS.load_local(PERSIST_DIR, embeddings,allow_dangerous_deserialization=True)
+def load_vectorstore(persist_dir=PERSIST_DIR, embeddings=None):
+    embeddings = embeddings or SentenceTransformerEmbeddings(model_name=EMBED_MODEL)
+    with file_lock(persist_dir, shared=True):
+        if not os.path.exists(persist_dir):
+            raise FileNotFoundError("Index not found. Run build_vectorstore_from_emails first.")
+        return FAISS.load_local(persist_dir, embeddings,allow_dangerous_deserialization=True)
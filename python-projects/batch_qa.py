@@ -0,0 +1,130 @@
+# batch_qa.py
+"""
+Batch question answering over a FAISS vectorstore.
+
+Questions are processed in blocks. Each block is embedded in one call,
+searched with one multi-query FAISS search, and answered with bounded
+concurrency. Results are streamed out as JSONL as soon as each one is
+ready, so evaluation sets with thousands of questions need neither one
+model load per question nor all answers held in memory.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+BATCH_PROMPT = """Use the following context to answer the question. If the answer is not in the context, say you don't know.
+
+Context:
+{context}
+
+Question: {question}
+Answer:"""
+
+
+def read_questions(path: str) -> Iterator[Tuple[str, str]]:
+    """(id, question) pairs from a JSONL file ({"id", "question"}) or one question per line"""
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                yield str(record.get("id", n)), record["question"]
+            else:
+                yield str(n), line
+
+
+def batch_retrieve(vectorstore, embeddings, questions: List[str], k: int) -> List[List[Any]]:
+    """Embed all questions at once and run a single multi-query FAISS search"""
+    import faiss
+
+    vectors = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+    _, indices = vectorstore.index.search(vectors, k)
+
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            if i == -1:  # fewer than k vectors in the index
+                continue
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+            if not isinstance(doc, str):  # docstore returns an error string for unknown ids
+                docs.append(doc)
+        results.append(docs)
+    return results
+
+
+def _generate(llm, prompt: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        result = llm.invoke(prompt)
+        record["answer"] = getattr(result, "content", result)  # chat models return a message
+    except Exception as e:
+        record["error"] = str(e)
+    record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+def run_batch(
+    questions: Iterator[Tuple[str, str]],
+    vectorstore,
+    embeddings,
+    llm,
+    out,
+    k: int = 3,
+    concurrency: int = 4,
+    block_size: int = 256,
+    prompt_template: str = BATCH_PROMPT,
+) -> Dict[str, Any]:
+    """
+    Answer every question and write one JSON line per answer to `out` in completion order.
+    concurrency bounds in-flight LLM calls; use 1 for local models that are not thread-safe.
+    """
+    stats = {"questions": 0, "errors": 0, "retrieval_ms": 0.0, "elapsed_ms": 0.0}
+    start = time.perf_counter()
+
+    def blocks():
+        block = []
+        for item in questions:
+            block.append(item)
+            if len(block) == block_size:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for block in blocks():
+            t0 = time.perf_counter()
+            docs_per_question = batch_retrieve(vectorstore, embeddings, [q for _, q in block], k)
+            stats["retrieval_ms"] += (time.perf_counter() - t0) * 1000
+
+            futures = []
+            for (qid, question), docs in zip(block, docs_per_question):
+                context = "\n\n".join(doc.page_content for doc in docs)
+                record = {
+                    "id": qid,
+                    "question": question,
+                    "answer": None,
+                    "sources": [doc.metadata.get("source") or doc.metadata.get("subject") for doc in docs],
+                }
+                prompt = prompt_template.format(context=context, question=question)
+                futures.append(pool.submit(_generate, llm, prompt, record))
+
+            for future in as_completed(futures):
+                record = future.result()
+                stats["questions"] += 1
+                stats["errors"] += "error" in record
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+    stats["elapsed_ms"] = (time.perf_counter() - start) * 1000
+    stats["retrieval_ms"] = round(stats["retrieval_ms"], 1)
+    stats["elapsed_ms"] = round(stats["elapsed_ms"], 1)
+    return stats
@@ -0,0 +1,233 @@
+# pdf_ingest.py
+"""
+Incremental PDF ingestion for pdf_rag.py.
+
+PDFs are parsed page-range by page-range across a process pool, fingerprinted
+by sha256, and their chunks + embeddings cached per fingerprint under the index
+directory. A re-run only parses and embeds files whose content changed; the
+FAISS index is rebuilt from cached vectors (no re-embedding) and persisted.
+
+    index_dir/
+      manifest.json         settings + {path: {sha256, size, mtime_ns, pages, chunks}}
+      chunks/<sha256>.json  chunk texts and metadata for one file
+      chunks/<sha256>.npy   float32 embeddings for those chunks
+      faiss/                the assembled FAISS index
+"""
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+MANIFEST_VERSION = 1
+PAGES_PER_TASK = 16
+
+
+def file_fingerprint(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _page_count(path: str) -> Tuple[int, Optional[str]]:
+    """Worker: (page count, None), or (0, error) for a corrupt or encrypted PDF"""
+    from pypdf import PdfReader
+    try:
+        return len(PdfReader(path).pages), None
+    except Exception as e:
+        return 0, str(e)
+
+
+def _parse_pages(task: Tuple[str, int, int]) -> Tuple[List[Tuple[int, str]], Optional[str]]:
+    """Worker: extract text for pages [start, stop) of one PDF; errors are returned, not raised"""
+    from pypdf import PdfReader
+    path, start, stop = task
+    try:
+        reader = PdfReader(path)
+        return [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)], None
+    except Exception as e:
+        return [], str(e)
+
+
+class PDFIngestor:
+    def __init__(self, index_dir: str, embeddings, embedding_model: str,
+                 chunk_size: int = 500, chunk_overlap: int = 50, workers: Optional[int] = None):
+        self.index_dir = index_dir
+        self.chunks_dir = os.path.join(index_dir, "chunks")
+        self.faiss_dir = os.path.join(index_dir, "faiss")
+        self.manifest_path = os.path.join(index_dir, "manifest.json")
+        self.embeddings = embeddings
+        self.settings = {
+            "version": MANIFEST_VERSION,
+            "embedding_model": embedding_model,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+        }
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.workers = workers or os.cpu_count() or 1
+
+    # ---------- manifest ----------
+    def _load_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("settings") == self.settings:
+                return manifest
+            print("⚠️ Embedding or chunking settings changed, re-ingesting everything")
+            # Cached chunks and vectors were made with the old settings; none of them may be reused
+            shutil.rmtree(self.chunks_dir, ignore_errors=True)
+            os.makedirs(self.chunks_dir, exist_ok=True)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {"settings": self.settings, "files": {}}
+
+    def _save_manifest(self, manifest: Dict):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def _fingerprint(self, path: str, previous: Optional[Dict]) -> str:
+        """Reuse the stored hash when size and mtime are unchanged, so unchanged files are not re-read"""
+        stat = os.stat(path)
+        if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+            return previous["sha256"]
+        return file_fingerprint(path)
+
+    def _cached(self, sha: str) -> bool:
+        return all(os.path.exists(os.path.join(self.chunks_dir, f"{sha}.{ext}")) for ext in ("json", "npy"))
+
+    # ---------- parsing + embedding ----------
+    def _parse(self, paths: List[str]) -> Tuple[Dict[str, List[Tuple[int, str]]], Dict[str, str]]:
+        """Parse all pages of the given PDFs across a process pool; returns (pages, errors by path)"""
+        pages = {path: [] for path in paths}
+        errors = {}
+        if not paths:
+            return pages, errors
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            counts = {}
+            for path, (count, error) in zip(paths, pool.map(_page_count, paths)):
+                counts[path] = count
+                if error:
+                    errors[path] = error
+            tasks = [
+                (path, start, min(start + PAGES_PER_TASK, counts[path]))
+                for path in paths if path not in errors
+                for start in range(0, counts[path], PAGES_PER_TASK)
+            ]
+            for task, (result, error) in zip(tasks, pool.map(_parse_pages, tasks)):
+                if error:
+                    errors.setdefault(task[0], error)
+                pages[task[0]].extend(result)
+        return {p: pages[p] for p in paths if p not in errors}, errors
+
+    def _ingest_file(self, path: str, sha: str, pages: List[Tuple[int, str]]) -> int:
+        docs = [
+            Document(page_content=text, metadata={"source": path, "page": page, "sha256": sha})
+            for page, text in sorted(pages) if text.strip()
+        ]
+        chunks = self.splitter.split_documents(docs)
+        texts = [c.page_content for c in chunks]
+        vectors = np.asarray(self.embeddings.embed_documents(texts) if texts else [], dtype=np.float32)
+        # Each file appears complete or not at all, so _cached never trusts a torn write
+        base = os.path.join(self.chunks_dir, sha)
+        with open(f"{base}.npy.tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(f"{base}.npy.tmp", f"{base}.npy")
+        with open(f"{base}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"texts": texts, "metadatas": [c.metadata for c in chunks]}, f, ensure_ascii=False)
+        os.replace(f"{base}.json.tmp", f"{base}.json")
+        return len(chunks)
+
+    # ---------- public ----------
+    def ingest(self, pdf_paths: List[str], rebuild: bool = False) -> Optional[FAISS]:
+        """Bring the index up to date with pdf_paths and return it (None if there is nothing to index)"""
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        if rebuild:
+            manifest = {"settings": self.settings, "files": {}}
+        previous_files = manifest["files"]
+
+        files, changed = {}, []
+        for path in sorted(set(os.path.abspath(p) for p in pdf_paths)):
+            stat = os.stat(path)
+            sha = self._fingerprint(path, previous_files.get(path))
+            files[path] = {"sha256": sha, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if rebuild or not self._cached(sha):
+                changed.append(path)
+            else:
+                files[path].update({k: previous_files.get(path, {}).get(k) for k in ("pages", "chunks")})
+
+        unchanged = len(files) - len(changed)
+        print(f"📂 {len(files)} PDFs: {unchanged} unchanged, {len(changed)} to process")
+
+        if changed:
+            print(f"⚙️ Parsing {len(changed)} PDFs with {self.workers} workers...")
+            parsed, errors = self._parse(changed)
+            # A bad file is skipped and left out of the manifest, so the next run tries it again
+            for path, error in errors.items():
+                print(f"  ❌ Error loading {path}: {error}")
+                del files[path]
+            changed = [path for path in changed if path not in errors]
+            done = {}
+            for path in changed:
+                sha = files[path]["sha256"]
+                if sha not in done:  # identical copies are embedded once
+                    done[sha] = self._ingest_file(path, sha, parsed[path])
+                n_chunks = done[sha]
+                files[path].update({"pages": len(parsed[path]), "chunks": n_chunks})
+                print(f"  → {os.path.basename(path)}: {len(parsed[path])} pages, {n_chunks} chunks")
+
+        same_set = {p: f["sha256"] for p, f in files.items()} == {p: f["sha256"] for p, f in previous_files.items()}
+        manifest["files"] = files
+
+        if files and not changed and same_set and os.path.isdir(self.faiss_dir):
+            print("✅ Index up to date, loading from disk")
+            return FAISS.load_local(self.faiss_dir, self.embeddings, allow_dangerous_deserialization=True)
+        vectorstore = self._assemble(files)
+        # Only now does faiss/ match the manifest; a crash before this leaves the old manifest,
+        # which no longer matches the files, so the next run assembles again
+        self._save_manifest(manifest)
+        self._remove_orphans(files)
+        return vectorstore
+
+    def _assemble(self, files: Dict[str, Dict]) -> Optional[FAISS]:
+        """Rebuild the FAISS index from cached chunk vectors, no re-embedding"""
+        text_embeddings, metadatas = [], []
+        # Identical copies share one cache entry and are indexed once, under the first path
+        paths_by_sha = {}
+        for path, info in sorted(files.items()):
+            paths_by_sha.setdefault(info["sha256"], path)
+        for sha, path in paths_by_sha.items():
+            with open(os.path.join(self.chunks_dir, f"{sha}.json"), "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            vectors = np.load(os.path.join(self.chunks_dir, f"{sha}.npy"))
+            text_embeddings.extend(zip(cached["texts"], vectors.tolist()))
+            # The cache may have been written under an older name for the same content
+            metadatas.extend({**md, "source": path} for md in cached["metadatas"])
+        if not text_embeddings:
+            shutil.rmtree(self.faiss_dir, ignore_errors=True)  # don't let a later run load the old one
+            return None
+
+        vectorstore = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas)
+        tmp_dir = self.faiss_dir + ".tmp"
+        vectorstore.save_local(tmp_dir)
+        if os.path.isdir(self.faiss_dir):
+            shutil.rmtree(self.faiss_dir)
+        os.replace(tmp_dir, self.faiss_dir)
+        print(f"🗂️ Index assembled from {len(text_embeddings)} cached chunks")
+        return vectorstore
+
+    def _remove_orphans(self, files: Dict[str, Dict]):
+        live = {f["sha256"] for f in files.values()}
+        for name in os.listdir(self.chunks_dir):
+            if name.split(".", 1)[0] not in live:
+                os.remove(os.path.join(self.chunks_dir, name))
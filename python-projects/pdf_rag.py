@@ -3,50 +3,66 @@ from langchain_openai import ChatOpenAI
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
-from langchain_community.document_loaders import PyPDFLoader  # Fixed import
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
+import argparse
+import contextlib
 import os
+import sys
 import glob
 
-# 1️⃣ Load environment variables
-load_dotenv()
-api_key = os.getenv("OPENROUTER_API_KEY")
+from pdf_ingest import PDFIngestor
+from batch_qa import read_questions, run_batch
 
-# 2️⃣ Initialize LLM (OpenRouter key)
-llm = ChatOpenAI(
-    model="openai/gpt-3.5-turbo",
-    openai_api_key=api_key,
-    base_url="https://openrouter.ai/api/v1",
-    max_tokens=500
-)
-
-# 3️⃣ Find and load PDFs
-print("Looking for PDF files...")
+EMBED_MODEL = "all-MiniLM-L6-v2"
+INDEX_DIR = "pdf_index"
 
 # Check different possible locations
-possible_paths = [
+DEFAULT_PDF_PATTERNS = [
     "LangChain_Basics_Guide.pdf",  # current directory
     "*.pdf",  # any PDF in current directory
     "../*.pdf",  # parent directory
 ]
 
-pdf_files = []
-for path_pattern in possible_paths:
-    found_files = glob.glob(path_pattern)
-    pdf_files.extend(found_files)
-    if found_files:
-        break
-
-if not pdf_files:
-    print("❌ No PDF files found!")
-    print("Current directory contents:")
-    print([f for f in os.listdir('.') if f.endswith('.pdf')])
-    
-    # Create a sample PDF for testing
-    print("\n📄 Creating sample document for testing...")
-    docs = []
-    
+QUERIES = [
+    "What is LangChain used for?",
+    "What is RAG?",
+    "Sample Workflow for RAG",
+    "Name a vector store supported by LangChain"
+]
+
+
+def make_llm():
+    # 1️⃣ Load environment variables
+    load_dotenv()
+    api_key = os.getenv("OPENROUTER_API_KEY")
+
+    # 2️⃣ Initialize LLM (OpenRouter key)
+    return ChatOpenAI(
+        model="openai/gpt-3.5-turbo",
+        openai_api_key=api_key,
+        base_url="https://openrouter.ai/api/v1",
+        max_tokens=500
+    )
+
+
+def find_pdfs(patterns, first_match_only=True):
+    """Expand glob patterns and directories into PDF paths"""
+    pdf_files = []
+    for path_pattern in patterns:
+        if os.path.isdir(path_pattern):
+            path_pattern = os.path.join(path_pattern, "**", "*.pdf")
+        found_files = glob.glob(path_pattern, recursive=True)
+        pdf_files.extend(found_files)
+        if found_files and first_match_only:
+            break
+    return pdf_files
+
+
+def sample_vectorstore(embeddings):
+    """Small in-memory index used when no PDFs are found"""
+    from langchain.schema import Document
+
     # Sample text documents instead of PDF
     sample_texts = [
         "LangChain is a framework for developing applications powered by language models. It enables applications that are context-aware and can reason about their environment.",
@@ -55,88 +71,108 @@ if not pdf_files:
         "Vector databases store high-dimensional vectors and enable similarity search. They are essential for RAG systems to find relevant documents.",
         "FAISS (Facebook AI Similarity Search) is a library for efficient similarity search and clustering of dense vectors."
     ]
-    
-    from langchain.schema import Document
     docs = [Document(page_content=text, metadata={"source": f"sample_doc_{i}"}) for i, text in enumerate(sample_texts)]
-    
-else:
-    print(f"✅ Found PDF files: {pdf_files}")
-    docs = []
-    
-    for file in pdf_files:
+    split_docs = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50).split_documents(docs)
+    return FAISS.from_documents(split_docs, embeddings)
+
+
+def load_vectorstore(args, embeddings):
+    # 3️⃣ Find PDFs
+    print("Looking for PDF files...")
+    pdf_files = find_pdfs(args.pdfs or DEFAULT_PDF_PATTERNS, first_match_only=not args.pdfs)
+
+    if not pdf_files:
+        print("❌ No PDF files found!")
+        print("Current directory contents:")
+        print([f for f in os.listdir('.') if f.endswith('.pdf')])
+        print("\n📄 Creating sample document for testing...")
+        return sample_vectorstore(embeddings)
+
+    print(f"✅ Found {len(pdf_files)} PDF files")
+
+    # 4️⃣-6️⃣ Parse, split and embed only new or changed PDFs; reuse the persisted index otherwise
+    ingestor = PDFIngestor(
+        args.index_dir,
+        embeddings,
+        embedding_model=EMBED_MODEL,
+        chunk_size=500,
+        chunk_overlap=50,
+        workers=args.workers
+    )
+    return ingestor.ingest(pdf_files, rebuild=args.rebuild)
+
+
+def make_qa_chain(llm, vectorstore):
+    # 7️⃣ Setup RetrievalQA chain
+    print("🔗 Setting up QA chain...")
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})  # retrieve top 3 chunks
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        retriever=retriever,
+        chain_type="stuff",
+        return_source_documents=True  # returns source documents
+    )
+
+
+def ask_questions(qa_chain, queries):
+    # 8️⃣ Ask questions
+    print("\n" + "="*50)
+    print("🤖 Q&A SESSION")
+    print("="*50)
+
+    for query in queries:
+        print(f"\n❓ Question: {query}")
         try:
-            print(f"Loading: {file}")
-            loader = PyPDFLoader(file)
-            file_docs = loader.load()
-            docs.extend(file_docs)
-            print(f"  → Loaded {len(file_docs)} pages")
+            result = qa_chain({"query": query})
+            print(f"💡 Answer: {result['result']}")
+
+            # Show source documents
+            if 'source_documents' in result:
+                print(f"📖 Sources: {len(result['source_documents'])} documents used")
         except Exception as e:
-            print(f"  ❌ Error loading {file}: {e}")
-
-print(f"\n📚 Total documents loaded: {len(docs)}")
-
-if not docs:
-    print("❌ No documents to process!")
-    exit(1)
-
-# 4️⃣ Split documents into chunks
-print("📝 Splitting documents into chunks...")
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=50
-)
-
-split_docs = text_splitter.split_documents(docs)
-print(f"✅ Created {len(split_docs)} text chunks")
-
-# 5️⃣ Initialize local embeddings
-print("🔄 Initializing embeddings...")
-embeddings = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-
-# 6️⃣ Create FAISS vectorstore from PDF chunks
-print("🗂️ Creating vectorstore...")
-try:
-    vectorstore = FAISS.from_documents(split_docs, embeddings)
-    print("✅ Vectorstore created successfully")
-except Exception as e:
-    print(f"❌ Error creating vectorstore: {e}")
-    exit(1)
-
-# Optional: save vectorstore to disk for reuse
-# vectorstore.save_local("faiss_index")
-
-# 7️⃣ Setup RetrievalQA chain
-print("🔗 Setting up QA chain...")
-retriever = vectorstore.as_retriever(search_kwargs={"k": 3})  # retrieve top 3 chunks
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    retriever=retriever,
-    chain_type="stuff",
-    return_source_documents=True  # returns source documents
-)
-
-# 8️⃣ Ask questions
-queries = [
-    "What is LangChain used for?",
-    "What is RAG?",
-    "Sample Workflow for RAG",
-    "Name a vector store supported by LangChain"
-]
+            print(f"❌ Error: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question answering over a folder of PDFs")
+    parser.add_argument("pdfs", nargs="*", help="PDF files, glob patterns or directories (default: ./*.pdf)")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help="Where parsed chunks, embeddings and the index are kept")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore cached embeddings and re-ingest every PDF")
+    parser.add_argument("--batch", help="Answer every question in this file (one per line, or JSONL with id/question)")
+    parser.add_argument("--output", help="Write --batch answers as JSONL here instead of stdout")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel LLM requests for --batch")
+    args = parser.parse_args()
+
+    # When --batch streams JSONL to stdout, progress messages go to stderr
+    progress_out = sys.stderr if args.batch and not args.output else sys.stdout
+    with contextlib.redirect_stdout(progress_out):
+        # 5️⃣ Initialize local embeddings
+        print("🔄 Initializing embeddings...")
+        embeddings = SentenceTransformerEmbeddings(model_name=EMBED_MODEL)
+
+        vectorstore = load_vectorstore(args, embeddings)
+    if vectorstore is None:
+        print("❌ No documents to process!", file=sys.stderr)
+        exit(1)
+
+    if args.batch:
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            stats = run_batch(read_questions(args.batch), vectorstore, embeddings, make_llm(), out,
+                              k=3, concurrency=args.concurrency)
+        finally:
+            if args.output:
+                out.close()
+        print(f"✅ Answered {stats['questions']} questions ({stats['errors']} errors) "
+              f"in {stats['elapsed_ms'] / 1000:.1f}s", file=sys.stderr)
+        return
+
+    qa_chain = make_qa_chain(make_llm(), vectorstore)
+    ask_questions(qa_chain, QUERIES)
+
+    print("\n✅ Done! To use your own PDFs, place them in this directory.")
+
 
-print("\n" + "="*50)
-print("🤖 Q&A SESSION")
-print("="*50)
-
-for query in queries:
-    print(f"\n❓ Question: {query}")
-    try:
-        result = qa_chain({"query": query})
-        print(f"💡 Answer: {result['result']}")
-        
-        # Show source documents
-        if 'source_documents' in result:
-            print(f"📖 Sources: {len(result['source_documents'])} documents used")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-print("\n✅ Done! To use your own PDFs, place them in this directory.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from 'react';
-import { sendMessage, fetchEmails, buildVectorstore } from '../services/chatService';
+import { sendMessage, startFetchJob, startBuildJob, waitForJob } from '../services/chatService';
 
 export default function Chat() {
   const [inputText, setInputText] = useState('');
@@ -19,13 +19,22 @@ export default function Chat() {
       try {
         const initialized = sessionStorage.getItem('chatInitialized');
         if (!initialized) {
+          // Fetch fills 0-50% of the bar and build 50-90%, following each job's own progress
           setInitStage('Fetching emails...');
-          setInitProgress(20);
-          await fetchEmails();
+          setInitProgress(5);
+          const fetchJob = await startFetchJob();
+          await waitForJob(fetchJob.data.id, job => {
+            setInitProgress(5 + Math.round(job.progress * 45));
+            if (job.state === 'running' && job.message !== 'running') setInitStage(job.message);
+          });
           
           setInitStage('Building knowledge base...');
-          setInitProgress(60);
-          await buildVectorstore();
+          setInitProgress(50);
+          const buildJob = await startBuildJob();
+          await waitForJob(buildJob.data.id, job => {
+            setInitProgress(50 + Math.round(job.progress * 40));
+            if (job.state === 'running' && job.message !== 'running') setInitStage(job.message);
+          });
           
           setInitStage('Finalizing setup...');
           setInitProgress(90);
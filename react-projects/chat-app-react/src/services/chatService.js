@@ -1,15 +1,58 @@
 import axios from 'axios';
 
 const API_URL = 'http://127.0.0.1:8000';
+const JOB_POLL_MS = 1000;
+// Mailbox to use on a multi-tenant server; without it the server uses its default mailbox
+const TENANT_ID = import.meta.env.VITE_TENANT_ID;
+// The tenant's API token (tenants.py add/token), or EMAIL_RAG_API_TOKEN for the default mailbox
+const API_TOKEN = import.meta.env.VITE_API_TOKEN;
+
+const api = axios.create({
+  baseURL: API_URL,
+  headers: {
+    ...(TENANT_ID ? { 'X-Tenant-ID': TENANT_ID } : {}),
+    ...(API_TOKEN ? { Authorization: `Bearer ${API_TOKEN}` } : {}),
+  },
+});
 
 export const sendMessage = (question) => {
-  return axios.post(`${API_URL}/chat`, { question });
+  return api.post(`/chat`, { question });
 };
 
 export const fetchEmails = () => {
-  return axios.get(`${API_URL}/fetch`);
+  return api.get(`/fetch`);
 };
 
 export const buildVectorstore = () => {
-  return axios.get(`${API_URL}/build`);
+  return api.get(`/build`);
+};
+
+// Background jobs: the server coalesces concurrent requests onto one running job
+export const startFetchJob = () => {
+  return api.post(`/jobs/fetch`);
+};
+
+export const startBuildJob = () => {
+  return api.post(`/jobs/build`);
+};
+
+export const getJob = (jobId) => {
+  return api.get(`/jobs/${jobId}`);
+};
+
+export const cancelJob = (jobId) => {
+  return api.delete(`/jobs/${jobId}`);
+};
+
+// Polls until the job finishes; resolves with the final job or rejects if it failed or was cancelled
+export const waitForJob = async (jobId, onProgress) => {
+  for (;;) {
+    const { data: job } = await getJob(jobId);
+    onProgress?.(job);
+    if (job.state === 'succeeded') return job;
+    if (job.state === 'failed' || job.state === 'cancelled') {
+      throw new Error(job.error || `Job ${job.state}`);
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+  }
 };